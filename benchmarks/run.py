@@ -0,0 +1,275 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import pandas as pd
+
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List
+from unittest.mock import patch
+
+from benchmarks.synthetic import department_codes, generate_national_frame, generate_regional_frame, write_csv
+from ml import SarimaxModel
+from util import ModelLibrary, SeriesStore
+from util.data_retrieval import NATION_SCHEMA, REGION_SCHEMA, RegionIndex, _read_csv, get_nation_data, \
+    get_region_data
+
+
+SIZES = {
+    "realistic" : 101,
+    "10x" : 1010
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter, the import cost being only paid once per process
+STARTUP_SCRIPT = """
+import json, sys, time, tracemalloc
+if sys.argv[1] == "traced" :
+    tracemalloc.start()
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+import_peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client :
+    client.get("/").raise_for_status()
+    responded = time.perf_counter()
+print(json.dumps({"import" : imported - start,
+                  "first_response" : responded - start,
+                  "import_peak" : import_peak,
+                  "peak" : tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0}))
+"""
+
+
+def measure(func : Callable[[], Any], repeat : int = 1) -> Dict[str, float] :
+    """
+    Measures a stage, timing and memory being measured in separate runs so that tracing
+    does not inflate the timings.
+
+    :param func: the stage
+    :param repeat: the number of timed runs, the best one is kept
+    :return: the best time in seconds and the peak traced memory in bytes
+    """
+
+    timings = []
+    for _ in range(repeat) :
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try :
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally :
+        tracemalloc.stop()
+
+    return {"seconds" : min(timings), "peak_bytes" : peak}
+
+
+def run_startup(traced : bool = False) -> Dict[str, Any] :
+    """
+    Starts the API in a fresh interpreter, without preloading any model, and answers a first request.
+
+    :param traced: whether to trace the memory, which inflates the timings
+    :return: the import and first response times in seconds, and the peak traced memory in bytes
+    """
+
+    env = dict(os.environ, PYTHONPATH = ROOT, WARMUP_REGIONS = "")
+    env.setdefault("LIBRARY_SIZE", "5")
+    output = subprocess.run([sys.executable, "-W", "ignore", "-c", STARTUP_SCRIPT, "traced" if traced else "timed"],
+                            env = env, capture_output = True, text = True, check = True).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_startup(repeat : int = 3) -> Dict[str, Dict[str, float]] :
+    """
+    Measures the startup of an API worker, timing and memory being measured in separate processes.
+
+    :param repeat: the number of timed startups, the best one is kept
+    :return: the import and first response stages
+    """
+
+    timings = [run_startup() for _ in range(repeat)]
+    traced = run_startup(traced = True)
+
+    return {
+        "startup_import" : {"seconds" : min(timing["import"] for timing in timings),
+                            "peak_bytes" : traced["import_peak"]},
+        "startup_first_response" : {"seconds" : min(timing["first_response"] for timing in timings),
+                                    "peak_bytes" : traced["peak"]}
+    }
+
+
+@contextmanager
+def working_directory(path : str) :
+    # Models are saved relative to the working directory
+    previous = os.getcwd()
+    os.chdir(path)
+    try :
+        yield
+    finally :
+        os.chdir(previous)
+
+
+def run(size : str = "realistic", days : int = 900, quick : bool = False) -> Dict[str, Any] :
+    """
+    Runs every stage on synthetic data.
+
+    :param size: the dataset size, realistic (101 departments) or 10x (1010 departments)
+    :param days: the number of days in the datasets
+    :param quick: whether to fit with a weekly instead of a yearly seasonal order
+    :return: the machine-readable results
+    """
+
+    stages : Dict[str, Dict[str, float]] = {}
+    departments = SIZES[size]
+    seasonal_order = (1, 1, 1, 7) if quick else (1, 1, 1, 365)
+
+    with tempfile.TemporaryDirectory() as tmp_dir, working_directory(tmp_dir) :
+        os.mkdir("updates")
+
+        # Startup, before any model is fitted in the working directory
+        stages.update(measure_startup())
+
+        write_csv(generate_regional_frame(departments, days), "regional.csv")
+        write_csv(generate_national_frame(days), "national.csv")
+
+        # Ingestion
+        stages["parse_inferred"] = measure(lambda : pd.read_csv("regional.csv", sep = ";", low_memory = False))
+        stages["parse_schema"] = measure(lambda : _read_csv("regional.csv", REGION_SCHEMA))
+        regional = _read_csv("regional.csv", REGION_SCHEMA)
+        national = _read_csv("national.csv", NATION_SCHEMA)
+
+        # Reshaping
+        regions = department_codes(departments)
+        stages["region_index_build"] = measure(lambda : RegionIndex.from_regional(regional))
+        index = RegionIndex.from_regional(regional)
+        stages["region_lookup_all"] = measure(lambda : get_region_data(index, regions), repeat = 5)
+        stages["region_data_from_frame"] = measure(lambda : get_region_data(regional, [regions[0]]))
+        stages["nation_data"] = measure(lambda : get_nation_data(national), repeat = 5)
+
+        # Local series store, each initial ingestion goes to an empty store
+        stores = itertools.count()
+        stages["store_ingest"] = measure(lambda : SeriesStore(f"store_{next(stores)}.db").append(index.regions))
+        store = SeriesStore("store.db")
+        store.append(index.regions)
+        last_day = store.last_date(regions[0])
+        stages["store_read_range"] = measure(lambda : store.read(regions[0], last_day - timedelta(days = 29), last_day),
+                                             repeat = 5)
+
+        # Fitting
+        series = index[regions[0]]["P"]
+        model = SarimaxModel(regions[0], seasonal_order = seasonal_order)
+
+        def fit() :
+            with warnings.catch_warnings() :
+                warnings.simplefilter("ignore")
+                model.fit(series)
+
+        stages["fit"] = measure(fit)
+
+        # Prediction
+        start = date.today()
+        end = start + timedelta(days = 30)
+        stages["predict_slice"] = measure(lambda : [model.predict(start, end) for _ in range(1000)])
+        stages["predict_model"] = measure(lambda : model._predict(pd.Timestamp(start), pd.Timestamp(end)), repeat = 5)
+
+        # Persistence
+        with patch.dict(os.environ, {"MODEL_DIR" : "models"}) :
+            stages["save_joblib"] = measure(model.save)
+            stages["load_joblib"] = measure(lambda : SarimaxModel(regions[0]).load(f"{model.file_root}.joblib"))
+            stages["save_compact"] = measure(model.save_compact)
+            stages["load_compact"] = measure(lambda : SarimaxModel(regions[0]).load_compact(), repeat = 5)
+
+        # Library
+        models = [SarimaxModel(region) for region in regions]
+
+        def library_operations() :
+            library = ModelLibrary(len(models) // 2)
+            for lib_model in models :
+                library.add_model(lib_model)
+            for lib_model in models :
+                library.get_model(lib_model.file_root)
+
+        stages["library_operations"] = measure(library_operations, repeat = 5)
+
+    return {
+        "meta" : {
+            "size" : size,
+            "departments" : departments,
+            "days" : days,
+            "quick" : quick,
+            "python" : platform.python_version(),
+            "pandas" : pd.__version__
+        },
+        "stages" : stages
+    }
+
+
+def compare(results : Dict[str, Any], baseline : Dict[str, Any], tolerance : float) -> List[str] :
+    """
+    Compares results against a baseline.
+
+    :param results: the current results
+    :param baseline: the baseline results
+    :param tolerance: the accepted relative increase, 0.25 for 25%
+    :return: the regressions, empty if none
+    """
+
+    regressions = []
+    for stage, current in results["stages"].items() :
+        if stage not in baseline["stages"] :
+            continue
+
+        for metric in ("seconds", "peak_bytes") :
+            reference = baseline["stages"][stage][metric]
+            if reference > 0 and current[metric] > reference * (1 + tolerance) :
+                regressions.append(f"{stage} {metric}: {current[metric]:.6g} > {reference:.6g} "
+                                   f"(+{current[metric] / reference - 1:.0%})")
+
+    return regressions
+
+
+def main() -> None :
+    parser = argparse.ArgumentParser(description = "Benchmark the ingestion, fitting and prediction hot paths")
+    parser.add_argument("--size", choices = list(SIZES), default = "realistic", help = "dataset size")
+    parser.add_argument("--days", type = int, default = 900, help = "number of days in the datasets")
+    parser.add_argument("--quick", action = "store_true", help = "fit with a weekly instead of a yearly season")
+    parser.add_argument("--output", help = "file to write the results to, standard output by default")
+    parser.add_argument("--baseline", help = "baseline results to compare against")
+    parser.add_argument("--tolerance", type = float, default = 0.25, help = "accepted relative increase")
+    args = parser.parse_args()
+
+    results = run(args.size, args.days, args.quick)
+
+    if args.output is None :
+        print(json.dumps(results, indent = 2))
+    else :
+        with open(args.output, "w") as f :
+            json.dump(results, f, indent = 2)
+
+    if args.baseline is not None :
+        with open(args.baseline, "r") as f :
+            regressions = compare(results, json.load(f), args.tolerance)
+
+        for regression in regressions :
+            print(f"REGRESSION {regression}", file = sys.stderr)
+
+        if len(regressions) > 0 :
+            sys.exit(1)
+
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from datetime import date
+
+
+AGE_CLASSES = [0, 9, 19, 29, 39, 49, 59, 69, 79, 89, 90]
+START_DATE = date(2020, 5, 13)
+
+
+def department_codes(count : int) -> list :
+    """
+    Returns department codes in the upstream format, two digits zero-padded.
+
+    :param count: the number of departments
+    :return: the codes
+    """
+    return [f"{i:02d}" for i in range(1, count + 1)]
+
+
+def generate_regional_frame(departments : int = 101, days : int = 900, seed : int = 0) -> pd.DataFrame :
+    """
+    Generates a departmental dataset in the upstream dep;jour;P;T;cl_age90;pop layout.
+    Every department has one row per day and age class, class 0 being the sum of the others.
+
+    :param departments: the number of departments
+    :param days: the number of days from 2020-05-13
+    :param seed: the random seed
+    :return: the dataset
+    """
+
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(START_DATE, periods = days, freq = "D").strftime("%Y-%m-%d")
+    classes = np.array(AGE_CLASSES[1 :])
+    t = np.arange(days)
+
+    frames = []
+    for dep in department_codes(departments) :
+        level = rng.uniform(10, 500)
+        seasonal = 1 + 0.5 * np.sin(2 * np.pi * t / 365.25) + 0.2 * np.sin(2 * np.pi * t / 7)
+        # One row per day and age class, excluding class 0
+        tests = rng.poisson(level * 10 * seasonal[:, None], size = (days, len(classes)))
+        positives = rng.binomial(tests, 0.05)
+        pop = rng.uniform(20000, 150000, size = len(classes))
+
+        frames.append(pd.DataFrame({
+            "dep" : dep,
+            "jour" : np.repeat(dates, len(classes) + 1),
+            "P" : np.column_stack([positives.sum(axis = 1), positives]).ravel(),
+            "T" : np.column_stack([tests.sum(axis = 1), tests]).ravel(),
+            "cl_age90" : np.tile(np.array(AGE_CLASSES), days),
+            "pop" : np.tile(np.concatenate([[pop.sum()], pop]), days).round(1)
+        }))
+
+    return pd.concat(frames, ignore_index = True)
+
+
+def generate_national_frame(days : int = 900, seed : int = 0) -> pd.DataFrame :
+    """
+    Generates a national dataset in the upstream fra;jour;P_f;P_h;P;T_f;T_h;T;cl_age90;pop layout.
+
+    :param days: the number of days from 2020-05-13
+    :param seed: the random seed
+    :return: the dataset
+    """
+
+    data = generate_regional_frame(departments = 1, days = days, seed = seed)
+    positives_f = (data["P"] * 0.5).round().astype("int64")
+    tests_f = (data["T"] * 0.5).round().astype("int64")
+
+    return pd.DataFrame({
+        "fra" : "FR",
+        "jour" : data["jour"],
+        "P_f" : positives_f,
+        "P_h" : data["P"] - positives_f,
+        "P" : data["P"],
+        "T_f" : tests_f,
+        "T_h" : data["T"] - tests_f,
+        "T" : data["T"],
+        "cl_age90" : data["cl_age90"],
+        "pop" : data["pop"] * 600
+    })
+
+
+def write_csv(data : pd.DataFrame, path : str) -> None :
+    data.to_csv(path, sep = ";", index = False)
@@ -1,19 +1,240 @@
+import asyncio
 import os
+import time
+import pandas as pd
 from datetime import datetime, timedelta, date
-from typing import List
+from dataclasses import asdict
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, status, HTTPException
+from fastapi import FastAPI, Request, status, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
-from ml import SarimaxModel
+from ml import AgeClassModel, create_model, engine_for, fit_age_classes, fit_regions, search_order
+from ml.models import Model
 from util import ModelLibrary, InvalidParameter, check_all
-from util.data_retrieval import fetch_data, get_nation_data, get_region_data
+from util.exceptions import InvalidDateError
+from util.jobs import JobQueue
+from util.request_checks import AVAILABLE_REGIONS, check_region
+from util.responses import STREAMING_MEDIA_TYPES, FastJSONResponse, resolve_format, stream_rows, to_columns, \
+    to_rows
+from util.metrics import REGISTRY, server_timing_header, start_request_timings, timed
+from util.warmup import WarmUp
+from util.data_retrieval import DATA_CACHE, NATION_SCHEMA, REGION_SCHEMA, RegionIndex, fetch_age_classes, fetch_index, \
+    fetch_series
 
 load_dotenv()
 
 app = FastAPI()
 
-MODEL_LIBRARY = ModelLibrary(int(os.getenv("LIBRARY_SIZE")))
+MODEL_LIBRARY = ModelLibrary(int(os.getenv("LIBRARY_SIZE")),
+                             int(os.getenv("LIBRARY_MAX_BYTES")) if os.getenv("LIBRARY_MAX_BYTES") else None,
+                             float(os.getenv("MODEL_RELOAD_INTERVAL", 1)))
+JOB_QUEUE = JobQueue(int(os.getenv("MAX_CONCURRENT_FITS", 1)))
+WARMUP = WarmUp()
+
+REQUEST_SECONDS = REGISTRY.histogram("covid_request_duration_seconds", "Time spent handling requests", ["path"])
+REGISTRY.gauge("covid_model_library_models", "Models held in the library", lambda : MODEL_LIBRARY.stats()["models"])
+REGISTRY.gauge("covid_model_library_bytes",
+               "Footprint of the models held in the library, measured when LIBRARY_MAX_BYTES is set",
+               lambda : MODEL_LIBRARY.stats()["bytes"])
+REGISTRY.counter("covid_model_library_hits_total", "Library lookups finding the model",
+                 callback = lambda : MODEL_LIBRARY.stats()["hits"])
+REGISTRY.counter("covid_model_library_misses_total", "Library lookups missing the model",
+                 callback = lambda : MODEL_LIBRARY.stats()["misses"])
+REGISTRY.counter("covid_model_library_evictions_total", "Models evicted from the library",
+                 callback = lambda : MODEL_LIBRARY.stats()["evictions"])
+REGISTRY.gauge("covid_model_library_hit_rate", "Share of library lookups finding the model",
+               lambda : MODEL_LIBRARY.stats()["hit_rate"])
+REGISTRY.counter("covid_data_cache_hits_total", "Upstream fetches served from the cache",
+                 callback = lambda : DATA_CACHE.stats()["hits"])
+REGISTRY.counter("covid_data_cache_revalidations_total", "Upstream fetches revalidated without a download",
+                 callback = lambda : DATA_CACHE.stats()["revalidated"])
+REGISTRY.counter("covid_data_cache_misses_total", "Upstream fetches downloading the data",
+                 callback = lambda : DATA_CACHE.stats()["misses"])
+REGISTRY.gauge("covid_data_cache_hit_rate", "Share of upstream fetches served without a download",
+               lambda : DATA_CACHE.stats()["hit_rate"])
+
+
+def load_model(region : str) -> Model :
+    """
+    Returns the model of the given region from the library, loading it if needed.
+    Concurrent loads of the same model are coalesced into one, and refreshed artifacts are
+    swapped in by the library.
+
+    :param region: the region
+    :return: the model
+    """
+
+    def loader() -> Model :
+        # Every (re)load builds a new instance, requests holding the previous one are not affected
+        model = create_model(region)
+        model.load()
+        return model
+
+    return MODEL_LIBRARY.get_or_load(create_model(region).file_root, loader)
+
+
+def load_age_model(region : str) -> AgeClassModel :
+    """
+    Returns the age class model of the given region from the library, loading it if needed.
+
+    :param region: the region
+    :return: the model
+    """
+
+    def loader() -> AgeClassModel :
+        model = AgeClassModel(region)
+        model.load()
+        return model
+
+    return MODEL_LIBRARY.get_or_load(AgeClassModel(region).file_root, loader)
+
+
+def get_region_index(region : str) -> RegionIndex :
+    """
+    Returns the index of the dataset containing the given region.
+
+    :param region: the region, FRA for the national data
+    :return: the region index for the current dataset version
+    """
+
+    if region == "FRA" :
+        return fetch_index(os.getenv("COV_NAT_DATA_URL"), NATION_SCHEMA, national = True)
+
+    return fetch_index(os.getenv("COV_REG_DATA_URL"), REGION_SCHEMA)
+
+
+def get_age_classes(regions : List[str]) -> Dict[str, pd.DataFrame] :
+    """
+    Returns the cases of every age class of the given regions, each dataset being partitioned once.
+
+    :param regions: the regions, FRA for the national data
+    :return: the daily-frequency cases with one column per age class, empty for unknown regions
+    """
+
+    datasets = {}
+    age_classes = {}
+    for region in regions :
+        national = region == "FRA"
+        if national not in datasets :
+            if national :
+                datasets[national] = fetch_age_classes(os.getenv("COV_NAT_DATA_URL"), NATION_SCHEMA, national = True)
+            else :
+                datasets[national] = fetch_age_classes(os.getenv("COV_REG_DATA_URL"), REGION_SCHEMA)
+
+        age_classes[region] = datasets[national].get(region, pd.DataFrame(index = pd.DatetimeIndex([], freq = "D")))
+
+    return age_classes
+
+
+def get_region_series(region : str, start : date, end : date) -> pd.DataFrame :
+    """
+    Returns the cases of a region between two dates, from the local series store.
+
+    :param region: the region, FRA for the national data
+    :param start: the start date
+    :param end: the end date
+    :return: the daily-frequency cases of the region in the date range
+    """
+
+    if region == "FRA" :
+        return fetch_series(os.getenv("COV_NAT_DATA_URL"), NATION_SCHEMA, region, start, end, national = True)
+
+    return fetch_series(os.getenv("COV_REG_DATA_URL"), REGION_SCHEMA, region, start, end)
+
+
+def refit(regions : List[str],
+          workers : Optional[int] = None,
+          full : bool = False,
+          age_classes : bool = False) -> List[dict] :
+    """
+    Refits the models of the given regions.
+    Each dataset is fetched and partitioned once, then the fits run in worker processes.
+
+    :param regions: the regions to refit
+    :param workers: the number of worker processes, optional
+    :param full: whether to force a full fit instead of an incremental update
+    :param age_classes: whether to fit the age class models instead of the total ones
+    :return: the fit reports
+    """
+
+    if age_classes :
+        reports = fit_regions(get_age_classes(regions), workers, fit = fit_age_classes)
+        return [asdict(report) for report in reports]
+
+    # Update region data
+    input_data = {region : get_region_index(region)[region]["P"] for region in regions}
+
+    # Fit models
+    reports = fit_regions(input_data, workers, incremental = not full)
+
+    return [asdict(report) for report in reports]
+
+
+def search_and_refit(regions : List[str], workers : Optional[int] = None) -> dict :
+    """
+    Searches the specification of the SARIMAX models of the given regions, then fully refits them.
+    The chosen specifications are persisted, so later refits reuse them without searching again.
+
+    :param regions: the regions to search and refit
+    :param workers: the number of worker processes, optional
+    :return: the search and fit reports
+    """
+
+    input_data = {region : get_region_index(region)[region]["P"] for region in regions}
+
+    searches = [search_order(region, data, workers = workers)
+                for region, data in input_data.items() if engine_for(region) == "SARIMAX"]
+    reports = fit_regions(input_data, workers)
+
+    return {"searches" : [asdict(search) for search in searches],
+            "fits" : [asdict(report) for report in reports]}
+
+
+def submit_refit(regions : List[str],
+                 workers : Optional[int] = None,
+                 full : bool = False,
+                 search : bool = False,
+                 age_classes : bool = False) -> dict :
+    if search :
+        job = JOB_QUEUE.submit(f"search {','.join(regions)}", search_and_refit, regions, workers)
+    elif age_classes :
+        job = JOB_QUEUE.submit(f"update age classes {','.join(regions)}", refit, regions, workers, True, True)
+    else :
+        job = JOB_QUEUE.submit(f"update {','.join(regions)}", refit, regions, workers, full)
+
+    return {"status" : "OK",
+            "body" : {
+                "job" : job.id
+            }}
+
+
+@app.middleware("http")
+async def measure_request(request : Request, call_next) :
+    # Server-Timing is added when SERVER_TIMING is set or when the request asks for it
+    timings = start_request_timings()
+    start = time.perf_counter()
+
+    response = await call_next(request)
+
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(time.perf_counter() - start, path = route.path if route is not None else "unmatched")
+
+    if os.getenv("SERVER_TIMING") or request.headers.get("X-Server-Timing") :
+        response.headers["Server-Timing"] = server_timing_header(timings)
+
+    return response
+
+
+@app.on_event("startup")
+async def warm_up() :
+    # Preload the models in the background, WARMUP_REGIONS defaults to all available regions
+    regions = os.getenv("WARMUP_REGIONS")
+    regions = AVAILABLE_REGIONS if regions is None else [region.strip() for region in regions.split(",") if region.strip()]
+
+    WARMUP.start(regions, load_model)
 
 
 @app.get("/")
@@ -25,71 +246,206 @@ async def root() :
 #     return {"message" : f"Hello {name}"}
 
 
-@app.get("/api/v1/covid/update/", status_code = status.HTTP_204_NO_CONTENT)
-async def update() :
-    # Update region data
-    overall_data = fetch_data(os.getenv("COV_NAT_DATA_URL"))
-    nation_data  = get_nation_data(overall_data)["P"]
+@app.get("/api/v1/covid/update/", status_code = status.HTTP_202_ACCEPTED)
+async def update(full : bool = False) :
+    return submit_refit(["FRA"], full = full)
 
-    # Create model
-    model = SarimaxModel("FRA")
-    model.fit(nation_data)
-    model.save()
 
+@app.get("/api/v1/covid/update/all", status_code = status.HTTP_202_ACCEPTED)
+async def update_all(regions : Optional[str] = None,
+                     workers : Optional[int] = None,
+                     full : bool = False,
+                     search : bool = False,
+                     age_classes : bool = False) :
+    # Comma-separated regions, all available regions by default
+    selected = AVAILABLE_REGIONS if regions is None else [region.strip() for region in regions.split(",")]
+
+    invalids = [InvalidParameter("regions", f"Selected region {region} is not available")
+                for region in selected if not check_region(region)]
+
+    if len(invalids) > 0 :
+        message = [[param.field, param.message] for param in invalids]
+        raise HTTPException(status_code = 400,
+                            detail = message)
+
+    return submit_refit(selected, workers, full, search, age_classes)
 
-@app.get("/api/v1/covid/update/{region}", status_code = status.HTTP_204_NO_CONTENT)
-async def update_regional_model(region : str) :
-    # Update region data
-    overall_data = fetch_data(os.getenv("COV_REG_DATA_URL"))
-    region_data  = get_region_data(overall_data, [region])[region]["P"]
 
-    # Create Model
-    model = SarimaxModel(region)
-    model.fit(region_data)
-    model.save()
+@app.get("/api/v1/covid/update/{region}", status_code = status.HTTP_202_ACCEPTED)
+async def update_regional_model(region : str,
+                                full : bool = False,
+                                search : bool = False,
+                                age_classes : bool = False) :
+    return submit_refit([region], full = full, search = search, age_classes = age_classes)
+
+
+@app.get("/api/v1/covid/jobs/{job_id}", status_code = status.HTTP_200_OK)
+async def get_job(job_id : str) :
+
+    if (job := JOB_QUEUE.get_job(job_id)) is None :
+        raise HTTPException(status_code = 404,
+                            detail = f"Job {job_id} does not exist")
+
+    return {"status" : "OK",
+            "body" : asdict(job)}
 
 
 @app.get("/api/v1/covid/predict", status_code = status.HTTP_200_OK)
 async def predict(start_date : date = datetime.today().date() - timedelta(days = 3),
                   end_date : date = datetime.today().date() + timedelta(days = 6),
-                  region : str = "FRA") :
+                  region : str = "FRA",
+                  format : Optional[str] = None,
+                  intervals : bool = False,
+                  level : float = 0.95,
+                  age_class : Optional[str] = None,
+                  request : Request = None) :
+
+    # Streaming formats can also be requested through the Accept header
+    format = resolve_format(format, request.headers.get("accept") if request is not None else None)
+
+    invalids : List[InvalidParameter] = check_all(start_date, end_date, region, prediction = True,
+                                                  response_format = format, level = level, age_class = age_class)
+
+    if intervals and format in STREAMING_MEDIA_TYPES :
+        invalids.append(InvalidParameter("intervals", f"Intervals are not available in the {format} format"))
+
+    if intervals and age_class is not None :
+        invalids.append(InvalidParameter("intervals", "Intervals are not available for age classes"))
 
-    invalids : List[InvalidParameter] = check_all(start_date, end_date, region, prediction = True)
+    if age_class == "all" and format in STREAMING_MEDIA_TYPES :
+        invalids.append(InvalidParameter("age_class", f"All age classes are not available in the {format} format"))
 
     if len(invalids) > 0 :
         message = [[param.field, param.message] for param in invalids]
         raise HTTPException(status_code = 400,
                             detail = message)
 
-    # Load model
-    model = SarimaxModel(region)
+    if age_class is not None :
+        return await predict_age_classes(start_date, end_date, region, age_class, format)
 
-    # Check if model is in library
-    if (lib_model := MODEL_LIBRARY.get_model(model.file_root)) is None :
-        model.load()
-        MODEL_LIBRARY.add_model(model)
-    else :
-        model = lib_model
+    # Load model
+    model = await run_in_threadpool(load_model, region)
 
     # Make prediction
     prediction = model.predict(start_date, end_date)
 
+    if format in STREAMING_MEDIA_TYPES :
+        return StreamingResponse(stream_rows([(prediction, None)], format),
+                                 media_type = STREAMING_MEDIA_TYPES[format])
+
+    bounds = None
+    if intervals :
+        try :
+            bounds = model.predict_interval(start_date, end_date, level)
+        except NotImplementedError as e :
+            raise HTTPException(status_code = 400,
+                                detail = [["intervals", str(e)]])
+
+    with timed("json_build") :
+        if format == "columnar" :
+            body = to_columns(prediction, intervals = bounds)
+        else :
+            body = {"predictions" : to_rows(prediction, intervals = bounds)}
+
+    return FastJSONResponse({"status" : "OK",
+                             "body" : body})
+
+
+async def predict_age_classes(start_date : date, end_date : date, region : str, age_class : str, format : str) :
+    # Every age class of a region is served by a single model
+    model = await run_in_threadpool(load_age_model, region)
+
+    try :
+        predictions = model.predict_classes(start_date, end_date, None if age_class == "all" else [age_class])
+    except InvalidDateError as e :
+        raise HTTPException(status_code = 400,
+                            detail = [["end_date", str(e)]])
+
+    if format in STREAMING_MEDIA_TYPES :
+        return StreamingResponse(stream_rows([(predictions[age_class], None)], format),
+                                 media_type = STREAMING_MEDIA_TYPES[format])
+
+    with timed("json_build") :
+        build = to_columns if format == "columnar" else to_rows
+        if age_class == "all" :
+            body = {"predictions" : {column : build(predictions[column]) for column in predictions.columns}}
+        elif format == "columnar" :
+            body = to_columns(predictions[age_class])
+        else :
+            body = {"predictions" : to_rows(predictions[age_class])}
+
+    return FastJSONResponse({"status" : "OK",
+                             "body" : body})
+
+
+@app.get("/api/v1/covid/predict/batch", status_code = status.HTTP_200_OK)
+async def predict_batch(regions : str = "all",
+                        start_date : date = datetime.today().date() - timedelta(days = 3),
+                        end_date : date = datetime.today().date() + timedelta(days = 6),
+                        format : str = "rows") :
+
+    # Comma-separated regions, all available regions by default
+    selected = AVAILABLE_REGIONS if regions == "all" else list(dict.fromkeys(region.strip()
+                                                                            for region in regions.split(",")))
+
+    invalids : List[InvalidParameter] = check_all(start_date, end_date, selected, prediction = True,
+                                                  response_format = format)
+
+    if format in STREAMING_MEDIA_TYPES :
+        invalids.append(InvalidParameter("format", f"Format {format} is not available for batch predictions"))
+
+    if len(invalids) > 0 :
+        message = [[param.field, param.message] for param in invalids]
+        raise HTTPException(status_code = 400,
+                            detail = message)
+
+    # Load the models concurrently, loads of the same model are coalesced by the library
+    models = await asyncio.gather(*[run_in_threadpool(load_model, region) for region in selected])
+
+    with timed("json_build") :
+        predictions = {}
+        for region, model in zip(selected, models) :
+            prediction = model.predict(start_date, end_date)
+            predictions[region] = to_columns(prediction) if format == "columnar" else to_rows(prediction)
+
+    return FastJSONResponse({"status" : "OK",
+                             "body" : {
+                                 "predictions" : predictions
+                             }})
+
+
+@app.get("/api/v1/covid/library", status_code = 200)
+async def get_library() :
+
+    resp = {"library" : MODEL_LIBRARY.list_model_names(),
+            "stats" : MODEL_LIBRARY.stats()}
+
+    return resp
+
+
+@app.get("/api/v1/covid/ready", status_code = status.HTTP_200_OK)
+async def get_readiness() :
+
+    if not WARMUP.is_ready :
+        raise HTTPException(status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail = "Models are warming up")
+
     return {"status" : "OK",
             "body" : {
-                "predictions" : [
-                    {
-                        "date" : index.to_pydatetime().strftime("%Y-%m-%d"),
-                        "cases" : int(value)
-                    }
-                    for index, value in prediction.items()
-                ]
+                "loaded" : WARMUP.loaded,
+                "failed" : WARMUP.failed
             }}
 
 
-@app.get("/api/v1/covid/library", status_code = 200)
-async def get_library() :
+@app.get("/metrics", response_class = PlainTextResponse)
+async def get_metrics() :
+    return PlainTextResponse(REGISTRY.render(), media_type = "text/plain; version=0.0.4")
 
-    resp = {"library" : MODEL_LIBRARY.list_model_names()}
+
+@app.get("/api/v1/covid/cache", status_code = 200)
+async def get_cache_stats() :
+
+    resp = {"cache" : DATA_CACHE.stats()}
 
     return resp
 
@@ -97,9 +453,15 @@ async def get_library() :
 @app.get("/api/v1/covid/data", status_code = status.HTTP_200_OK)
 async def get_all_data(start_date : date = "2020-06-01",
                        end_date : date = datetime.today().date(),
-                       region : str = "FRA") :
+                       region : str = "FRA",
+                       format : Optional[str] = None,
+                       request : Request = None) :
 
-    invalids : List[InvalidParameter] = check_all(start_date, end_date, region, prediction = False)
+    # Streaming formats can also be requested through the Accept header
+    format = resolve_format(format, request.headers.get("accept") if request is not None else None)
+
+    invalids : List[InvalidParameter] = check_all(start_date, end_date, region, prediction = False,
+                                                  response_format = format)
 
     if len(invalids) > 0 :
         message = [[param.field, param.message] for param in invalids]
@@ -111,48 +473,36 @@ async def get_all_data(start_date : date = "2020-06-01",
     end_date = datetime(end_date.year, end_date.month, end_date.day)
     start_date = datetime(start_date.year, start_date.month, start_date.day)
 
-    if region == "FRA" :
-        data = get_nation_data(fetch_data(os.getenv("COV_NAT_DATA_URL")))
-    else :
-        data = get_region_data(fetch_data(os.getenv("COV_REG_DATA_URL")), [region])[region]
-
-    data = data["P"]
+    model = await run_in_threadpool(load_model, region)
 
-    model = SarimaxModel(region)
+    true_end = min(end_date, model.last_true_date)
 
-    # Check if model is in library
-    if (lib_model := MODEL_LIBRARY.get_model(model.file_root)) is None :
-        model.load()
-        MODEL_LIBRARY.add_model(model)
-    else :
-        model = lib_model
+    # Only the requested range is read from the store, fetching can hit the network so keep it off the event loop
+    existing_data = (await run_in_threadpool(get_region_series, region, start_date, true_end))["P"]
 
-    true_end = min(end_date, model.last_true_date)
+    def predict_remaining() :
+        if end_date <= true_end :
+            return existing_data.iloc[:0]
 
-    existing_data = data.loc[(data.index <= true_end) & (data.index >= start_date)]
-    data_points = [
-        {
-            "date" : index.to_pydatetime().strftime("%Y-%m-%d"),
-            "cases" : int(value),
-            "predicted" : False
-        }
-        for index, value in existing_data.items()
-    ]
-
-    if end_date > true_end :
         first_prediction = true_end + timedelta(days = 1)
-        predictions = model.predict(start = first_prediction.date(), end = end_date.date())
+        return model.predict(start = first_prediction.date(), end = end_date.date())
 
-        data_points += [
-            {
-                "date" : index.to_pydatetime().strftime("%Y-%m-%d"),
-                "cases" : int(value),
-                "predicted" : True
-            }
-            for index, value in predictions.items()
-        ]
+    if format in STREAMING_MEDIA_TYPES :
+        # True rows are streamed before the predictions are computed
+        def parts() :
+            yield existing_data, False
+            yield predict_remaining(), True
 
-    return {"status" : "OK",
-            "body" : {
-                "data" : data_points
-            }}
+        return StreamingResponse(stream_rows(parts(), format),
+                                 media_type = STREAMING_MEDIA_TYPES[format])
+
+    predictions = predict_remaining()
+
+    with timed("json_build") :
+        if format == "columnar" :
+            body = to_columns(existing_data, predictions)
+        else :
+            body = {"data" : to_rows(existing_data, predicted = False) + to_rows(predictions, predicted = True)}
+
+    return FastJSONResponse({"status" : "OK",
+                             "body" : body})
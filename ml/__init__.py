@@ -1 +1,7 @@
+from .age_classes import AgeClassModel, fit_age_classes
+from .ets import ExpSmoothingModel
+from .fourier import FourierArimaModel
 from .sarimax import SarimaxModel
+from .registry import MODEL_ENGINES, create_model, engine_for, register_engine
+from .training import FitReport, fit_region, fit_regions, update_region
+from .order_search import SearchReport, search_order
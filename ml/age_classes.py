@@ -0,0 +1,162 @@
+import os
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from datetime import date, datetime
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional
+
+from util.exceptions import InvalidDateError, UnfittedModelError
+from util.metrics import timed
+from .models import Model
+from .registry import create_model
+from .training import FitReport
+
+
+load_dotenv()
+
+
+class AgeClassModel(Model) :
+    """
+    The forecasts of every age class of a region, held as a single model.
+
+    Each age class is fitted with a lightweight engine, AGE_CLASS_ENGINE (ETS by default), on the
+    shared preprocessed frame. Only the precomputed forecasts and their standard deviations are kept,
+    the fitted results are discarded once forecast, so the model weighs a few arrays. Predictions
+    outside the precomputed forecasts are not available until the next fit.
+    """
+
+    engine : str
+
+    def __init__(self, region : str, engine : Optional[str] = None) :
+        super(AgeClassModel, self).__init__("AGE", region)
+        self.engine = os.getenv("AGE_CLASS_ENGINE", "ETS") if engine is None else engine
+
+    @property
+    def age_classes(self) -> List[str] :
+        """
+        The age classes of the model, as cl_age90 values.
+        """
+        return [] if self.model is None else list(self.model["forecasts"].columns)
+
+    def fit(self, input_data : pd.DataFrame) -> None :
+        # Shared preprocessing, each column is the daily series of an age class
+        input_data = input_data.astype("float64").asfreq("D")
+
+        forecasts = {}
+        stds = {}
+        with warnings.catch_warnings() :
+            warnings.simplefilter("ignore")
+            for age_class in input_data.columns :
+                model = create_model(f"{self.region_name}_{age_class}", self.engine)
+                model.fit(input_data[age_class])
+                forecasts[age_class] = model.forecast
+                stds[age_class] = model.forecast_std
+
+        # Only the forecasts are kept, the fitted results are released with the class models
+        self.model = {
+            "forecasts" : pd.DataFrame(forecasts),
+            "std" : None if any(std is None for std in stds.values()) else pd.DataFrame(stds)
+        }
+
+        # Set flag
+        self.is_fitted = True
+
+        # Update last true date
+        self.last_true_date = input_data.dropna(how = "all").index[-1].to_pydatetime()
+        self.last_full_fit = datetime.now()
+
+        self.precompute_forecast()
+
+    def predict_classes(self,
+                        start : date,
+                        end : Optional[date] = None,
+                        age_classes : Optional[List[str]] = None) -> pd.DataFrame :
+        """
+        Predict the values of several age classes between set dates
+
+        :param start: the start date
+        :param end: the end date, optional, default to 5 days after start
+        :param age_classes: the age classes, optional, defaults to all of them
+        :return: the predicted values for the date range, one column per age class
+        :raises UnfittedModelError: if the model was not fitted before the prediction
+        :raises InvalidDateError: if the end date is before the start date or outside the forecasts
+        """
+
+        if not self.is_fitted :
+            raise UnfittedModelError("Model has not been fitted")
+
+        prediction = self.predict(start, end)
+
+        with timed("predict") :
+            columns = self.age_classes if age_classes is None else age_classes
+            return self.model["forecasts"].loc[prediction.index[0]:prediction.index[-1], columns]
+
+    def precompute_forecast(self) -> None :
+        # The class forecasts were precomputed by the class models, the total is served from them
+        total = self._total_class()
+        self.forecast = self.model["forecasts"][total]
+        self.forecast_std = None if self.model["std"] is None else self.model["std"][total]
+
+    def _total_class(self) -> str :
+        return "0" if "0" in self.age_classes else self.age_classes[0]
+
+    def _predict(self, start : datetime, end : datetime) -> pd.Series :
+        index = self.model["forecasts"].index
+        raise InvalidDateError(f"Age class forecasts only cover {index[0].date()} to {index[-1].date()}")
+
+    def _predict_std(self, start : datetime, end : datetime) -> pd.Series :
+        if self.model["std"] is None :
+            raise NotImplementedError(f"{self.engine} models do not support prediction intervals")
+
+        return self._predict(start, end)
+
+    def _compact_arrays(self) -> Dict[str, np.ndarray] :
+        arrays = {
+            "class_forecasts" : self.model["forecasts"].to_numpy(dtype = "float64"),
+            "class_dates" : self.model["forecasts"].index.to_numpy(dtype = "datetime64[ns]")
+        }
+        if self.model["std"] is not None :
+            arrays["class_std"] = self.model["std"].to_numpy(dtype = "float64")
+
+        return arrays
+
+    def _compact_meta(self) -> Dict[str, Any] :
+        return {"engine" : self.engine,
+                "age_classes" : self.age_classes}
+
+    def _from_compact(self, arrays : Dict[str, np.ndarray], meta : Dict[str, Any]) -> None :
+        self.engine = meta["engine"]
+
+        index = pd.DatetimeIndex(arrays["class_dates"], freq = "D")
+        self.model = {
+            "forecasts" : pd.DataFrame(arrays["class_forecasts"], index = index, columns = meta["age_classes"]),
+            "std" : None
+        }
+        if "class_std" in arrays :
+            self.model["std"] = pd.DataFrame(arrays["class_std"], index = index, columns = meta["age_classes"])
+
+
+def fit_age_classes(region : str, input_data : pd.DataFrame) -> FitReport :
+    """
+    Fits and saves the age class model of a single region.
+    Errors are reported instead of raised so that one region cannot abort a bulk update.
+
+    :param region: the region of the model
+    :param input_data: the cases of every age class, one column per class
+    :return: the fit report
+    """
+
+    start = time.perf_counter()
+
+    try :
+        model = AgeClassModel(region)
+        model.fit(input_data)
+        model.save()
+    except Exception as e :
+        return FitReport(region, time.perf_counter() - start, f"{type(e).__name__}: {e}", mode = "age_classes")
+
+    return FitReport(region, time.perf_counter() - start, mode = "age_classes")
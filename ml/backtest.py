@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from dataclasses import dataclass, asdict
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from util.processes import process_pool
+from .registry import create_model
+
+
+@dataclass
+class BacktestReport :
+    """
+    Dataclass to represent the accuracy of a region's forecasts at a given horizon
+    """
+
+    region : str
+    engine : str
+    horizon : int
+    folds : int
+    mae : Optional[float]
+    mape : Optional[float]
+
+
+def rolling_cutoffs(input_data : pd.Series, folds : int, horizon : int, step : int) -> List[pd.Timestamp] :
+    """
+    Returns the forecast origins, every step days, the last one leaving horizon days of data to evaluate it on.
+
+    :param input_data: the daily series
+    :param folds: the number of origins
+    :param horizon: the number of days forecast from each origin
+    :param step: the number of days between origins
+    :return: the origins, oldest first
+    """
+
+    last = input_data.last_valid_index()
+    return [last - timedelta(days = horizon + step * fold) for fold in reversed(range(folds))]
+
+
+def backtest_block(region : str,
+                   input_data : pd.Series,
+                   cutoffs : List[pd.Timestamp],
+                   horizon : int,
+                   engine : Optional[str] = None) -> Tuple[np.ndarray, np.ndarray] :
+    """
+    Evaluates consecutive origins with a single fit, at the first one. The model is then moved to each
+    following origin by filtering the new observations with the fitted parameters, engines that cannot
+    be extended are fitted again instead.
+
+    :param region: the region
+    :param input_data: the daily series
+    :param cutoffs: the origins, oldest first
+    :param horizon: the number of days forecast from each origin
+    :param engine: the engine, optional, defaults to the engine of the region
+    :return: the absolute errors and the true values, one row per origin and one column per horizon
+    """
+
+    model = create_model(region, engine)
+    # Forecasts are only needed over the horizon, not over the serving window
+    model.precompute = False
+
+    errors = np.full((len(cutoffs), horizon), np.nan)
+    actuals = np.full((len(cutoffs), horizon), np.nan)
+
+    with warnings.catch_warnings() :
+        warnings.simplefilter("ignore")
+
+        for fold, cutoff in enumerate(cutoffs) :
+            history = input_data.loc[:cutoff]
+            if fold == 0 :
+                model.fit(history)
+            else :
+                try :
+                    model.extend(history)
+                except NotImplementedError :
+                    model.fit(history)
+
+            start = cutoff + timedelta(days = 1)
+            end = cutoff + timedelta(days = horizon)
+            truth = input_data.reindex(pd.date_range(start, end, freq = "D"))
+            prediction = model.predict(start.date(), end.date()).reindex(truth.index)
+
+            errors[fold] = np.abs(prediction.to_numpy(dtype = "float64") - truth.to_numpy(dtype = "float64"))
+            actuals[fold] = truth.to_numpy(dtype = "float64")
+
+    return errors, actuals
+
+
+def backtest(input_data : Dict[str, pd.Series],
+             engine : Optional[str] = None,
+             folds : int = 8,
+             horizon : int = 14,
+             step : int = 7,
+             refit_every : Optional[int] = None,
+             workers : Optional[int] = None,
+             isolated : bool = True) -> List[BacktestReport] :
+    """
+    Runs a rolling-origin backtest of several regions.
+
+    The origins of each region are split in blocks of refit_every origins, each block being fitted once
+    and filtered forward from one origin to the next. Blocks are independent, so they run in parallel
+    across a process pool.
+
+    :param input_data: the daily series of each region
+    :param engine: the engine, optional, defaults to the engine of each region
+    :param folds: the number of origins per region
+    :param horizon: the number of days forecast from each origin
+    :param step: the number of days between origins
+    :param refit_every: the number of origins between full fits, optional, a single fit per region by default
+    :param workers: the number of worker processes, optional, defaults to FIT_WORKERS or the CPU count
+    :param isolated: whether to run in worker processes, otherwise blocks run sequentially in the calling process
+    :return: one report per region and horizon
+    """
+
+    refit_every = folds if refit_every is None else max(1, refit_every)
+
+    blocks = []
+    for region, data in input_data.items() :
+        cutoffs = rolling_cutoffs(data, folds, horizon, step)
+        for first in range(0, folds, refit_every) :
+            blocks.append((region, data, cutoffs[first:first + refit_every], horizon, engine))
+
+    if workers is None :
+        workers = int(os.getenv("FIT_WORKERS", os.cpu_count() or 1))
+    workers = max(1, min(workers, len(blocks)))
+
+    if isolated :
+        with process_pool(workers) as pool :
+            results = list(pool.map(backtest_block, *zip(*blocks)))
+    else :
+        results = [backtest_block(*block) for block in blocks]
+
+    reports = []
+    for region in input_data :
+        region_results = [result for block, result in zip(blocks, results) if block[0] == region]
+        errors = np.vstack([result[0] for result in region_results])
+        actuals = np.vstack([result[1] for result in region_results])
+
+        with warnings.catch_warnings() :
+            # Horizons without any true value have no accuracy
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mae = np.nanmean(errors, axis = 0)
+            ape = np.where(actuals != 0, errors / np.abs(np.where(actuals != 0, actuals, 1)), np.nan)
+            mape = np.nanmean(ape, axis = 0)
+
+        engine_name = create_model(region, engine).model_name
+        for h in range(horizon) :
+            reports.append(BacktestReport(region = region,
+                                          engine = engine_name,
+                                          horizon = h + 1,
+                                          folds = int(np.sum(~np.isnan(errors[:, h]))),
+                                          mae = None if np.isnan(mae[h]) else float(mae[h]),
+                                          mape = None if np.isnan(mape[h]) else float(mape[h])))
+
+    return reports
+
+
+def main() -> None :
+    parser = argparse.ArgumentParser(description = "Backtest the forecasts on rolling origins from a CSV")
+    parser.add_argument("csv", help = "semicolon-separated CSV in the upstream departmental or national layout")
+    parser.add_argument("regions", help = "comma-separated departments, or FRA for a national CSV")
+    parser.add_argument("--engine", help = "the engine, the engine of each region by default")
+    parser.add_argument("--folds", type = int, default = 8, help = "number of forecast origins")
+    parser.add_argument("--horizon", type = int, default = 14, help = "number of days forecast from each origin")
+    parser.add_argument("--step", type = int, default = 7, help = "number of days between origins")
+    parser.add_argument("--refit-every", type = int, help = "number of origins between full fits")
+    parser.add_argument("--workers", type = int, help = "number of worker processes")
+    args = parser.parse_args()
+
+    from util.data_retrieval import NATION_SCHEMA, REGION_SCHEMA, RegionIndex
+
+    regions = args.regions.split(",")
+    national = regions == ["FRA"]
+    schema = NATION_SCHEMA if national else REGION_SCHEMA
+
+    data = pd.read_csv(args.csv, sep = ";", usecols = list(schema.usecols), dtype = schema.dtype,
+                       parse_dates = list(schema.parse_dates))
+    index = RegionIndex.from_national(data) if national else RegionIndex.from_regional(data)
+    input_data = {region : index[region]["P"] for region in regions}
+
+    reports = backtest(input_data, args.engine, args.folds, args.horizon, args.step, args.refit_every, args.workers)
+    print(json.dumps([asdict(report) for report in reports], indent = 2))
+
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import json
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from dataclasses import dataclass, asdict
+from typing import Iterable, List, Optional
+
+from .registry import MODEL_ENGINES, create_model
+
+
+@dataclass
+class EngineReport :
+    """
+    Dataclass to represent the cost and accuracy of an engine on a series
+    """
+
+    engine : str
+    fit_seconds : float
+    peak_memory_bytes : int
+    footprint_bytes : int
+    mae : Optional[float] = None
+    mape : Optional[float] = None
+    error : Optional[str] = None
+
+
+def compare_engines(input_data : pd.Series,
+                    engines : Optional[Iterable[str]] = None,
+                    holdout : int = 28,
+                    region : str = "compare") -> List[EngineReport] :
+    """
+    Fits every engine on the same series, holding out its last days to measure accuracy.
+
+    :param input_data: the daily series
+    :param engines: the engines to compare, optional, defaults to all registered engines
+    :param holdout: the number of days held out for the accuracy
+    :param region: the region name given to the models
+    :return: one report per engine
+    """
+
+    engines = list(MODEL_ENGINES) if engines is None else list(engines)
+    train = input_data.iloc[:-holdout]
+    test = input_data.iloc[-holdout:].dropna()
+
+    reports = []
+    for engine in engines :
+        model = create_model(region, engine)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        try :
+            with warnings.catch_warnings() :
+                warnings.simplefilter("ignore")
+                model.fit(train)
+        except Exception as e :
+            reports.append(EngineReport(engine, time.perf_counter() - start, tracemalloc.get_traced_memory()[1], 0,
+                                        error = f"{type(e).__name__}: {e}"))
+            continue
+        finally :
+            fit_seconds = time.perf_counter() - start
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        # Engines forecasting a transformed series are scored on the scale of the data
+        prediction = model.predict_levels(test.index[0].date(), test.index[-1].date()).reindex(test.index)
+        errors = np.abs(prediction.to_numpy() - test.to_numpy())
+        nonzero = test.to_numpy() != 0
+
+        reports.append(EngineReport(engine = engine,
+                                    fit_seconds = fit_seconds,
+                                    peak_memory_bytes = peak_memory,
+                                    footprint_bytes = model.footprint(),
+                                    mae = float(np.nanmean(errors)),
+                                    mape = float(np.nanmean(errors[nonzero] / np.abs(test.to_numpy()[nonzero])))))
+
+    return reports
+
+
+def main() -> None :
+    parser = argparse.ArgumentParser(description = "Compare the forecasting engines on a departmental CSV")
+    parser.add_argument("csv", help = "semicolon-separated CSV in the upstream departmental layout")
+    parser.add_argument("region", help = "the department to compare the engines on")
+    parser.add_argument("--engines", help = "comma-separated engines, all registered engines by default")
+    parser.add_argument("--holdout", type = int, default = 28, help = "number of days held out")
+    args = parser.parse_args()
+
+    from util.data_retrieval import REGION_SCHEMA, RegionIndex
+
+    data = pd.read_csv(args.csv, sep = ";", usecols = list(REGION_SCHEMA.usecols), dtype = REGION_SCHEMA.dtype,
+                       parse_dates = list(REGION_SCHEMA.parse_dates))
+    series = RegionIndex.from_regional(data)[args.region]["P"]
+    engines = None if args.engines is None else args.engines.split(",")
+
+    reports = compare_engines(series, engines, args.holdout, args.region)
+    print(json.dumps([asdict(report) for report in reports], indent = 2))
+
+
+if __name__ == "__main__" :
+    main()
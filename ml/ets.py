@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from datetime import datetime, timedelta
+
+from .models import Model
+
+
+class ExpSmoothingModel(Model) :
+    """
+    Additive Holt-Winters exponential smoothing with a damped trend and weekly seasonality.
+    """
+
+    seasonal_periods : int
+    simulations : int
+
+    def __init__(self, region : str, seasonal_periods : int = 7) :
+        super(ExpSmoothingModel, self).__init__("ETS", region)
+        self.seasonal_periods = seasonal_periods
+        self.simulations = int(os.getenv("ETS_SIMULATIONS", 500))
+
+    def fit(self, input_data : pd.DataFrame) -> None :
+        from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+        # Missing days are not supported by exponential smoothing
+        input_data = input_data.interpolate(limit_direction = "both")
+
+        # Create model
+        self.model = ExponentialSmoothing(
+            input_data,
+            trend = "add",
+            damped_trend = True,
+            seasonal = "add",
+            seasonal_periods = self.seasonal_periods,
+            initialization_method = "estimated"
+        )
+        # Fit model
+        self.model = self.model.fit()
+
+        # Set flag
+        self.is_fitted = True
+
+        # Update last true date
+        self.last_true_date = input_data.last_valid_index().to_pydatetime()
+        self.last_full_fit = datetime.now()
+
+        self.precompute_forecast()
+
+    def _earliest_prediction(self) -> datetime :
+        return self.model.model._index[0].to_pydatetime()
+
+    def _predict(self, start : datetime, end : datetime) -> pd.Series :
+        return self.model.predict(start = start, end = end)
+
+    def _predict_std(self, start : datetime, end : datetime) -> pd.Series :
+        # In sample, the spread of the residuals, out of sample, the spread of simulated paths
+        last = self.model.model._index[-1]
+        index = pd.date_range(start, end, freq = "D")
+        std = pd.Series(np.sqrt(self.model.sse / self.model.model.nobs), index = index)
+
+        if end > last :
+            horizon = (end - last).days
+            paths = self.model.simulate(horizon, anchor = "end", repetitions = self.simulations, random_state = 0)
+            simulated = pd.Series(np.asarray(paths).reshape(horizon, -1).std(axis = 1),
+                                  index = pd.date_range(last + timedelta(days = 1), periods = horizon, freq = "D"))
+            std.loc[std.index > last] = simulated.loc[std.index[std.index > last]].to_numpy()
+
+        return std
@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import pandas as pd
+
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from typing import Optional, Tuple
+
+from .models import Model
+
+
+load_dotenv()
+
+
+class FourierArimaModel(Model) :
+    """
+    ARIMA model with weekly seasonality, the yearly seasonality being carried by Fourier terms
+    passed as exogenous variables. The state vector stays small, unlike a 365-day seasonal order.
+    """
+
+    order : Tuple[int, int, int]
+    seasonal_order : Tuple[int, int, int, int]
+    harmonics : int
+
+    def __init__(self,
+                 region : str,
+                 order : Tuple[int, int, int] = (2, 0, 1),
+                 seasonal_order : Tuple[int, int, int, int] = (1, 0, 1, 7),
+                 harmonics : int = 3) :
+        super(FourierArimaModel, self).__init__("FOURIER", region)
+        self.max_iter = int(os.getenv("SARIMAX_FIT_ITER", 50))
+        self.order = order
+        self.seasonal_order = seasonal_order
+        self.harmonics = harmonics
+
+    def fourier_terms(self, index : pd.DatetimeIndex) -> pd.DataFrame :
+        """
+        Returns the yearly Fourier terms for the given dates
+
+        :param index: the dates
+        :return: one sine and one cosine column per harmonic
+        """
+
+        t = np.asarray((index - pd.Timestamp("1970-01-01")).days, dtype = "float64")
+        terms = {}
+        for k in range(1, self.harmonics + 1) :
+            terms[f"sin{k}"] = np.sin(2 * np.pi * k * t / 365.25)
+            terms[f"cos{k}"] = np.cos(2 * np.pi * k * t / 365.25)
+
+        return pd.DataFrame(terms, index = index)
+
+    def fit(self, input_data : pd.DataFrame) -> None :
+        from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+        # Create model
+        self.model = SARIMAX(
+            input_data,
+            exog = self.fourier_terms(input_data.index),
+            order = self.order,
+            trend = "c",
+            seasonal_order = self.seasonal_order
+        )
+        # Fit model
+        self.model = self.model.fit(maxiter = self.max_iter, disp = False)
+
+        # Set flag
+        self.is_fitted = True
+
+        # Update last true date
+        self.last_true_date = input_data.last_valid_index().to_pydatetime()
+        self.last_full_fit = datetime.now()
+
+        self.precompute_forecast()
+
+    def _earliest_prediction(self) -> datetime :
+        return self.model.model._index[0].to_pydatetime()
+
+    def _predict(self, start : datetime, end : datetime) -> pd.Series :
+        return self.model.predict(start = start, end = end, exog = self._future_exog(end))
+
+    def _predict_std(self, start : datetime, end : datetime) -> pd.Series :
+        return self.model.get_prediction(start = start, end = end, exog = self._future_exog(end)).se_mean
+
+    def _predict_with_std(self, start : datetime, end : datetime) -> Tuple[pd.Series, Optional[pd.Series]] :
+        prediction = self.model.get_prediction(start = start, end = end, exog = self._future_exog(end))
+        return prediction.predicted_mean, prediction.se_mean
+
+    def _future_exog(self, end : datetime) -> Optional[pd.DataFrame] :
+        # Out of sample predictions need the Fourier terms of every day after the data
+        last = self.model.model._index[-1]
+        if end <= last :
+            return None
+
+        return self.fourier_terms(pd.date_range(last + timedelta(days = 1), end, freq = "D"))
@@ -1,12 +1,23 @@
-from datetime import date, datetime
-from typing import Optional
+import json
+import os
+import pickle
+import shutil
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional, Tuple, Union
 from pathlib import Path
+from statistics import NormalDist
 
 import joblib
+import numpy as np
 import pandas as pd
 
 from abc import ABC, abstractmethod
 
+from util.exceptions import InvalidDateError, UnfittedModelError
+from util.file_lock import host_lock
+from util.metrics import timed
+
 
 class Model(ABC) :
     """
@@ -18,13 +29,24 @@ class Model(ABC) :
     is_fitted : bool
     file_root : str
     last_true_date : datetime
+    last_full_fit : Optional[datetime]
+    forecast : Optional[pd.Series]
+    forecast_std : Optional[pd.Series]
+    precompute : bool
+    version : Optional[str]
 
     def __init__(self, model_name : str, region_name : str) :
         self.model_name = model_name
         self.region_name = region_name
         self.is_fitted = False
         self.model = None
+        self.forecast = None
+        self.forecast_std = None
+        self.precompute = True
+        self.last_full_fit = None
+        self.version = None
         self.file_root = f"{self.model_name}_{self.region_name}"
+        self._footprint = None
 
     @abstractmethod
     def fit(self, input_data : pd.DataFrame) -> None :
@@ -35,10 +57,32 @@ class Model(ABC) :
         """
         pass
 
+    def extend(self, new_data : pd.Series) -> float :
+        """
+        Extends the fitted model with the observations following the last true date,
+        keeping the fitted parameters instead of estimating them again.
+
+        :param new_data: the data, only the observations after the last true date are used
+        :return: the mean absolute standardised one-step error on the new observations, to detect drift
+        :raises NotImplementedError: if the model does not support incremental updates
+        """
+        raise NotImplementedError(f"{self.model_name} models do not support incremental updates")
+
     @abstractmethod
-    def predict(self, start : str, end : Optional[str]) :
+    def _predict(self, start : datetime, end : datetime) -> pd.Series :
         """
-        Predict the values between set dates
+        Runs the underlying model to predict the values between set dates
+
+        :param start: the start date
+        :param end: the end date
+        :return: the predicted values for the date range
+        """
+        pass
+
+    def predict(self, start : date, end : Optional[date] = None) -> pd.Series :
+        """
+        Predict the values between set dates.
+        Served from the precomputed forecast when it covers the date range.
 
         :param start: the start date
         :param end: the end date, optional, default to 5 days after start
@@ -46,33 +90,394 @@ class Model(ABC) :
         :raises UnfittedModelError: if the model was not fitted before the prediction
         :raises InvalidDateError: if the end date is before the start date
         """
-        pass
+
+        if end is None :
+            end = start + timedelta(days = 5)
+
+        if end < start :
+            raise InvalidDateError("End date is anterior to start date")
+
+        if not self.is_fitted :
+            raise UnfittedModelError("Model has not been fitted")
+
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+
+        with timed("predict") :
+            if self.forecast is not None and self.forecast.index[0] <= start and end <= self.forecast.index[-1] :
+                return self.forecast.loc[start:end]
+
+            return self._predict(start, end)
+
+    def predict_levels(self, start : date, end : Optional[date] = None) -> pd.Series :
+        """
+        Predict the values between set dates on the scale of the fitted data.
+        Engines forecasting a transformed series integrate their predictions back to it.
+
+        :param start: the start date
+        :param end: the end date, optional, default to 5 days after start
+        :return: the predicted values for the date range
+        :raises UnfittedModelError: if the model was not fitted before the prediction
+        :raises InvalidDateError: if the end date is before the start date
+        """
+        return self.predict(start, end)
+
+    def _predict_std(self, start : datetime, end : datetime) -> pd.Series :
+        """
+        Returns the standard deviation of the predictions between set dates
+
+        :param start: the start date
+        :param end: the end date
+        :return: the standard deviations for the date range
+        :raises NotImplementedError: if the model does not support prediction intervals
+        """
+        raise NotImplementedError(f"{self.model_name} models do not support prediction intervals")
+
+    def predict_interval(self, start : date, end : Optional[date] = None, level : float = 0.95) -> pd.DataFrame :
+        """
+        Predict the bounds of the prediction interval between set dates, assuming normal errors.
+        Served from the precomputed standard deviations when they cover the date range.
+
+        :param start: the start date
+        :param end: the end date, optional, default to 5 days after start
+        :param level: the probability covered by the interval
+        :return: the lower and upper bounds for the date range
+        :raises UnfittedModelError: if the model was not fitted before the prediction
+        :raises InvalidDateError: if the end date is before the start date
+        :raises NotImplementedError: if the model does not support prediction intervals
+        """
+
+        prediction = self.predict(start, end)
+        start, end = prediction.index[0], prediction.index[-1]
+
+        with timed("predict") :
+            std = self.forecast_std
+            if std is not None and std.index[0] <= start and end <= std.index[-1] :
+                std = std.loc[start:end]
+            else :
+                std = self._predict_std(start, end)
+
+            margin = NormalDist().inv_cdf(0.5 + level / 2) * std.to_numpy(dtype = "float64")
+
+        return pd.DataFrame({"lower" : prediction.to_numpy() - margin, "upper" : prediction.to_numpy() + margin},
+                            index = prediction.index)
+
+    def precompute_forecast(self) -> None :
+        """
+        Computes the predictions over the whole servable horizon, from MAX_DAYS_BEHIND days before
+        the last true date up to MAX_DAYS_AHEAD days in the future, so that predictions become slices.
+        Skipped when precompute is disabled, predictions then always run the underlying model.
+        """
+
+        if not self.precompute :
+            self.forecast = None
+            self.forecast_std = None
+            return
+
+        max_days_ahead = int(os.getenv("MAX_DAYS_AHEAD", 90))
+        max_days_behind = int(os.getenv("MAX_DAYS_BEHIND", 3))
+
+        today = datetime.combine(date.today(), datetime.min.time())
+        start = min(self.last_true_date + timedelta(days = 1), today - timedelta(days = max_days_behind))
+        start = max(start, self._earliest_prediction())
+        end = max(self.last_true_date, today) + timedelta(days = max_days_ahead)
+
+        # Interval widths are computed once here, requests only scale them
+        self.forecast, self.forecast_std = self._predict_with_std(pd.Timestamp(start), pd.Timestamp(end))
+
+    def _predict_with_std(self, start : datetime, end : datetime) -> Tuple[pd.Series, Optional[pd.Series]] :
+        """
+        Runs the underlying model to predict the values between set dates along with their standard
+        deviations. Engines computing both in a single pass override it.
+
+        :param start: the start date
+        :param end: the end date
+        :return: the predicted values and their standard deviations, None if intervals are not supported
+        """
+
+        prediction = self._predict(start, end)
+        try :
+            return prediction, self._predict_std(start, end)
+        except NotImplementedError :
+            return prediction, None
+
+    def footprint(self) -> int :
+        """
+        Returns the approximate memory footprint of the model, measured once from its serialised size.
+
+        :return: the footprint in bytes
+        """
+
+        if self._footprint is None :
+            self._footprint = len(pickle.dumps(self.model, protocol = pickle.HIGHEST_PROTOCOL))
+            if self.forecast is not None :
+                self._footprint += self.forecast.memory_usage(index = True)
+            if self.forecast_std is not None :
+                self._footprint += self.forecast_std.memory_usage(index = False)
+
+        return self._footprint
+
+    def _earliest_prediction(self) -> datetime :
+        """
+        Returns the earliest date the underlying model can predict, defaults to the day following
+        the last true date
+        """
+        return self.last_true_date + timedelta(days = 1)
+
+    @property
+    def compact_path(self) -> Path :
+        """
+        The directory holding the compact artifacts of the model, one subdirectory per version.
+        """
+        return Path(os.getenv("MODEL_DIR", "models"), self.file_root)
+
+    def artifact_version(self) -> Optional[str] :
+        """
+        Returns the version of the artifact load() would read, without reading the artifact itself.
+
+        :return: the version, None if there is no artifact
+        """
+
+        if self._has_compact() :
+            version = self._compact_version()
+            if version is not None :
+                return version
+            paths = [self.compact_path / "meta.json"]
+        else :
+            paths = [Path(f"{self.file_root}.joblib"), Path("updates", f"{self.file_root}.log")]
+
+        try :
+            return ":".join(str(os.stat(path).st_mtime_ns) for path in paths)
+        except FileNotFoundError :
+            return None
+
+    def _compact_arrays(self) -> Dict[str, np.ndarray] :
+        """
+        Returns the arrays needed to rebuild a predict-capable model
+
+        :raises NotImplementedError: if the model does not support the compact format
+        """
+        raise NotImplementedError(f"{self.model_name} models do not support the compact format")
+
+    def _compact_meta(self) -> Dict[str, Any] :
+        """
+        Returns the specification needed to rebuild a predict-capable model
+        """
+        return {}
+
+    def _from_compact(self, arrays : Dict[str, np.ndarray], meta : Dict[str, Any]) -> None :
+        """
+        Restores the model from its compact arrays and specification
+
+        :param arrays: the arrays, memory-mapped from the artifact
+        :param meta: the specification
+        :raises NotImplementedError: if the model does not support the compact format
+        """
+        raise NotImplementedError(f"{self.model_name} models do not support the compact format")
+
+    def _joblib_payload(self) -> Any :
+        """
+        Returns what the joblib artifact holds, the underlying model by default
+        """
+        return self.model
+
+    def _from_joblib(self, payload : Any) -> None :
+        """
+        Restores the model from the content of its joblib artifact
+
+        :param payload: the content of the artifact
+        """
+        self.model = payload
 
     def save(self) -> None :
         """
-        Saves the model to a local file
+        Saves the model to a local file, in the format set by MODEL_FORMAT (joblib or compact).
+        Models that do not support the compact format are saved with joblib.
+        With the shared store, the compact artifact is always written too when the model supports it.
         """
 
-        joblib.dump(self.model, filename = f"{self.file_root}.joblib", compress = True)
+        compact = os.getenv("MODEL_FORMAT", "joblib") == "compact"
+        if compact :
+            try :
+                self.save_compact()
+            except NotImplementedError :
+                compact = False
 
-        update_file_path = Path("updates", f"{self.file_root}.log")
-        with open(update_file_path, "w") as f :
-            f.write(self.last_true_date.strftime("%Y-%m-%dT%H:%M:%S"))
+        if not compact :
+            # Written then renamed, so readers never see a partially written artifact
+            tmp_path = f"{self.file_root}.joblib.tmp"
+            joblib.dump(self._joblib_payload(), filename = tmp_path, compress = True)
+            os.replace(tmp_path, f"{self.file_root}.joblib")
+
+            if _shared_store() :
+                try :
+                    self.save_compact()
+                except NotImplementedError :
+                    pass
+
+        update = self.last_true_date.strftime("%Y-%m-%dT%H:%M:%S")
+        if self.last_full_fit is not None :
+            update += "\n" + self.last_full_fit.strftime("%Y-%m-%dT%H:%M:%S")
+
+        _write_atomically(Path("updates", f"{self.file_root}.log"), update)
+        self.version = self.artifact_version()
+
+    def save_compact(self) -> None :
+        """
+        Saves only what inference needs, as raw arrays that can be memory-mapped, along with a
+        JSON specification.
+        """
+
+        arrays = dict(self._compact_arrays())
+        arrays["forecast"] = self.forecast.to_numpy(dtype = "float64")
+        arrays["forecast_dates"] = self.forecast.index.to_numpy(dtype = "datetime64[ns]")
+        if self.forecast_std is not None :
+            arrays["forecast_std"] = self.forecast_std.to_numpy(dtype = "float64")
+
+        meta = self._compact_meta()
+        meta["last_true_date"] = self.last_true_date.strftime("%Y-%m-%dT%H:%M:%S")
+        if self.last_full_fit is not None :
+            meta["last_full_fit"] = self.last_full_fit.strftime("%Y-%m-%dT%H:%M:%S")
+
+        # Each save writes a new version, published by atomically replacing the CURRENT pointer
+        version = f"{time.time_ns()}-{os.getpid()}"
+        directory = self.compact_path / version
+        directory.mkdir(parents = True, exist_ok = True)
+
+        for name, array in arrays.items() :
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(array))
+
+        with open(directory / "meta.json", "w") as f :
+            json.dump(meta, f)
+
+        previous = self._compact_version()
+        _write_atomically(self.compact_path / "CURRENT", version)
+        self.version = version
+
+        # Keep the previous version, models loaded from it may still be serving requests
+        for path in self.compact_path.iterdir() :
+            if path.is_dir() and path.name not in (version, previous) :
+                shutil.rmtree(path, ignore_errors = True)
+
+    def load_compact(self) -> None :
+        """
+        Loads the model from its compact artifact, memory-mapping its arrays.
+        """
+
+        version = self._compact_version()
+        directory = self.compact_path
+        if version is not None :
+            directory = directory / version
+        else :
+            version = self.artifact_version()
+
+        with open(directory / "meta.json", "r") as f :
+            meta = json.load(f)
+
+        arrays = {path.stem : np.load(path, mmap_mode = "r") for path in directory.glob("*.npy")}
+
+        self.last_true_date = datetime.strptime(meta["last_true_date"], "%Y-%m-%dT%H:%M:%S")
+        if "last_full_fit" in meta :
+            self.last_full_fit = datetime.strptime(meta["last_full_fit"], "%Y-%m-%dT%H:%M:%S")
+        self.forecast = pd.Series(arrays.pop("forecast"),
+                                  index = pd.DatetimeIndex(arrays.pop("forecast_dates"), freq = "D"),
+                                  name = "predicted_mean")
+        self.forecast_std = None
+        if "forecast_std" in arrays :
+            self.forecast_std = pd.Series(arrays.pop("forecast_std"), index = self.forecast.index)
+
+        self._from_compact(arrays, meta)
+        self.is_fitted = True
+        self.version = version
 
     def load(self, filename : Optional[str] = None) -> None :
         """
         Loads the model contained in the local field.
+        The most recently saved of the compact and joblib artifacts is loaded, the compact one on a tie.
+
+        With the shared store (MODEL_STORE=shared), a model only saved with joblib is converted to the
+        compact format by a single process of the host, the others wait for it and memory-map the result,
+        so the pages of the artifact are shared by all the workers instead of being copied in each one.
 
         :param filename: the name of the file if not the default name
         """
 
+        with timed("model_load") :
+            self._load(filename)
+
+    def _load(self, filename : Optional[str] = None) -> None :
+        if filename is None and self._has_compact() :
+            self.load_compact()
+            return
+
+        if filename is None and _shared_store() :
+            with host_lock(self.compact_path.with_name(f"{self.file_root}.lock")) :
+                # Another worker may have converted the model while this one was waiting
+                if self._has_compact() :
+                    self.load_compact()
+                    return
+
+                self._load_joblib()
+
+                try :
+                    self.save_compact()
+                except NotImplementedError :
+                    return
+
+            # Drop the private copy in favour of the shared one
+            self.load_compact()
+            return
+
+        self._load_joblib(filename)
+
+    def _has_compact(self) -> bool :
+        # A compact artifact older than the joblib one is stale, e.g. after switching MODEL_FORMAT back to joblib
+        for path in (self.compact_path / "CURRENT", self.compact_path / "meta.json") :
+            try :
+                compact_time = os.stat(path).st_mtime_ns
+                break
+            except FileNotFoundError :
+                continue
+        else :
+            return False
+
+        try :
+            return compact_time >= os.stat(f"{self.file_root}.joblib").st_mtime_ns
+        except FileNotFoundError :
+            return True
+
+    def _compact_version(self) -> Optional[str] :
+        try :
+            return (self.compact_path / "CURRENT").read_text().strip()
+        except FileNotFoundError :
+            return None
+
+    def _load_joblib(self, filename : Optional[str] = None) -> None :
+        # Read before the artifact, so a concurrent save is detected on the next version check
+        version = self.artifact_version() if filename is None else None
         filename = f"{self.file_root}.joblib" if filename is None else filename
 
-        self.model = joblib.load(filename = filename)
+        self._from_joblib(joblib.load(filename = filename))
         self.is_fitted = True
 
         update_file_path = Path("updates", f"{self.file_root}.log")
         with open(update_file_path, "r") as f :
-            read_date = f.readline()
+            read_date = f.readline().strip()
+            read_full_fit = f.readline().strip()
 
         self.last_true_date = datetime.strptime(read_date, "%Y-%m-%dT%H:%M:%S")
+        if read_full_fit :
+            self.last_full_fit = datetime.strptime(read_full_fit, "%Y-%m-%dT%H:%M:%S")
+
+        self.precompute_forecast()
+        self.version = version
+
+
+def _shared_store() -> bool :
+    return os.getenv("MODEL_STORE", "private") == "shared"
+
+
+def _write_atomically(path : Union[str, Path], content : str) -> None :
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f :
+        f.write(content)
+    os.replace(tmp_path, path)
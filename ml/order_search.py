@@ -0,0 +1,242 @@
+import itertools
+import json
+import os
+import time
+import warnings
+
+import pandas as pd
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from dotenv import load_dotenv
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from util.processes import process_pool
+from .models import _write_atomically
+
+
+load_dotenv()
+
+Order = Tuple[int, int, int]
+SeasonalOrder = Tuple[int, int, int, int]
+
+
+@dataclass
+class SearchReport :
+    """
+    Dataclass to represent the outcome of an order search
+    """
+
+    region : str
+    order : Optional[Order]
+    seasonal_order : Optional[SeasonalOrder]
+    aic : Optional[float]
+    evaluated : int
+    pruned : int
+    seconds : float
+    timed_out : bool = False
+    error : Optional[str] = None
+
+
+def spec_path(file_root : str) -> Path :
+    """
+    Returns the file holding the persisted specification of a model.
+
+    :param file_root: the file root of the model
+    :return: the path
+    """
+    return Path("specs", f"{file_root}.json")
+
+
+def load_spec(file_root : str) -> Optional[Tuple[Order, SeasonalOrder]] :
+    """
+    Loads the persisted specification of a model.
+
+    :param file_root: the file root of the model
+    :return: the order and the seasonal order, None if no search was persisted
+    """
+
+    path = spec_path(file_root)
+    if not path.exists() :
+        return None
+
+    with open(path, "r") as f :
+        spec = json.load(f)
+
+    return tuple(spec["order"]), tuple(spec["seasonal_order"])
+
+
+def save_spec(file_root : str, order : Order, seasonal_order : SeasonalOrder, aic : float) -> None :
+    """
+    Persists the specification chosen for a model, later fits reuse it.
+
+    :param file_root: the file root of the model
+    :param order: the order
+    :param seasonal_order: the seasonal order
+    :param aic: the AIC of the specification
+    """
+
+    path = spec_path(file_root)
+    path.parent.mkdir(parents = True, exist_ok = True)
+    _write_atomically(path, json.dumps({"order" : list(order),
+                                        "seasonal_order" : list(seasonal_order),
+                                        "aic" : aic,
+                                        "searched_at" : datetime.now().strftime("%Y-%m-%dT%H:%M:%S")}))
+
+
+def candidate_orders(seasonal_period : int,
+                     max_p : int = 2,
+                     max_q : int = 2,
+                     max_seasonal_p : int = 1,
+                     max_seasonal_q : int = 1) -> List[Tuple[Order, SeasonalOrder]] :
+    """
+    Returns the candidate specifications. The differencing orders are fixed, one seasonal difference and
+    no regular difference like the default specification, so that the AICs are computed on the same data
+    and can be compared.
+
+    :param seasonal_period: the seasonal period
+    :param max_p: the maximum autoregressive order
+    :param max_q: the maximum moving average order
+    :param max_seasonal_p: the maximum seasonal autoregressive order
+    :param max_seasonal_q: the maximum seasonal moving average order
+    :return: the candidates, as orders and seasonal orders
+    """
+
+    return [((p, 0, q), (seasonal_p, 1, seasonal_q, seasonal_period))
+            for p, q, seasonal_p, seasonal_q in itertools.product(range(max_p + 1), range(max_q + 1),
+                                                                  range(max_seasonal_p + 1), range(max_seasonal_q + 1))]
+
+
+def evaluate_candidate(input_data : pd.Series, order : Order, seasonal_order : SeasonalOrder, max_iter : int) -> float :
+    """
+    Fits a candidate specification the way SarimaxModel does.
+
+    :param input_data: the data to fit the candidate to
+    :param order: the order
+    :param seasonal_order: the seasonal order
+    :param max_iter: the maximum number of optimiser iterations
+    :return: the AIC, infinite if the fit failed
+    """
+
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    try :
+        with warnings.catch_warnings() :
+            warnings.simplefilter("ignore")
+            model = SARIMAX(input_data, order = order, trend = "c", seasonal_order = seasonal_order,
+                            simple_differencing = True)
+            aic = float(model.fit(maxiter = max_iter, disp = False).aic)
+    except Exception :
+        return float("inf")
+
+    return aic if aic == aic else float("inf")
+
+
+def _run_stage(pool : ProcessPoolExecutor,
+               input_data : pd.Series,
+               candidates : List[Tuple[Order, SeasonalOrder]],
+               max_iter : int,
+               deadline : float) -> Tuple[Dict[Tuple[Order, SeasonalOrder], float], bool] :
+    futures = {pool.submit(evaluate_candidate, input_data, order, seasonal_order, max_iter) : (order, seasonal_order)
+               for order, seasonal_order in candidates}
+
+    scores = {}
+    pending = set(futures)
+    while pending :
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 :
+            break
+        done, pending = wait(pending, timeout = remaining, return_when = FIRST_COMPLETED)
+        for future in done :
+            scores[futures[future]] = future.result()
+
+    for future in pending :
+        future.cancel()
+
+    return scores, len(pending) > 0
+
+
+def _terminate_workers(pool : ProcessPoolExecutor) -> None :
+    # The executor exposes no way to stop running tasks, its worker processes are terminated instead
+    for process in list((getattr(pool, "_processes", None) or {}).values()) :
+        process.terminate()
+
+
+def search_order(region : str,
+                 input_data : pd.Series,
+                 seasonal_period : int = 365,
+                 candidates : Optional[List[Tuple[Order, SeasonalOrder]]] = None,
+                 workers : Optional[int] = None,
+                 budget : Optional[float] = None,
+                 short_iter : int = 5,
+                 keep : int = 3,
+                 file_root : Optional[str] = None) -> SearchReport :
+    """
+    Searches the SARIMAX specification of a region with the lowest AIC, and persists it.
+
+    Every candidate is first fitted with a few optimiser iterations only, the keep best ones are then
+    fitted with SARIMAX_FIT_ITER iterations. Candidates are evaluated across a process pool, and
+    the search stops at the wall-clock budget, choosing among the candidates evaluated so far.
+    Fits still running at the budget are terminated along with the pool.
+
+    :param region: the region
+    :param input_data: the data to fit the candidates to
+    :param seasonal_period: the seasonal period of the default candidates
+    :param candidates: the candidates, optional, defaults to candidate_orders(seasonal_period)
+    :param workers: the number of worker processes, optional, defaults to FIT_WORKERS or the CPU count
+    :param budget: the wall-clock budget in seconds, optional, defaults to ORDER_SEARCH_BUDGET or 600
+    :param short_iter: the number of optimiser iterations of the pruning fits
+    :param keep: the number of candidates fully fitted
+    :param file_root: the file root the specification is persisted for, optional, defaults to SARIMAX_<region>
+    :return: the search report
+    """
+
+    start = time.perf_counter()
+    candidates = candidate_orders(seasonal_period) if candidates is None else candidates
+    budget = float(os.getenv("ORDER_SEARCH_BUDGET", 600)) if budget is None else budget
+    deadline = time.monotonic() + budget
+    max_iter = int(os.getenv("SARIMAX_FIT_ITER", 50))
+
+    if workers is None :
+        workers = int(os.getenv("FIT_WORKERS", os.cpu_count() or 1))
+    workers = max(1, min(workers, len(candidates)))
+
+    timed_out = False
+    pool = process_pool(workers)
+    try :
+        # Cheap fits rank the candidates, only the best ones get a full fit
+        short_scores, timed_out = _run_stage(pool, input_data, candidates, short_iter, deadline)
+        ranked = sorted((score, candidate) for candidate, score in short_scores.items() if score < float("inf"))
+        survivors = [candidate for _, candidate in ranked[:keep]]
+
+        full_scores, full_timed_out = _run_stage(pool, input_data, survivors, max_iter, deadline)
+        timed_out = timed_out or full_timed_out
+    finally :
+        if timed_out :
+            # Fits still running past the budget cannot be cancelled, stop them so that they do not
+            # compete with the work started after the search
+            _terminate_workers(pool)
+        pool.shutdown(wait = True, cancel_futures = True)
+
+    # Fall back to the pruning scores if no full fit completed in time
+    scores = {candidate : score for candidate, score in full_scores.items() if score < float("inf")}
+    if not scores :
+        scores = {candidate : score for candidate, score in short_scores.items() if score < float("inf")}
+
+    if not scores :
+        return SearchReport(region, None, None, None, len(short_scores), 0, time.perf_counter() - start,
+                            timed_out, "No candidate could be fitted")
+
+    (order, seasonal_order), aic = min(scores.items(), key = lambda item : item[1])
+    save_spec(f"SARIMAX_{region}" if file_root is None else file_root, order, seasonal_order, aic)
+
+    return SearchReport(region = region,
+                        order = order,
+                        seasonal_order = seasonal_order,
+                        aic = aic,
+                        evaluated = len(short_scores) + len(full_scores),
+                        pruned = len(short_scores) - len(survivors),
+                        seconds = time.perf_counter() - start,
+                        timed_out = timed_out)
@@ -0,0 +1,63 @@
+import os
+
+from dotenv import load_dotenv
+from typing import Dict, Optional, Type
+
+from .ets import ExpSmoothingModel
+from .fourier import FourierArimaModel
+from .models import Model
+from .sarimax import SarimaxModel
+
+
+load_dotenv()
+
+MODEL_ENGINES : Dict[str, Type[Model]] = {
+    "SARIMAX" : SarimaxModel,
+    "FOURIER" : FourierArimaModel,
+    "ETS" : ExpSmoothingModel
+}
+
+
+def register_engine(name : str, model_class : Type[Model]) -> None :
+    """
+    Registers a forecasting engine, making it selectable through the configuration.
+
+    :param name: the name of the engine
+    :param model_class: the model class, built from a region name
+    """
+    MODEL_ENGINES[name] = model_class
+
+
+def engine_for(region : str) -> str :
+    """
+    Returns the engine configured for a region.
+
+    Engines are set per region in MODEL_ENGINES as comma-separated region:engine pairs,
+    other regions use MODEL_ENGINE, SARIMAX by default.
+
+    :param region: the region
+    :return: the name of the engine
+    """
+
+    for pair in os.getenv("MODEL_ENGINES", "").split(",") :
+        if ":" in pair :
+            engine_region, engine = pair.split(":", 1)
+            if engine_region.strip() == region :
+                return engine.strip()
+
+    return os.getenv("MODEL_ENGINE", "SARIMAX")
+
+
+def create_model(region : str, engine : Optional[str] = None) -> Model :
+    """
+    Creates an unfitted model for a region.
+
+    :param region: the region
+    :param engine: the engine, optional, defaults to the engine configured for the region
+    :return: the model
+    :raises KeyError: if the engine is not registered
+    """
+
+    engine = engine_for(region) if engine is None else engine
+
+    return MODEL_ENGINES[engine](region)
@@ -1,13 +1,14 @@
 import os
+import numpy as np
 import pandas as pd
-import statsmodels.api as sm
 
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 
 from util.exceptions import InvalidDateError, UnfittedModelError
 from .models import Model
+from .order_search import load_spec
 
 
 load_dotenv()
@@ -15,17 +16,34 @@ load_dotenv()
 
 class SarimaxModel(Model) :
 
-    def __init__(self, region : str) :
+    order : Tuple[int, int, int]
+    seasonal_order : Tuple[int, int, int, int]
+    state : Optional[Dict[str, np.ndarray]]
+
+    def __init__(self,
+                 region : str,
+                 order : Optional[Tuple[int, int, int]] = None,
+                 seasonal_order : Optional[Tuple[int, int, int, int]] = None) :
         super(SarimaxModel, self).__init__("SARIMAX", region)
         self.max_iter = int(os.getenv("SARIMAX_FIT_ITER", 50))
+        # Without an explicit specification, fits use the one persisted by the order search if any
+        self.searchable = order is None and seasonal_order is None
+        self.order = (1, 0, 0) if order is None else order
+        self.seasonal_order = (1, 1, 1, 365) if seasonal_order is None else seasonal_order
+        self.state = None
 
     def fit(self, input_data: pd.DataFrame) -> None :
+        if self.searchable and (spec := load_spec(self.file_root)) is not None :
+            self.order, self.seasonal_order = spec
+
+        from statsmodels.tsa.statespace.sarimax import SARIMAX
+
         # Create model
-        self.model = sm.tsa.statespace.SARIMAX(
+        self.model = SARIMAX(
             input_data,
-            order = (1, 0, 0),
+            order = self.order,
             trend = "c",
-            seasonal_order = (1, 1, 1, 365),
+            seasonal_order = self.seasonal_order,
             simple_differencing = True
         )
         # Fit model
@@ -36,8 +54,89 @@ class SarimaxModel(Model) :
 
         # Update last true date
         self.last_true_date = input_data.last_valid_index().to_pydatetime()
+        self.last_full_fit = datetime.now()
+
+        self.state = self._extract_state()
+
+        self.precompute_forecast()
+
+    def extend(self, new_data : pd.Series) -> float :
+        if not self.is_fitted :
+            raise UnfittedModelError("Model has not been fitted")
+
+        from statsmodels.tsa.statespace.sarimax import SARIMAX
+        from statsmodels.tsa.statespace.tools import diff
+
+        state = self._compact_arrays()
+        p, d, q = self.order
+        seasonal_p, seasonal_d, seasonal_q, s = self.seasonal_order
+
+        new_data = new_data.loc[new_data.index > self.last_true_date].dropna()
+        if len(new_data) == 0 :
+            return 0.0
+
+        index = pd.date_range(self.last_true_date + timedelta(days = 1), new_data.index[-1], freq = "D")
+        new_data = new_data.reindex(index)
+
+        # Difference the new observations using the end of the previous data
+        history = np.concatenate([np.asarray(state["tail"], dtype = "float64"), new_data.to_numpy(dtype = "float64")])
+        differenced = diff(history, k_diff = d, k_seasonal_diff = seasonal_d, seasonal_periods = s)
+
+        # Run the filter forward from the previous state with the fitted parameters
+        model = SARIMAX(
+            pd.Series(differenced, index = index),
+            order = (p, 0, q),
+            trend = "c",
+            seasonal_order = (seasonal_p, 0, seasonal_q, s)
+        )
+        model.ssm.initialize_known(np.asarray(state["state"]), np.asarray(state["state_cov"]))
+        self.model = model.filter(np.asarray(state["params"]))
+
+        self.last_true_date = index[-1].to_pydatetime()
+        self.state = {
+            "params" : np.array(state["params"]),
+            "state" : np.array(self.model.predicted_state[:, -1]),
+            "state_cov" : np.array(self.model.predicted_state_cov[:, :, -1]),
+            "tail" : history[-self._tail_length():]
+        }
+        self._footprint = None
+
+        self.precompute_forecast()
+
+        return float(np.nanmean(np.abs(self.model.standardized_forecasts_error[0])))
+
+    def _tail_length(self) -> int :
+        # Number of observations needed to difference new observations
+        _, d, _ = self.order
+        _, seasonal_d, _, s = self.seasonal_order
+        return max(1, d + seasonal_d * s)
+
+    def _earliest_prediction(self) -> datetime :
+        if self.model is None :
+            return super(SarimaxModel, self)._earliest_prediction()
+
+        return self.model.model._index[0].to_pydatetime()
+
+    def _predict(self, start : datetime, end : datetime) -> pd.Series :
+        if self.model is None :
+            self.model = self._rebuild()
+
+        return self.model.predict(start = start, end = end)
+
+    def predict_levels(self, start : date, end : Optional[date] = None) -> pd.Series :
+        """
+        Predict the values between set dates on the scale of the fitted data.
+        The data is differenced before estimation, so the forecast of the differences is integrated
+        from the end of the data, using the raw observations kept in the state.
+
+        :param start: the start date, after the last true date
+        :param end: the end date, optional, default to 5 days after start
+        :return: the predicted values for the date range
+        :raises UnfittedModelError: if the model was not fitted before the prediction
+        :raises InvalidDateError: if the end date is before the start date or the start date is not after
+            the last true date
+        """
 
-    def predict(self, start : date, end : Optional[date]) :
         if end is None :
             end = start + timedelta(days = 5)
 
@@ -47,4 +146,122 @@ class SarimaxModel(Model) :
         if not self.is_fitted :
             raise UnfittedModelError("Model has not been fitted")
 
-        return self.model.predict(start = start, end = end)
+        first = self.last_true_date.date() + timedelta(days = 1)
+        if start < first :
+            raise InvalidDateError("Levels are only predicted after the last true date")
+
+        differences = self.predict(first, end)
+        levels = self._integrate(differences.to_numpy(dtype = "float64"))
+
+        return pd.Series(levels, index = differences.index).loc[pd.Timestamp(start):pd.Timestamp(end)]
+
+    def _integrate(self, differences : np.ndarray) -> np.ndarray :
+        # Undo the seasonal then the regular differencing, starting from the differences of the raw tail
+        _, d, _ = self.order
+        _, seasonal_d, _, s = self.seasonal_order
+
+        stages = [np.asarray(self._compact_arrays()["tail"], dtype = "float64")]
+        for _ in range(d) :
+            stages.append(np.diff(stages[-1]))
+        for _ in range(seasonal_d) :
+            stages.append(stages[-1][s:] - stages[-1][:-s])
+
+        values = differences
+        for stage in reversed(stages[d:-1]) :
+            levels = np.concatenate([stage[-s:], np.empty(len(values))])
+            for i, value in enumerate(values) :
+                levels[s + i] = value + levels[i]
+            values = levels[s:]
+        for stage in reversed(stages[:d]) :
+            values = stage[-1] + np.cumsum(values)
+
+        return values
+
+    def _predict_std(self, start : datetime, end : datetime) -> pd.Series :
+        if self.model is None :
+            self.model = self._rebuild()
+
+        return self.model.get_prediction(start = start, end = end).se_mean
+
+    def _predict_with_std(self, start : datetime, end : datetime) -> Tuple[pd.Series, Optional[pd.Series]] :
+        if self.model is None :
+            self.model = self._rebuild()
+
+        prediction = self.model.get_prediction(start = start, end = end)
+        return prediction.predicted_mean, prediction.se_mean
+
+    def _extract_state(self) -> Dict[str, np.ndarray] :
+        # Copy the filter state at the end of the data out of the full filter output
+        return {
+            "params" : np.array(self.model.params),
+            "state" : np.array(self.model.predicted_state[:, -1]),
+            "state_cov" : np.array(self.model.predicted_state_cov[:, :, -1]),
+            "tail" : np.array(self.model.model.orig_endog, dtype = "float64").ravel()[-self._tail_length():]
+        }
+
+    def _compact_arrays(self) -> Dict[str, np.ndarray] :
+        if self.state is None :
+            self.state = self._extract_state()
+
+        return self.state
+
+    def _joblib_payload(self) -> Any :
+        # Once extended, the results only cover the differenced new days, the raw tail lives in the state
+        # and the specification cannot be read back from the results
+        return {"results" : self.model,
+                "state" : self._compact_arrays(),
+                "order" : self.order,
+                "seasonal_order" : self.seasonal_order}
+
+    def _from_joblib(self, payload : Any) -> None :
+        if isinstance(payload, dict) :
+            self.model = payload["results"]
+            self.state = payload["state"]
+        else :
+            # Artifacts saved before the state was persisted hold the fitted results only
+            self.model = payload
+            self.state = None
+
+        # The specification may come from the order search rather than the constructor
+        if isinstance(payload, dict) and "order" in payload :
+            self.order = tuple(payload["order"])
+            self.seasonal_order = tuple(payload["seasonal_order"])
+        else :
+            self.order = tuple(self.model.model.order)
+            self.seasonal_order = tuple(self.model.model.seasonal_order)
+
+    def _compact_meta(self) -> Dict[str, Any] :
+        return {"order" : list(self.order),
+                "seasonal_order" : list(self.seasonal_order)}
+
+    def _from_compact(self, arrays : Dict[str, np.ndarray], meta : Dict[str, Any]) -> None :
+        self.order = tuple(meta["order"])
+        self.seasonal_order = tuple(meta["seasonal_order"])
+        self.state = arrays
+        # The state space model is only rebuilt if a prediction falls outside the forecast
+        self.model = None
+
+    def _rebuild(self) :
+        """
+        Rebuilds a predict-capable model from the parameters and the filter state at the end of the data.
+        As the data is differenced before estimation, the model is rebuilt without differencing and
+        starts on the day following the last true date.
+
+        :return: the filtered results
+        """
+
+        from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+        p, _, q = self.order
+        seasonal_p, _, seasonal_q, s = self.seasonal_order
+
+        index = pd.date_range(self.last_true_date + timedelta(days = 1), periods = 1, freq = "D")
+        model = SARIMAX(
+            pd.Series([np.nan], index = index),
+            order = (p, 0, q),
+            trend = "c",
+            seasonal_order = (seasonal_p, 0, seasonal_q, s)
+        )
+        model.ssm.initialize_known(np.asarray(self.state["state"]), np.asarray(self.state["state_cov"]))
+
+        return model.filter(np.asarray(self.state["params"]))
@@ -0,0 +1,156 @@
+import os
+import time
+
+import pandas as pd
+
+from concurrent.futures import as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from typing import Any, Callable, Dict, List, Optional
+
+from util.processes import process_pool
+from .models import Model
+from .registry import create_model
+
+
+load_dotenv()
+
+
+@dataclass
+class FitReport :
+    """
+    Dataclass to represent the outcome of a model fit
+    """
+
+    region : str
+    seconds : float
+    error : Optional[str] = None
+    mode : str = "full"
+
+
+def fit_region(region : str, input_data : pd.Series) -> FitReport :
+    """
+    Fits and saves the model of a single region.
+    Errors are reported instead of raised so that one region cannot abort a bulk update.
+
+    :param region: the region of the model
+    :param input_data: the data to fit the model to
+    :return: the fit report
+    """
+
+    start = time.perf_counter()
+
+    try :
+        model = create_model(region)
+        model.fit(input_data)
+        model.save()
+    except Exception as e :
+        return FitReport(region, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+    return FitReport(region, time.perf_counter() - start)
+
+
+def full_fit_due(model : Model) -> bool :
+    """
+    Checks whether the parameters of the model should be estimated again, which happens every
+    FULL_REFIT_DAYS days.
+
+    :param model: the model
+    :return: whether a full fit is due
+    """
+
+    full_refit_days = int(os.getenv("FULL_REFIT_DAYS", 7))
+
+    return model.last_full_fit is None or datetime.now() - model.last_full_fit >= timedelta(days = full_refit_days)
+
+
+def update_region(region : str, input_data : pd.Series) -> FitReport :
+    """
+    Updates and saves the model of a single region.
+    The saved model is extended with the new observations, keeping its parameters. A full fit
+    only happens when there is no saved model, when a full fit is due or when the one-step errors
+    on the new observations exceed DRIFT_THRESHOLD.
+
+    Engines that cannot be extended are always fully fitted. When the incremental update fails,
+    the model is fully fitted instead of being left stale, and the report mode is fallback.
+
+    :param region: the region of the model
+    :param input_data: the data to update the model with
+    :return: the fit report
+    """
+
+    start = time.perf_counter()
+    drift_threshold = float(os.getenv("DRIFT_THRESHOLD", 3.0))
+
+    try :
+        model = create_model(region)
+        try :
+            model.load()
+        except FileNotFoundError :
+            return fit_region(region, input_data)
+
+        if full_fit_due(model) :
+            return fit_region(region, input_data)
+
+        last_true_date = model.last_true_date
+        try :
+            drift = model.extend(input_data)
+        except NotImplementedError :
+            return fit_region(region, input_data)
+
+        if drift > drift_threshold :
+            return fit_region(region, input_data)
+
+        if model.last_true_date == last_true_date :
+            return FitReport(region, time.perf_counter() - start, mode = "unchanged")
+
+        model.save()
+    except Exception :
+        # fit_region reports its own errors, so only the incremental path lands here
+        report = fit_region(region, input_data)
+        report.seconds = time.perf_counter() - start
+        report.mode = "fallback"
+        return report
+
+    return FitReport(region, time.perf_counter() - start, mode = "incremental")
+
+
+def fit_regions(input_data : Dict[str, Any],
+                workers : Optional[int] = None,
+                isolated : bool = True,
+                incremental : bool = False,
+                fit : Optional[Callable[[str, Any], FitReport]] = None) -> List[FitReport] :
+    """
+    Fits and saves the models of several regions across a process pool.
+
+    :param input_data: the data to fit each region's model to
+    :param workers: the number of worker processes, optional, defaults to FIT_WORKERS or the CPU count
+    :param isolated: whether to fit in worker processes, otherwise fits run sequentially in the calling process
+    :param incremental: whether to extend the saved models instead of fitting them from scratch
+    :param fit: the function fitting the model of a region, optional, defaults to fit_region or update_region
+    :return: the fit reports, in the order of the input regions
+    """
+
+    if fit is None :
+        fit = update_region if incremental else fit_region
+
+    if workers is None :
+        workers = int(os.getenv("FIT_WORKERS", os.cpu_count() or 1))
+    workers = max(1, min(workers, len(input_data)))
+
+    if not isolated :
+        return [fit(region, data) for region, data in input_data.items()]
+
+    reports : Dict[str, FitReport] = {}
+    with process_pool(workers) as pool :
+        futures = {pool.submit(fit, region, data) : region for region, data in input_data.items()}
+
+        for future in as_completed(futures) :
+            region = futures[future]
+            try :
+                reports[region] = future.result()
+            except Exception as e :
+                reports[region] = FitReport(region, 0.0, f"{type(e).__name__}: {e}")
+
+    return [reports[region] for region in input_data]
@@ -0,0 +1,46 @@
+import unittest
+
+from benchmarks.run import compare
+from benchmarks.synthetic import generate_national_frame, generate_regional_frame
+from util.data_retrieval import RegionIndex, get_nation_data
+
+
+class SyntheticDataTest(unittest.TestCase) :
+
+    def test_regional_frame_matches_upstream_layout(self) :
+        data = generate_regional_frame(departments = 3, days = 10)
+
+        self.assertEqual(["dep", "jour", "P", "T", "cl_age90", "pop"], list(data.columns), "Layout should match")
+        self.assertEqual(3 * 10 * 11, len(data), "There should be one row per department, day and age class")
+
+        totals = data.loc[data["cl_age90"] == 0, "P"].to_numpy()
+        classes = data.loc[data["cl_age90"] != 0].groupby(["dep", "jour"], sort = True)["P"].sum().to_numpy()
+        self.assertEqual(list(totals), list(classes), "Class 0 should be the sum of the other classes")
+
+    def test_regional_frame_can_be_indexed(self) :
+        index = RegionIndex.from_regional(generate_regional_frame(departments = 3, days = 10))
+
+        self.assertEqual(["01", "02", "03"], sorted(index.list_regions()), "All departments should be indexed")
+        self.assertEqual((10, 2), index["02"].shape, "Each department should have one row per day")
+
+    def test_national_frame_can_be_reshaped(self) :
+        self.assertEqual((10, 2), get_nation_data(generate_national_frame(days = 10)).shape, "Shape should match")
+
+
+class CompareTest(unittest.TestCase) :
+
+    def setUp(self) -> None :
+        self.baseline = {"stages" : {"fit" : {"seconds" : 1.0, "peak_bytes" : 100}}}
+
+    def test_compare_accepts_results_within_tolerance(self) :
+        results = {"stages" : {"fit" : {"seconds" : 1.2, "peak_bytes" : 100}}}
+
+        self.assertEqual([], compare(results, self.baseline, 0.25), "Results within tolerance should pass")
+
+    def test_compare_reports_regressions(self) :
+        results = {"stages" : {"fit" : {"seconds" : 2.0, "peak_bytes" : 100}, "new" : {"seconds" : 1, "peak_bytes" : 1}}}
+
+        regressions = compare(results, self.baseline, 0.25)
+
+        self.assertEqual(1, len(regressions), "Slower stage should be reported")
+        self.assertTrue(regressions[0].startswith("fit seconds"), "Regression should name the stage and metric")
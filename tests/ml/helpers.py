@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from datetime import date
+from ml import SarimaxModel
+
+
+def make_series(periods : int) -> pd.Series :
+    """
+    Builds a daily series ending yesterday, with a weekly seasonality over a random walk.
+
+    :param periods: the number of days
+    :return: the series
+    """
+
+    rng = np.random.default_rng(0)
+    index = pd.date_range(end = pd.Timestamp(date.today()) - pd.Timedelta(days = 1), periods = periods, freq = "D")
+    values = 1000 + 100 * np.sin(np.arange(periods) * 2 * np.pi / 7) + rng.normal(0, 10, periods).cumsum()
+    return pd.Series(values, index = index)
+
+
+class WeeklySarimaxModel(SarimaxModel) :
+    """
+    A SARIMAX model with a weekly seasonality, which can be fitted on a few months of data.
+    """
+
+    def __init__(self, region : str) :
+        super(WeeklySarimaxModel, self).__init__(region, seasonal_order = (1, 1, 1, 7))
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from datetime import date, timedelta
+from unittest.mock import patch
+from ml import AgeClassModel, fit_age_classes
+from tests.ml.helpers import make_series
+from util.exceptions import InvalidDateError
+
+
+def make_classes() -> pd.DataFrame :
+    total = make_series(200)
+    return pd.DataFrame({"0" : total, "9" : total * 0.1, "19" : total * 0.2})
+
+
+class AgeClassModelTest(unittest.TestCase) :
+
+    @classmethod
+    def setUpClass(cls) -> None :
+        cls.data = make_classes()
+        cls.model = AgeClassModel("59", "ETS")
+        cls.model.fit(cls.data)
+
+    def test_fit_keeps_only_the_forecasts(self) :
+        self.assertEqual(["0", "9", "19"], self.model.age_classes, "Every age class should be forecast")
+        self.assertTrue(all(isinstance(value, pd.DataFrame) for value in self.model.model.values()),
+                        "Only the forecast arrays should be kept")
+
+    def test_predict_classes_slices_the_forecasts(self) :
+        start = date.today()
+        end = start + timedelta(days = 10)
+
+        prediction = self.model.predict_classes(start, end)
+        single = self.model.predict_classes(start, end, ["19"])
+
+        self.assertEqual((11, 3), prediction.shape, "Each day and age class should be predicted")
+        pd.testing.assert_series_equal(self.model.predict(start, end), prediction["0"], check_names = False)
+        self.assertEqual(["19"], list(single.columns), "Only the requested age class should be predicted")
+
+    def test_predict_interval_of_the_total(self) :
+        start = date.today()
+        intervals = self.model.predict_interval(start, start + timedelta(days = 10))
+
+        self.assertTrue((intervals["lower"] < self.model.predict(start, start + timedelta(days = 10))).all(),
+                        "Lower bound should be below the prediction")
+
+    def test_predict_outside_the_forecasts_is_refused(self) :
+        with pytest.raises(InvalidDateError) :
+            self.model.predict_classes(date.today() + timedelta(days = 1000))
+
+    def test_compact_artifact_round_trip(self) :
+        with tempfile.TemporaryDirectory() as model_dir, patch.dict(os.environ, {"MODEL_DIR" : model_dir}) :
+            self.model.save_compact()
+            loaded = AgeClassModel("59")
+            loaded.load_compact()
+
+        start = date.today()
+        pd.testing.assert_frame_equal(self.model.predict_classes(start), loaded.predict_classes(start),
+                                      check_freq = False)
+        self.assertEqual("ETS", loaded.engine, "Engine should be restored")
+
+    def test_fit_age_classes_saves_the_model(self) :
+        previous = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir :
+            os.chdir(tmp_dir)
+            try :
+                os.mkdir("updates")
+                with patch.dict(os.environ, {"MODEL_DIR" : "models", "AGE_CLASS_ENGINE" : "ETS"}) :
+                    report = fit_age_classes("59", self.data)
+                    loaded = AgeClassModel("59")
+                    loaded.load()
+            finally :
+                os.chdir(previous)
+
+        self.assertIsNone(report.error, "Fit should succeed")
+        self.assertEqual("age_classes", report.mode, "Fit should be reported as an age class fit")
+        np.testing.assert_allclose(self.model.model["forecasts"].values, loaded.model["forecasts"].values)
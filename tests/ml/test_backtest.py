@@ -0,0 +1,48 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from unittest.mock import patch
+
+from ml import SarimaxModel
+from ml.backtest import backtest, backtest_block, rolling_cutoffs
+from ml.registry import MODEL_ENGINES
+from tests.ml.helpers import WeeklySarimaxModel, make_series
+
+
+class BacktestTest(unittest.TestCase) :
+
+    @classmethod
+    def setUpClass(cls) -> None :
+        cls.data = make_series(150)
+
+    def test_rolling_cutoffs_leave_the_horizon(self) :
+        cutoffs = rolling_cutoffs(self.data, folds = 3, horizon = 14, step = 7)
+
+        self.assertEqual(self.data.index[-1] - pd.Timedelta(days = 14), cutoffs[-1], "Last origin should leave 14 days")
+        self.assertEqual([pd.Timedelta(days = 7)] * 2, [b - a for a, b in zip(cutoffs, cutoffs[1:])],
+                         "Origins should be 7 days apart")
+
+    def test_block_fits_once_and_filters_forward(self) :
+        cutoffs = rolling_cutoffs(self.data, folds = 4, horizon = 5, step = 3)
+
+        with patch.dict(MODEL_ENGINES, {"WEEKLY" : WeeklySarimaxModel}), \
+                patch.object(WeeklySarimaxModel, "fit", autospec = True, side_effect = SarimaxModel.fit) as fit :
+            errors, actuals = backtest_block("59", self.data, cutoffs, 5, "WEEKLY")
+
+        self.assertEqual(1, fit.call_count, "Later origins should reuse the fitted parameters")
+        self.assertEqual((4, 5), errors.shape, "Errors should be given per origin and horizon")
+        self.assertFalse(np.isnan(errors).any(), "Every horizon should be evaluated")
+        np.testing.assert_allclose(self.data.loc[cutoffs[0] + pd.Timedelta(days = 1):].iloc[:5].values, actuals[0])
+
+    def test_backtest_reports_each_region_and_horizon(self) :
+        reports = backtest({"59" : self.data, "62" : self.data * 2}, "ETS", folds = 4, horizon = 3, step = 2,
+                           refit_every = 2, workers = 2)
+
+        self.assertEqual([("59", 1), ("59", 2), ("59", 3), ("62", 1), ("62", 2), ("62", 3)],
+                         [(report.region, report.horizon) for report in reports], "Each horizon should be reported")
+        for report in reports :
+            self.assertEqual(4, report.folds, "Every origin should be evaluated")
+            self.assertGreater(report.mae, 0, "MAE should be measured")
+            self.assertLess(report.mape, 0.1, "MAPE should be a ratio")
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from datetime import date, timedelta
+from unittest.mock import patch
+from ml import ExpSmoothingModel, FourierArimaModel
+from ml.compare import compare_engines
+from ml.registry import MODEL_ENGINES
+from tests.ml.helpers import WeeklySarimaxModel, make_series
+
+
+class EnginesTest(unittest.TestCase) :
+
+    @classmethod
+    def setUpClass(cls) -> None :
+        cls.data = make_series(200)
+
+    def test_fourier_model_predicts_beyond_data(self) :
+        model = FourierArimaModel("59")
+        model.fit(self.data)
+
+        start = date.today() + timedelta(days = 150)
+        prediction = model.predict(start, start + timedelta(days = 3))
+
+        self.assertEqual(4, len(prediction), "Prediction should cover the date range")
+        self.assertFalse(prediction.isna().any(), "Prediction should not contain missing values")
+
+    def test_ets_model_fills_missing_days(self) :
+        data = self.data.copy()
+        data.iloc[50] = np.nan
+
+        model = ExpSmoothingModel("59")
+        model.fit(data)
+
+        self.assertEqual(11, len(model.predict(date.today(), date.today() + timedelta(days = 10))),
+                         "Prediction should cover the date range")
+
+    def test_engines_predict_intervals(self) :
+        for model in (ExpSmoothingModel("59"), FourierArimaModel("59")) :
+            model.fit(self.data)
+            start = date.today()
+            prediction = model.predict(start, start + timedelta(days = 30))
+            intervals = model.predict_interval(start, start + timedelta(days = 30))
+
+            self.assertTrue((intervals["lower"] < prediction).all(), f"{model.model_name} lower bound should be below")
+            self.assertTrue((intervals["upper"] > prediction).all(), f"{model.model_name} upper bound should be above")
+            self.assertGreater(intervals["upper"].iloc[-1] - intervals["lower"].iloc[-1],
+                               intervals["upper"].iloc[0] - intervals["lower"].iloc[0],
+                               f"{model.model_name} intervals should widen with the horizon")
+
+    def test_engines_without_compact_format_are_saved_with_joblib(self) :
+        previous = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir :
+            os.chdir(tmp_dir)
+            try :
+                os.mkdir("updates")
+                with patch.dict(os.environ, {"MODEL_DIR" : "models", "MODEL_FORMAT" : "compact"}) :
+                    for model in (ExpSmoothingModel("59"), FourierArimaModel("59")) :
+                        model.fit(self.data)
+                        model.save()
+                        loaded = type(model)("59")
+                        loaded.load()
+
+                        self.assertTrue(os.path.exists(f"{model.file_root}.joblib"), "Model should be saved with joblib")
+                        self.assertEqual(model.last_true_date, loaded.last_true_date, "Model should be loaded")
+            finally :
+                os.chdir(previous)
+
+    def test_compare_engines_reports_each_engine(self) :
+        reports = compare_engines(self.data, ["ETS", "FOURIER"], holdout = 14)
+
+        self.assertEqual(["ETS", "FOURIER"], [report.engine for report in reports], "Each engine should be reported")
+        for report in reports :
+            self.assertIsNone(report.error, "Engines should fit")
+            self.assertGreater(report.fit_seconds, 0, "Fit time should be measured")
+            self.assertGreater(report.peak_memory_bytes, 0, "Peak memory should be measured")
+            self.assertLess(report.mape, 0.5, "Engines should be reasonably accurate on a clean series")
+
+    def test_compare_engines_reports_sarimax_on_the_scale_of_the_data(self) :
+        with patch.dict(MODEL_ENGINES, {"WEEKLY" : WeeklySarimaxModel}) :
+            report, = compare_engines(self.data, ["WEEKLY"], holdout = 14)
+
+        self.assertIsNone(report.error, "Engine should fit")
+        self.assertLess(report.mape, 0.5, "Differenced forecasts should be integrated back before scoring")
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+import warnings
+
+import joblib
+import multiprocessing
+
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+from ml import SarimaxModel
+from ml.order_search import candidate_orders, load_spec, save_spec, search_order
+from tests.ml.helpers import make_series
+
+
+class OrderSearchTest(unittest.TestCase) :
+
+    def setUp(self) -> None :
+        self.previous = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+
+    def tearDown(self) -> None :
+        os.chdir(self.previous)
+        self.tmp_dir.cleanup()
+
+    def test_candidates_keep_the_differencing_orders(self) :
+        candidates = candidate_orders(7)
+
+        self.assertEqual(36, len(candidates), "Every combination should be a candidate")
+        self.assertEqual({(0, 1, 7)}, {(order[1], seasonal[1], seasonal[3]) for order, seasonal in candidates},
+                         "Differencing orders and period should be fixed")
+
+    def test_search_persists_the_best_candidate(self) :
+        candidates = [((0, 0, 0), (0, 1, 0, 7)), ((1, 0, 0), (1, 1, 1, 7)), ((2, 0, 1), (1, 1, 1, 7))]
+
+        report = search_order("59", make_series(120), candidates = candidates, workers = 2, keep = 2)
+
+        self.assertIsNone(report.error, "Search should succeed")
+        self.assertFalse(report.timed_out, "Search should finish within the budget")
+        self.assertEqual(1, report.pruned, "Worst candidate should be pruned")
+        self.assertEqual(5, report.evaluated, "Pruned candidates should not be fully fitted")
+        self.assertEqual((report.order, report.seasonal_order), load_spec("SARIMAX_59"), "Spec should be persisted")
+
+    def test_search_stops_at_the_budget(self) :
+        report = search_order("59", make_series(120), candidates = candidate_orders(7)[:2], workers = 1, budget = 0)
+
+        self.assertTrue(report.timed_out, "Search should stop at the budget")
+        self.assertIsNotNone(report.error, "No candidate should be evaluated")
+        self.assertIsNone(load_spec("SARIMAX_59"), "Nothing should be persisted")
+        self.assertEqual([], multiprocessing.active_children(), "Fits past the budget should be stopped")
+
+    def test_search_raises_pool_failures(self) :
+        with patch("ml.order_search._run_stage", side_effect = BrokenProcessPool("worker killed")) :
+            with self.assertRaises(BrokenProcessPool) :
+                search_order("59", make_series(120), candidates = candidate_orders(7)[:2], workers = 1)
+
+    def test_fit_reuses_persisted_spec(self) :
+        save_spec("SARIMAX_59", (2, 0, 0), (0, 1, 1, 7), 0.0)
+
+        model = SarimaxModel("59")
+        explicit = SarimaxModel("59", seasonal_order = (1, 1, 1, 7))
+        with warnings.catch_warnings() :
+            warnings.simplefilter("ignore")
+            model.fit(make_series(120))
+
+        self.assertEqual(((2, 0, 0), (0, 1, 1, 7)), (model.order, model.seasonal_order), "Spec should be reused")
+        self.assertFalse(explicit.searchable, "Explicit specifications should not be replaced")
+
+    def test_load_restores_the_searched_spec(self) :
+        save_spec("SARIMAX_59", (2, 0, 0), (0, 1, 1, 7), 0.0)
+        data = make_series(120)
+        os.mkdir("updates")
+
+        with patch.dict(os.environ, {"MODEL_DIR" : "models", "MODEL_FORMAT" : "joblib"}), \
+                warnings.catch_warnings() :
+            warnings.simplefilter("ignore")
+            model = SarimaxModel("59")
+            model.fit(data.iloc[:-2])
+            model.save()
+
+            loaded = SarimaxModel("59")
+            loaded.load()
+            loaded.extend(data)
+
+            # Artifacts holding the fitted results only
+            joblib.dump(model.model, "SARIMAX_59.joblib")
+            legacy = SarimaxModel("59")
+            legacy.load()
+
+        self.assertEqual(((2, 0, 0), (0, 1, 1, 7)), (loaded.order, loaded.seasonal_order), "Spec should be restored")
+        self.assertEqual(data.index[-1].to_pydatetime(), loaded.last_true_date, "Model should be extended")
+        self.assertEqual(((2, 0, 0), (0, 1, 1, 7)), (legacy.order, legacy.seasonal_order),
+                         "Spec should be read from the results")
@@ -0,0 +1,30 @@
+import os
+import unittest
+
+import pytest
+
+from unittest.mock import patch
+from ml import ExpSmoothingModel, FourierArimaModel, SarimaxModel
+from ml.registry import create_model, engine_for
+
+
+class RegistryTest(unittest.TestCase) :
+
+    def test_default_engine_is_sarimax(self) :
+        with patch.dict(os.environ, {"MODEL_ENGINES" : "", "MODEL_ENGINE" : "SARIMAX"}) :
+            self.assertIsInstance(create_model("59"), SarimaxModel, "Default engine should be SARIMAX")
+
+    def test_engine_is_selected_per_region(self) :
+        with patch.dict(os.environ, {"MODEL_ENGINES" : "59:ETS, 62:FOURIER", "MODEL_ENGINE" : "SARIMAX"}) :
+            self.assertEqual("ETS", engine_for("59"), "Region engine should be read from configuration")
+            self.assertIsInstance(create_model("59"), ExpSmoothingModel, "Region 59 should use ETS")
+            self.assertIsInstance(create_model("62"), FourierArimaModel, "Region 62 should use FOURIER")
+            self.assertIsInstance(create_model("FRA"), SarimaxModel, "Other regions should use the default")
+
+    def test_engines_have_distinct_file_roots(self) :
+        self.assertNotEqual(create_model("59", "ETS").file_root, create_model("59", "SARIMAX").file_root,
+                            "Engines should not overwrite each other's models")
+
+    def test_unknown_engine_raises(self) :
+        with pytest.raises(KeyError) :
+            create_model("59", "UNKNOWN")
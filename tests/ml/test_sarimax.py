@@ -0,0 +1,279 @@
+import mmap
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+
+from datetime import date, timedelta
+from unittest.mock import patch
+from ml import SarimaxModel
+from tests.ml.helpers import make_series
+from util.exceptions import InvalidDateError, UnfittedModelError
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SarimaxModelTest(unittest.TestCase) :
+
+    @classmethod
+    def setUpClass(cls) -> None :
+        cls.data = make_series(120)
+        cls.model = SarimaxModel("59", seasonal_order = (1, 1, 1, 7))
+        with warnings.catch_warnings() :
+            warnings.simplefilter("ignore")
+            cls.model.fit(cls.data)
+
+    def test_fit_precomputes_forecast(self) :
+        forecast = self.model.forecast
+
+        self.assertIsNotNone(forecast, "Forecast should be computed at fit time")
+        self.assertLessEqual(forecast.index[0], pd.Timestamp(date.today() - timedelta(days = 3)),
+                             "Forecast should cover the days behind")
+        self.assertGreaterEqual(forecast.index[-1], pd.Timestamp(date.today() + timedelta(days = 90)),
+                                "Forecast should cover the days ahead")
+
+    def test_predict_slices_forecast(self) :
+        start = date.today()
+        end = date.today() + timedelta(days = 10)
+
+        prediction = self.model.predict(start, end)
+        expected = self.model._predict(pd.Timestamp(start), pd.Timestamp(end))
+
+        self.assertEqual(11, len(prediction), "Prediction should cover the date range")
+        np.testing.assert_allclose(expected.values, prediction.values)
+
+    def test_predict_outside_forecast_falls_back_to_model(self) :
+        start = date.today() + timedelta(days = 200)
+
+        prediction = self.model.predict(start, start + timedelta(days = 2))
+
+        self.assertEqual(pd.Timestamp(start), prediction.index[0], "Prediction should start at the start date")
+        self.assertEqual(3, len(prediction), "Prediction should cover the date range")
+
+    def test_predict_defaults_to_five_days(self) :
+        self.assertEqual(6, len(self.model.predict(date.today())), "Prediction should default to 5 days after start")
+
+    def test_predict_rejects_reversed_dates(self) :
+        with pytest.raises(InvalidDateError) :
+            self.model.predict(date.today(), date.today() - timedelta(days = 1))
+
+    def test_predict_requires_fitted_model(self) :
+        with pytest.raises(UnfittedModelError) :
+            SarimaxModel("62").predict(date.today(), date.today())
+
+    def test_compact_artifact_round_trip(self) :
+        with tempfile.TemporaryDirectory() as model_dir, patch.dict(os.environ, {"MODEL_DIR" : model_dir}) :
+            self.model.save_compact()
+
+            loaded = SarimaxModel("59")
+            loaded.load()
+
+        self.assertTrue(loaded.is_fitted, "Loaded model should be fitted")
+        self.assertEqual((1, 1, 1, 7), loaded.seasonal_order, "Specification should be restored")
+        self.assertEqual(self.model.last_true_date, loaded.last_true_date, "Last true date should be restored")
+        self.assertIsNone(loaded.model, "State space model should not be rebuilt on load")
+
+        start = date.today()
+        np.testing.assert_allclose(self.model.predict(start, start + timedelta(days = 5)).values,
+                                   loaded.predict(start, start + timedelta(days = 5)).values)
+
+        start = date.today() + timedelta(days = 200)
+        np.testing.assert_allclose(self.model.predict(start, start + timedelta(days = 5)).values,
+                                   loaded.predict(start, start + timedelta(days = 5)).values)
+        np.testing.assert_allclose(self.model.predict_interval(start, start + timedelta(days = 5)).values,
+                                   loaded.predict_interval(start, start + timedelta(days = 5)).values)
+        np.testing.assert_allclose(self.model.forecast_std.values, loaded.forecast_std.values)
+
+    def test_compact_inference_does_not_import_statsmodels(self) :
+        script = ("import sys; from datetime import date; from ml import SarimaxModel; "
+                  "model = SarimaxModel('59'); model.load(); model.predict(date.today()); "
+                  "print('statsmodels' in sys.modules)")
+
+        with tempfile.TemporaryDirectory() as model_dir, patch.dict(os.environ, {"MODEL_DIR" : model_dir}) :
+            self.model.save_compact()
+            output = subprocess.run([sys.executable, "-c", script], capture_output = True, text = True, check = True,
+                                    env = dict(os.environ, PYTHONPATH = ROOT)).stdout
+
+        self.assertEqual("False", output.strip(), "Serving a compact model should not import statsmodels")
+
+    def test_predict_interval_is_served_from_precomputed_std(self) :
+        start = date.today()
+        end = start + timedelta(days = 10)
+
+        intervals = self.model.predict_interval(start, end, level = 0.8)
+        std = self.model._predict_std(pd.Timestamp(start), pd.Timestamp(end))
+        prediction = self.model.predict(start, end)
+
+        np.testing.assert_allclose((prediction + 1.2815515655446004 * std).values, intervals["upper"].values)
+        self.assertTrue((self.model.predict_interval(start, end)["upper"] > intervals["upper"]).all(),
+                        "Wider level should give wider intervals")
+
+    def test_precompute_runs_a_single_prediction(self) :
+        results = self.model.model
+        with patch.object(results, "get_prediction", wraps = results.get_prediction) as get_prediction :
+            self.model.precompute_forecast()
+
+        self.assertEqual(1, get_prediction.call_count, "Forecast and std should come from one prediction")
+        start, end = self.model.forecast.index[0], self.model.forecast.index[-1]
+        np.testing.assert_allclose(results.predict(start = start, end = end).values, self.model.forecast.values)
+        np.testing.assert_allclose(results.get_prediction(start = start, end = end).se_mean.values,
+                                   self.model.forecast_std.values)
+
+    def test_compact_saves_are_versioned(self) :
+        with tempfile.TemporaryDirectory() as model_dir, patch.dict(os.environ, {"MODEL_DIR" : model_dir}) :
+            loaded = SarimaxModel("59")
+            self.assertIsNone(loaded.artifact_version(), "Missing artifact should have no version")
+
+            versions = []
+            for _ in range(3) :
+                self.model.save_compact()
+                versions.append(self.model.artifact_version())
+
+            loaded.load()
+            kept = sorted(path.name for path in self.model.compact_path.iterdir() if path.is_dir())
+
+        self.assertEqual(3, len(set(versions)), "Each save should publish a new version")
+        self.assertEqual(versions[-1], loaded.version, "Latest version should be loaded")
+        self.assertEqual(sorted(versions[1:]), kept, "Only the current and previous versions should be kept")
+
+    def test_newer_joblib_artifact_replaces_compact_one(self) :
+        previous = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir :
+            os.chdir(tmp_dir)
+            try :
+                os.mkdir("updates")
+                with patch.dict(os.environ, {"MODEL_DIR" : "models", "MODEL_FORMAT" : "compact"}) :
+                    self.model.save()
+                    compact_version = self.model.artifact_version()
+
+                newer = SarimaxModel("59", seasonal_order = (1, 1, 1, 7))
+                with warnings.catch_warnings() :
+                    warnings.simplefilter("ignore")
+                    newer.fit(self.data.iloc[:-10])
+                with patch.dict(os.environ, {"MODEL_DIR" : "models", "MODEL_FORMAT" : "joblib"}) :
+                    newer.save()
+                    loaded = SarimaxModel("59")
+                    loaded.load()
+                    joblib_version = loaded.artifact_version()
+            finally :
+                os.chdir(previous)
+
+        self.assertEqual(newer.last_true_date, loaded.last_true_date, "Newest artifact should be loaded")
+        self.assertNotEqual(compact_version, joblib_version, "Version should follow the newest artifact")
+
+    def test_shared_store_converts_joblib_artifacts(self) :
+        previous = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir :
+            os.chdir(tmp_dir)
+            try :
+                os.mkdir("updates")
+                with patch.dict(os.environ, {"MODEL_DIR" : "models", "MODEL_FORMAT" : "joblib"}) :
+                    self.model.save()
+                    self.assertFalse(self.model._has_compact(), "Private store should only write joblib")
+
+                with patch.dict(os.environ, {"MODEL_DIR" : "models", "MODEL_STORE" : "shared"}) :
+                    converted = SarimaxModel("59", seasonal_order = (1, 1, 1, 7))
+                    converted.load()
+                    loaded = SarimaxModel("59")
+                    loaded.load()
+            finally :
+                os.chdir(previous)
+
+        self.assertIsNone(converted.model, "Converting worker should drop its private copy")
+        self.assertEqual(converted.version, loaded.version, "Other workers should map the converted artifact")
+        self.assertIsInstance(loaded.forecast.values.base, mmap.mmap, "Forecast should be memory-mapped")
+
+        start = date.today()
+        np.testing.assert_allclose(self.model.predict(start, start + timedelta(days = 5)).values,
+                                   loaded.predict(start, start + timedelta(days = 5)).values)
+
+    def test_extend_matches_filtering_the_whole_series(self) :
+        model = SarimaxModel("59", seasonal_order = (1, 1, 1, 7))
+        with warnings.catch_warnings() :
+            warnings.simplefilter("ignore")
+            model.fit(self.data.iloc[:-10])
+        params = model.state["params"]
+
+        drift = model.extend(self.data)
+
+        reference = sm.tsa.statespace.SARIMAX(self.data, order = (1, 0, 0), trend = "c",
+                                              seasonal_order = (1, 1, 1, 7), simple_differencing = True)
+        reference = reference.filter(params)
+
+        self.assertEqual(self.data.index[-1].to_pydatetime(), model.last_true_date, "Last true date should move")
+        self.assertGreater(drift, 0, "Drift should be measured on the new observations")
+
+        start = self.data.index[-1] + pd.Timedelta(days = 1)
+        end = start + pd.Timedelta(days = 20)
+        np.testing.assert_allclose(reference.predict(start = start, end = end).values,
+                                   model.predict(start.date(), end.date()).values)
+
+    def test_predict_levels_integrates_the_differences(self) :
+        model = SarimaxModel("59", order = (1, 1, 0), seasonal_order = (1, 1, 1, 7))
+        with warnings.catch_warnings() :
+            warnings.simplefilter("ignore")
+            model.fit(self.data.iloc[:-14])
+        holdout = self.data.iloc[-14:]
+        start, end = holdout.index[0].date(), holdout.index[-1].date()
+
+        levels = model.predict_levels(start, end)
+        differences = sm.tsa.statespace.tools.diff(pd.concat([self.data.iloc[:-14], levels]),
+                                                   k_diff = 1, k_seasonal_diff = 1, seasonal_periods = 7)
+
+        np.testing.assert_allclose(model.predict(start, end).values, differences.iloc[-14:].values)
+        self.assertLess((np.abs(levels - holdout) / holdout).mean(), 0.05, "Levels should be on the scale of the data")
+        with pytest.raises(InvalidDateError) :
+            model.predict_levels(start - timedelta(days = 1), end)
+
+    def test_consecutive_extensions_survive_joblib_saves(self) :
+        model = SarimaxModel("59", seasonal_order = (1, 1, 1, 7))
+        with warnings.catch_warnings() :
+            warnings.simplefilter("ignore")
+            model.fit(self.data.iloc[:-3])
+        params = model.state["params"]
+
+        previous = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir :
+            os.chdir(tmp_dir)
+            try :
+                os.mkdir("updates")
+                with patch.dict(os.environ, {"MODEL_DIR" : "models", "MODEL_FORMAT" : "joblib"}) :
+                    model.save()
+                    for end in (-2, -1, None) :
+                        model = SarimaxModel("59", seasonal_order = (1, 1, 1, 7))
+                        model.load()
+                        model.extend(self.data.iloc[:end])
+                        model.save()
+
+                    loaded = SarimaxModel("59", seasonal_order = (1, 1, 1, 7))
+                    loaded.load()
+            finally :
+                os.chdir(previous)
+
+        reference = sm.tsa.statespace.SARIMAX(self.data, order = (1, 0, 0), trend = "c",
+                                              seasonal_order = (1, 1, 1, 7), simple_differencing = True)
+        reference = reference.filter(params)
+
+        np.testing.assert_allclose(self.data.iloc[-7:].values, loaded.state["tail"], err_msg = "Tail should stay raw")
+        start = self.data.index[-1] + pd.Timedelta(days = 1)
+        end = start + pd.Timedelta(days = 20)
+        np.testing.assert_allclose(reference.predict(start = start, end = end).values,
+                                   loaded.predict(start.date(), end.date()).values)
+
+    def test_extend_without_new_data_keeps_model(self) :
+        model = SarimaxModel("59", seasonal_order = (1, 1, 1, 7))
+        with warnings.catch_warnings() :
+            warnings.simplefilter("ignore")
+            model.fit(self.data)
+        last_true_date = model.last_true_date
+
+        self.assertEqual(0.0, model.extend(self.data), "No new data should not drift")
+        self.assertEqual(last_true_date, model.last_true_date, "Last true date should not move")
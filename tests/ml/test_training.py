@@ -0,0 +1,96 @@
+import unittest
+
+import pandas as pd
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from ml.training import fit_region, fit_regions, update_region
+
+
+class TrainingTest(unittest.TestCase) :
+
+    def setUp(self) -> None :
+        index = pd.date_range("2022-01-01", periods = 10, freq = "D")
+        self.data = pd.Series(range(10), index = index)
+
+    def test_fit_region_fits_and_saves(self) :
+        with patch("ml.training.create_model") as mocked_model :
+            report = fit_region("59", self.data)
+
+        mocked_model.assert_called_once_with("59")
+        mocked_model.return_value.fit.assert_called_once()
+        mocked_model.return_value.save.assert_called_once()
+        self.assertIsNone(report.error, "Successful fit should not report an error")
+
+    def test_fit_region_reports_failures(self) :
+        with patch("ml.training.create_model") as mocked_model :
+            mocked_model.return_value.fit.side_effect = ValueError("not enough data")
+            report = fit_region("59", self.data)
+
+        self.assertEqual("ValueError: not enough data", report.error, "Failure should be reported")
+        mocked_model.return_value.save.assert_not_called()
+
+    def test_fit_regions_keeps_input_order(self) :
+        with patch("ml.training.create_model") :
+            reports = fit_regions({"62" : self.data, "59" : self.data}, isolated = False)
+
+        self.assertEqual(["62", "59"], [report.region for report in reports], "Reports should follow input order")
+
+    def test_update_region_extends_saved_model(self) :
+        with patch("ml.training.create_model") as mocked_model :
+            model = mocked_model.return_value
+            model.last_full_fit = datetime.now()
+            model.extend.side_effect = lambda data : setattr(model, "last_true_date", datetime.now()) or 0.5
+            report = update_region("59", self.data)
+
+        self.assertEqual("incremental", report.mode, "Model should be extended")
+        model.fit.assert_not_called()
+        model.save.assert_called_once()
+
+    def test_update_region_refits_when_drifting(self) :
+        with patch("ml.training.create_model") as mocked_model :
+            model = mocked_model.return_value
+            model.last_full_fit = datetime.now()
+            model.extend.return_value = 10.0
+            report = update_region("59", self.data)
+
+        self.assertEqual("full", report.mode, "Drifting model should be refitted")
+        model.fit.assert_called_once()
+
+    def test_update_region_refits_on_schedule(self) :
+        with patch("ml.training.create_model") as mocked_model :
+            model = mocked_model.return_value
+            model.last_full_fit = datetime.now() - timedelta(days = 30)
+            report = update_region("59", self.data)
+
+        self.assertEqual("full", report.mode, "Model should be refitted when a full fit is due")
+        model.extend.assert_not_called()
+
+    def test_update_region_fits_missing_model(self) :
+        with patch("ml.training.create_model") as mocked_model :
+            mocked_model.return_value.load.side_effect = FileNotFoundError("no model")
+            report = update_region("59", self.data)
+
+        self.assertEqual("full", report.mode, "Missing model should be fitted")
+        mocked_model.return_value.fit.assert_called_once()
+
+    def test_update_region_refits_engines_without_extension(self) :
+        with patch("ml.training.create_model") as mocked_model :
+            model = mocked_model.return_value
+            model.last_full_fit = datetime.now()
+            model.extend.side_effect = NotImplementedError("no extension")
+            report = update_region("59", self.data)
+
+        self.assertEqual("full", report.mode, "Engines without extension should be refitted")
+        model.fit.assert_called_once()
+
+    def test_update_region_refits_when_the_update_fails(self) :
+        with patch("ml.training.create_model") as mocked_model :
+            model = mocked_model.return_value
+            model.last_full_fit = datetime.now()
+            model.extend.side_effect = ValueError("Length of values (0) does not match length of index (1)")
+            report = update_region("59", self.data)
+
+        self.assertEqual("fallback", report.mode, "Failed update should fall back to a full fit")
+        self.assertIsNone(report.error, "Full fit should succeed")
+        model.fit.assert_called_once()
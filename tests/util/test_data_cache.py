@@ -0,0 +1,120 @@
+import tempfile
+import threading
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from util.data_cache import DataCache
+
+
+class DataCacheTest(unittest.TestCase) :
+
+    def setUp(self) -> None :
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        with open("data/test_nation_df.csv", "rb") as f :
+            self.payload = f.read()
+
+    def tearDown(self) -> None :
+        self.tmp_dir.cleanup()
+
+    def mock_response(self, mocked_get, status_code : int = 200) :
+        mocked_get.return_value.status_code = status_code
+        mocked_get.return_value.headers = {"ETag" : "\"v1\"", "Last-Modified" : "Wed, 12 Jan 2022 10:00:00 GMT"}
+        mocked_get.return_value.iter_content.return_value = [self.payload[:100], self.payload[100:]]
+
+    def test_first_fetch_is_a_miss(self) :
+        cache = DataCache(self.tmp_dir.name, 3600)
+        with patch("util.data_cache.requests.Session.request") as mocked_get :
+            self.mock_response(mocked_get)
+            entry = cache.fetch("https://localhost/data.csv")
+
+        with open(entry.path, "rb") as f :
+            self.assertEqual(self.payload, f.read(), "Payload should be stored on disk")
+        self.assertEqual("\"v1\"", entry.etag, "ETag should be stored")
+        self.assertEqual(1, cache.misses, "First fetch should be a miss")
+
+    def test_fresh_entry_skips_network(self) :
+        cache = DataCache(self.tmp_dir.name, 3600)
+        with patch("util.data_cache.requests.Session.request") as mocked_get :
+            self.mock_response(mocked_get)
+            cache.fetch("https://localhost/data.csv")
+            cache.fetch("https://localhost/data.csv")
+
+            self.assertEqual(1, mocked_get.call_count, "Fresh entry should not hit the network")
+        self.assertEqual(1, cache.hits, "Second fetch should be a hit")
+
+    def test_stale_entry_sends_conditional_request(self) :
+        cache = DataCache(self.tmp_dir.name, 0)
+        with patch("util.data_cache.requests.Session.request") as mocked_get :
+            self.mock_response(mocked_get)
+            first = cache.fetch("https://localhost/data.csv")
+
+            self.mock_response(mocked_get, status_code = 304)
+            second = cache.fetch("https://localhost/data.csv")
+
+            headers = mocked_get.call_args.kwargs["headers"]
+        self.assertEqual("\"v1\"", headers["If-None-Match"], "ETag should be sent back")
+        self.assertEqual(first.path, second.path, "Cached payload should be reused")
+        self.assertEqual(1, cache.revalidated, "304 should count as a revalidation")
+
+    def test_responses_are_closed(self) :
+        cache = DataCache(self.tmp_dir.name, 0)
+        with patch("util.data_cache.requests.Session.request") as mocked_get :
+            self.mock_response(mocked_get)
+            cache.fetch("https://localhost/data.csv")
+            self.mock_response(mocked_get, status_code = 304)
+            cache.fetch("https://localhost/data.csv")
+            self.mock_response(mocked_get, status_code = 500)
+            mocked_get.return_value.raise_for_status.side_effect = RuntimeError("server error")
+            with self.assertRaises(RuntimeError) :
+                cache.fetch("https://localhost/data.csv")
+
+            self.assertEqual(3, mocked_get.return_value.close.call_count, "Every response should be closed")
+
+    def test_stats_reports_hit_rate(self) :
+        cache = DataCache(self.tmp_dir.name, 3600)
+        with patch("util.data_cache.requests.Session.request") as mocked_get :
+            self.mock_response(mocked_get)
+            for _ in range(4) :
+                cache.fetch("https://localhost/data.csv")
+
+        self.assertEqual(0.75, cache.stats()["hit_rate"], "Hit rate should account for misses")
+
+    def test_requests_use_a_timeout(self) :
+        cache = DataCache(self.tmp_dir.name, 3600, timeout = 5)
+        with patch("util.data_cache.requests.Session.request") as mocked_get :
+            self.mock_response(mocked_get)
+            cache.fetch("https://localhost/data.csv")
+
+        self.assertEqual(5, mocked_get.call_args.kwargs["timeout"], "Timeout should be passed")
+
+    def test_session_retries_server_errors(self) :
+        adapter = DataCache(self.tmp_dir.name, 3600, retries = 2).session.get_adapter("https://localhost/data.csv")
+
+        self.assertEqual(2, adapter.max_retries.total, "Retries should be bounded")
+        self.assertIn(503, adapter.max_retries.status_forcelist, "Unavailable upstream should be retried")
+
+    def test_concurrent_fetches_are_coalesced(self) :
+        cache = DataCache(self.tmp_dir.name, 3600)
+        release = threading.Event()
+
+        with patch("util.data_cache.requests.Session.request") as mocked_get :
+            self.mock_response(mocked_get)
+            response = mocked_get.return_value
+
+            def slow_request(*args, **kwargs) :
+                release.wait()
+                return response
+
+            mocked_get.side_effect = slow_request
+
+            with ThreadPoolExecutor(4) as pool :
+                futures = [pool.submit(cache.fetch, "https://localhost/data.csv") for _ in range(4)]
+                while cache.coalesced < 3 :
+                    time.sleep(0.01)
+                release.set()
+                entries = [future.result() for future in futures]
+
+            self.assertEqual(1, mocked_get.call_count, "Payload should be downloaded once")
+        self.assertTrue(all(entry == entries[0] for entry in entries), "All callers should share the entry")
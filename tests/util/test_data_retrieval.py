@@ -1,9 +1,13 @@
+import tempfile
 import unittest
 
 import pandas as pd
 
 from unittest.mock import patch
-from util.data_retrieval import fetch_data, get_nation_data, get_region_data
+from util.data_cache import DataCache
+from util.data_retrieval import fetch_age_classes, fetch_data, fetch_index, fetch_series, get_age_class_data, \
+    get_nation_data, get_region_data, RegionIndex, NATION_SCHEMA, REGION_SCHEMA
+from util.series_store import SeriesStore
 
 
 class DataRetrievalTest(unittest.TestCase) :
@@ -13,14 +17,35 @@ class DataRetrievalTest(unittest.TestCase) :
         self.region_df = pd.read_csv("data/test_region_df.csv", index_col = 0, dtype = {"dep" : "object"}, sep = ";")
 
     def test_fetch_data_returns_dataframe(self) :
-        with patch("util.data_retrieval.requests.request") as mocked_get :
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                patch("util.data_retrieval.DATA_CACHE", DataCache(cache_dir, 3600)), \
+                patch("util.data_cache.requests.Session.request") as mocked_get :
             with open("data/test_nation_df.csv", "rb") as f :
                 data = f.read()
-            mocked_get.return_value.content = data
+            mocked_get.return_value.status_code = 200
+            mocked_get.return_value.headers = {}
+            mocked_get.return_value.iter_content.return_value = [data]
 
             df = fetch_data("https://localhost")
             self.assertEqual((33, 11), df.shape, "Shape should match")
 
+    def test_fetch_data_applies_schema(self) :
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                patch("util.data_retrieval.DATA_CACHE", DataCache(cache_dir, 3600)), \
+                patch("util.data_cache.requests.Session.request") as mocked_get :
+            with open("data/test_region_df.csv", "rb") as f :
+                data = f.read()
+            mocked_get.return_value.status_code = 200
+            mocked_get.return_value.headers = {}
+            mocked_get.return_value.iter_content.return_value = [data]
+
+            df = fetch_data("https://localhost", REGION_SCHEMA)
+
+        self.assertEqual(list(REGION_SCHEMA.usecols), list(df.columns), "Only schema columns should be read")
+        self.assertEqual("category", df["dep"].dtype.name, "Departments should be categorical")
+        self.assertTrue(pd.api.types.is_datetime64_dtype(df["jour"]), "Days should be parsed as dates")
+        self.assertEqual((7, 2), get_region_data(df, ["01"])["01"].shape, "Typed data should be reshaped the same way")
+
     def test_get_region_data_filters_region(self) :
         region_data = get_region_data(self.region_df, ["01"])
         region_data = region_data["01"]
@@ -37,4 +62,80 @@ class DataRetrievalTest(unittest.TestCase) :
 
         self.assertEqual((3, 2), nation_data.shape, "Returned shape should only contain one region")
 
+    def test_region_index_partitions_all_regions(self) :
+        index = RegionIndex.from_regional(self.region_df)
+
+        self.assertTrue("01" in index, "Index should contain region 01")
+        self.assertTrue("02" in index, "Index should contain region 02")
+        self.assertEqual((7, 2), index["01"].shape, "Indexed frame should only contain one region")
+        self.assertEqual("D", index["01"].index.freqstr, "Indexed frame should have a daily frequency")
+
+    def test_get_age_class_data_partitions_regions(self) :
+        index = RegionIndex.from_regional(self.region_df)
+        age_classes = get_age_class_data(self.region_df)
+
+        self.assertEqual(["0", "9", "19", "29", "39", "49", "59", "69", "79", "89", "90"],
+                         list(age_classes["01"].columns), "Each age class should be a column")
+        self.assertEqual(index["01"].index.tolist(), age_classes["01"].index.tolist(), "Dates should match the region")
+        self.assertEqual(index["01"]["P"].tolist(), age_classes["01"]["0"].tolist(), "Class 0 should be the total")
+
+    def test_fetch_age_classes_of_the_national_data(self) :
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                patch("util.data_retrieval.DATA_CACHE", DataCache(cache_dir, 3600)), \
+                patch("util.data_cache.requests.Session.request") as mocked_get :
+            with open("data/test_nation_df.csv", "rb") as f :
+                data = f.read()
+            mocked_get.return_value.status_code = 200
+            mocked_get.return_value.headers = {}
+            mocked_get.return_value.iter_content.return_value = [data]
+
+            index = fetch_index("https://localhost/nation", NATION_SCHEMA, national = True)
+            age_classes = fetch_age_classes("https://localhost/nation", NATION_SCHEMA, national = True)
+
+        self.assertEqual(["FRA"], list(age_classes), "National data should be a single region")
+        self.assertEqual((3, 11), age_classes["FRA"].shape, "Each day and age class should be kept")
+        self.assertEqual(index["FRA"]["P"].tolist(), age_classes["FRA"]["0"].tolist(), "Class 0 should be the total")
+
+    def test_get_region_data_accepts_index(self) :
+        index = RegionIndex.from_regional(self.region_df)
+        region_data = get_region_data(index, ["01", "02"])
+
+        self.assertIs(index["01"], region_data["01"], "Frames should be served from the index")
+        self.assertEqual((3, 2), region_data["02"].shape, "Returned shape should only contain one region")
+
+    def test_fetch_index_is_built_once_per_version(self) :
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                patch("util.data_retrieval.DATA_CACHE", DataCache(cache_dir, 3600)), \
+                patch("util.data_cache.requests.Session.request") as mocked_get :
+            with open("data/test_region_df.csv", "rb") as f :
+                data = f.read()
+            mocked_get.return_value.status_code = 200
+            mocked_get.return_value.headers = {"ETag" : "\"v1\""}
+            mocked_get.return_value.iter_content.return_value = [data]
+
+            first = fetch_index("https://localhost/index", REGION_SCHEMA)
+            second = fetch_index("https://localhost/index", REGION_SCHEMA)
+
+        self.assertIs(first, second, "Index should be reused for the same dataset version")
+
+    def test_fetch_series_ingests_each_version_once(self) :
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                patch("util.data_retrieval.DATA_CACHE", DataCache(cache_dir, 3600)), \
+                patch("util.data_retrieval.SERIES_STORE", SeriesStore(f"{cache_dir}/series.db")), \
+                patch("util.data_retrieval.fetch_index", wraps = fetch_index) as mocked_index, \
+                patch("util.data_cache.requests.Session.request") as mocked_get :
+            with open("data/test_region_df.csv", "rb") as f :
+                data = f.read()
+            mocked_get.return_value.status_code = 200
+            mocked_get.return_value.headers = {"ETag" : "\"series\""}
+            mocked_get.return_value.iter_content.return_value = [data]
+
+            expected = fetch_index("https://localhost/series", REGION_SCHEMA)["01"]
+            full = fetch_series("https://localhost/series", REGION_SCHEMA, "01")
+            sliced = fetch_series("https://localhost/series", REGION_SCHEMA, "01",
+                                  expected.index[1].date(), expected.index[1].date())
 
+        self.assertEqual(1, mocked_index.call_count, "Payload should only be ingested once")
+        self.assertEqual(expected.index.tolist(), full.index.tolist(), "Every day should be stored")
+        self.assertEqual(expected["P"].tolist(), full["P"].tolist(), "Cases should be stored")
+        self.assertEqual([expected.index[1]], sliced.index.tolist(), "Only the range should be read")
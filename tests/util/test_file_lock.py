@@ -0,0 +1,30 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from util.file_lock import host_lock
+
+
+class FileLockTest(unittest.TestCase) :
+
+    def test_lock_is_exclusive(self) :
+        with tempfile.TemporaryDirectory() as tmp_dir :
+            path = os.path.join(tmp_dir, "locks", "model.lock")
+            events = []
+
+            def contender() :
+                with host_lock(path) :
+                    events.append("contender")
+
+            with host_lock(path) :
+                thread = threading.Thread(target = contender)
+                thread.start()
+                time.sleep(0.1)
+                events.append("holder")
+
+            thread.join(5)
+
+            self.assertEqual(["holder", "contender"], events, "Lock should be held until released")
+            self.assertTrue(os.path.exists(path), "Lock file should be created")
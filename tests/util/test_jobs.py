@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+
+from util.jobs import JobQueue, JobStatus
+
+
+class JobQueueTest(unittest.TestCase) :
+
+    def setUp(self) -> None :
+        self.queue = JobQueue(1)
+
+    def tearDown(self) -> None :
+        self.queue.shutdown()
+
+    def test_submit_returns_before_job_runs(self) :
+        release = threading.Event()
+        job = self.queue.submit("test", release.wait)
+
+        self.assertIn(job.status, (JobStatus.PENDING, JobStatus.RUNNING), "Job should not be finished yet")
+        self.assertIs(job, self.queue.get_job(job.id), "Job should be retrievable by id")
+
+        release.set()
+
+    def test_job_result_is_stored(self) :
+        job = self.queue.submit("test", lambda x : x * 2, 21)
+        self.queue.shutdown()
+
+        self.assertEqual(JobStatus.DONE, job.status, "Job should be done")
+        self.assertEqual(42, job.result, "Result should be stored")
+        self.assertIsNotNone(job.finished_at, "Finish time should be set")
+
+    def test_job_failure_is_reported(self) :
+        def fail() :
+            raise ValueError("boom")
+
+        job = self.queue.submit("test", fail)
+        self.queue.shutdown()
+
+        self.assertEqual(JobStatus.FAILED, job.status, "Job should have failed")
+        self.assertEqual("ValueError: boom", job.error, "Error should be reported")
+
+    def test_get_job_returns_none_if_no_job(self) :
+        self.assertIsNone(self.queue.get_job("unknown"), "Unknown job should not be found")
+
+    def test_history_is_bounded(self) :
+        queue = JobQueue(1, max_history = 2)
+        for _ in range(5) :
+            job = queue.submit("test", lambda : None)
+            while job.finished_at is None :
+                time.sleep(0.01)
+        queue.shutdown()
+
+        self.assertEqual(2, len(queue.jobs), "Oldest finished jobs should be forgotten")
+        self.assertIn(job.id, queue.jobs, "Latest job should be kept")
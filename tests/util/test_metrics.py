@@ -0,0 +1,66 @@
+import unittest
+
+from util.metrics import MetricsRegistry, STAGE_SECONDS, server_timing_header, start_request_timings, timed
+
+
+class MetricsTest(unittest.TestCase) :
+
+    def test_histogram_renders_cumulative_buckets(self) :
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "Test histogram", ["stage"])
+        histogram.observe(0.003, stage = "parse")
+        histogram.observe(2.0, stage = "parse")
+
+        text = registry.render()
+
+        self.assertIn('test_seconds_bucket{stage="parse",le="0.005"} 1', text, "Bucket should be cumulative")
+        self.assertIn('test_seconds_bucket{stage="parse",le="+Inf"} 2', text, "Last bucket should count everything")
+        self.assertIn('test_seconds_count{stage="parse"} 2', text, "Count should be rendered")
+        self.assertIn("# TYPE test_seconds histogram", text, "Type should be rendered")
+
+    def test_counter_and_gauge_render(self) :
+        registry = MetricsRegistry()
+        registry.counter("test_total", "Test counter").inc(3)
+        registry.gauge("test_size", "Test gauge", lambda : 7)
+
+        text = registry.render()
+
+        self.assertIn("test_total 3", text, "Counter should be rendered")
+        self.assertIn("test_size 7.0", text, "Gauge should be read when rendering")
+
+    def test_counter_read_from_callback(self) :
+        registry = MetricsRegistry()
+        counts = {"hits" : 2}
+        registry.counter("test_hits_total", "Test counter", callback = lambda : counts["hits"])
+        counts["hits"] = 5
+
+        text = registry.render()
+
+        self.assertIn("# TYPE test_hits_total counter", text, "Callback counter should be counter-typed")
+        self.assertIn("test_hits_total 5.0", text, "Counter should be read when rendering")
+
+    def test_registering_twice_returns_same_metric(self) :
+        registry = MetricsRegistry()
+
+        self.assertIs(registry.counter("test_total", "Test"), registry.counter("test_total", "Test"),
+                      "Metric should be registered once")
+
+    def test_timed_records_request_timings(self) :
+        def observations() :
+            return sum(sum(counts) for counts, _ in STAGE_SECONDS.values.values())
+
+        timings = start_request_timings()
+        before = observations()
+
+        with timed("download") :
+            pass
+        with timed("parse") :
+            pass
+
+        self.assertEqual(["download", "parse"], [stage for stage, _ in timings], "Stages should be recorded")
+        self.assertEqual(before + 2, observations(), "Stages should be observed in the histogram")
+
+    def test_server_timing_header_format(self) :
+        header = server_timing_header([("download", 0.5), ("parse", 0.0012)])
+
+        self.assertEqual("download;dur=500.000, parse;dur=1.200", header, "Durations should be in milliseconds")
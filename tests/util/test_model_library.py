@@ -1,6 +1,11 @@
+import threading
+import time
 import unittest
 import pytest
 
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
 from util import ModelLibrary
 from util.exceptions import ModelNotFoundError
 from ml import SarimaxModel
@@ -90,3 +95,127 @@ class ModelLibraryTest(unittest.TestCase) :
         self.assertTrue(self.modelA.file_root in l, "Should be in list")
         self.assertFalse(self.modelC.file_root in l, "Should not be in list")
 
+    def test_get_model_refreshes_recency(self) :
+        lib = ModelLibrary(2)
+        lib.add_model(self.modelA)
+        lib.add_model(self.modelB)
+        lib.get_model(self.modelA.file_root)
+        lib.add_model(self.modelC)
+
+        self.assertTrue(self.modelA.file_root in lib.model_library, "Recently used model should be kept")
+        self.assertFalse(self.modelB.file_root in lib.model_library, "Least recently used model should be removed")
+
+    def test_byte_budget_evicts_models(self) :
+        size = self.modelA.footprint()
+        lib = ModelLibrary(10, max_bytes = 2 * size)
+        lib.add_model(self.modelA)
+        lib.add_model(self.modelB)
+        lib.add_model(self.modelC)
+
+        self.assertEqual(2, lib.cur_models, "Byte budget should bound the library")
+        self.assertEqual(2 * size, lib.cur_bytes, "Library should track the footprint of its models")
+        self.assertFalse(self.modelA.file_root in lib.model_library, "Least recently used model should be removed")
+
+    def test_footprint_is_only_measured_for_a_byte_budget(self) :
+        lib = ModelLibrary(10)
+        with patch.object(type(self.modelA), "footprint") as footprint :
+            lib.add_model(self.modelA)
+
+        footprint.assert_not_called()
+        self.assertEqual(0, lib.cur_bytes, "Bytes should not be tracked without a budget")
+
+    def test_adding_existing_model_replaces_it(self) :
+        lib = ModelLibrary(2)
+        lib.add_model(self.modelA)
+        lib.add_model(SarimaxModel("FRA"))
+
+        self.assertEqual(1, lib.cur_models, "Model should be replaced, not duplicated")
+
+    def test_stats_counts_hits_misses_and_evictions(self) :
+        lib = ModelLibrary(1)
+        lib.add_model(self.modelA)
+        lib.get_model(self.modelA.file_root)
+        lib.get_model(self.modelB.file_root)
+        lib.add_model(self.modelB)
+
+        stats = lib.stats()
+
+        self.assertEqual(1, stats["hits"], "Hit should be counted")
+        self.assertEqual(1, stats["misses"], "Miss should be counted")
+        self.assertEqual(1, stats["evictions"], "Eviction should be counted")
+        self.assertEqual(0.5, stats["hit_rate"], "Hit rate should be computed")
+
+    def test_get_or_load_loads_missing_model(self) :
+        lib = ModelLibrary(2)
+
+        model = lib.get_or_load(self.modelA.file_root, lambda : self.modelA)
+
+        self.assertEqual(self.modelA, model, "Loaded model should be returned")
+        self.assertTrue(self.modelA.file_root in lib.model_library, "Loaded model should be added")
+
+    def test_get_or_load_coalesces_concurrent_loads(self) :
+        lib = ModelLibrary(2)
+        release = threading.Event()
+        calls = []
+
+        def loader() :
+            calls.append(1)
+            release.wait()
+            return self.modelA
+
+        with ThreadPoolExecutor(4) as pool :
+            futures = [pool.submit(lib.get_or_load, self.modelA.file_root, loader) for _ in range(4)]
+            while lib.coalesced < 3 :
+                time.sleep(0.01)
+            release.set()
+            models = [future.result() for future in futures]
+
+        self.assertEqual(1, len(calls), "Model should be loaded once")
+        self.assertTrue(all(model is self.modelA for model in models), "All callers should get the model")
+
+    def test_get_or_load_propagates_errors(self) :
+        lib = ModelLibrary(2)
+
+        def loader() :
+            raise FileNotFoundError("no model")
+
+        with pytest.raises(FileNotFoundError) :
+            lib.get_or_load(self.modelA.file_root, loader)
+
+        self.assertEqual(self.modelA, lib.get_or_load(self.modelA.file_root, lambda : self.modelA),
+                         "Failed load should not block later loads")
+
+    def test_changed_artifact_is_swapped_in_background(self) :
+        lib = ModelLibrary(2)
+        old_model, new_model = SarimaxModel("FRA"), SarimaxModel("FRA")
+        old_model.version = new_model.version = "1"
+        loads = iter([old_model, new_model])
+
+        lib.get_or_load("SARIMAX_FRA", lambda : next(loads))
+
+        with patch.object(SarimaxModel, "artifact_version", return_value = "1") :
+            self.assertIs(old_model, lib.get_model("SARIMAX_FRA"), "Unchanged model should be kept")
+            self.assertEqual(0, lib.reloads, "Unchanged model should not be reloaded")
+
+        new_model.version = "2"
+        with patch.object(SarimaxModel, "artifact_version", return_value = "2") :
+            self.assertIs(old_model, lib.get_model("SARIMAX_FRA"), "Old model should serve during the reload")
+
+            deadline = time.monotonic() + 5
+            while lib.model_library["SARIMAX_FRA"] is not new_model and time.monotonic() < deadline :
+                time.sleep(0.01)
+
+            self.assertIs(new_model, lib.get_model("SARIMAX_FRA"), "New model should be swapped in")
+
+        self.assertEqual(1, lib.reloads, "Model should be reloaded once")
+        self.assertEqual(1, lib.cur_models, "Old model should be replaced")
+
+    def test_version_checks_are_throttled(self) :
+        lib = ModelLibrary(2, reload_interval = 60)
+        lib.get_or_load(self.modelA.file_root, lambda : self.modelA)
+
+        with patch.object(SarimaxModel, "artifact_version", return_value = "2") as artifact_version :
+            for _ in range(3) :
+                lib.get_model(self.modelA.file_root)
+
+        self.assertEqual(1, artifact_version.call_count, "Artifact should be checked once per interval")
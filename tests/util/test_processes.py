@@ -0,0 +1,16 @@
+import os
+import unittest
+
+from unittest.mock import patch
+from util.processes import process_pool
+
+
+class ProcessPoolTest(unittest.TestCase) :
+
+    def test_workers_are_spawned(self) :
+        with process_pool(1) as pool :
+            self.assertEqual("spawn", pool._mp_context.get_start_method(), "Workers should not be forked")
+
+    def test_workers_see_the_current_environment(self) :
+        with patch.dict(os.environ, {"MODEL_DIR" : "spawned-models"}), process_pool(1) as pool :
+            self.assertEqual("spawned-models", pool.submit(os.getenv, "MODEL_DIR").result(timeout = 60))
@@ -2,7 +2,8 @@ import unittest
 from datetime import date, timedelta
 
 from util.request_checks import check_region, check_all, check_end_date, check_start_date, check_predict_start, \
-    check_dates_order
+    check_dates_order, check_format, check_regions, check_level, \
+    check_age_class
 
 
 class RequestChecksTest(unittest.TestCase) :
@@ -49,3 +50,39 @@ class RequestChecksTest(unittest.TestCase) :
         l = check_all(start, end, "77", prediction = True)
 
         self.assertEqual(4, len(l), "List should be full")
+
+    def test_check_format(self) :
+        self.assertTrue(check_format("rows"), "Format should be accepted")
+        self.assertTrue(check_format("columnar"), "Format should be accepted")
+        self.assertTrue(check_format("ndjson"), "Format should be accepted")
+        self.assertTrue(check_format("csv"), "Format should be accepted")
+        self.assertFalse(check_format("xml"), "Format should be refused")
+
+    def test_check_all_checks_format(self) :
+        l = check_all(date(2022, 1, 1), date(2022, 1, 10), "FRA", response_format = "xml")
+
+        self.assertEqual(["format"], [param.field for param in l], "Format should be refused")
+
+    def test_check_regions(self) :
+        self.assertEqual([], check_regions(["FRA", "59"]), "Regions should be accepted")
+        self.assertEqual(["Selected region 75 is not available"],
+                         [param.message for param in check_regions(["59", "75"])], "Region should be refused")
+
+    def test_check_all_accepts_a_list_of_regions(self) :
+        l = check_all(date(2022, 1, 1), date(2022, 1, 10), ["FRA", "75", "76"])
+
+        self.assertEqual(["region", "region"], [param.field for param in l], "Each unknown region should be refused")
+
+    def test_check_level(self) :
+        self.assertTrue(check_level(0.95), "Level should be accepted")
+        self.assertFalse(check_level(1), "Level should be refused")
+        self.assertEqual(["level"], [param.field for param in check_all(date(2022, 1, 1), date(2022, 1, 10), "FRA",
+                                                                        level = 0)], "Level should be checked")
+
+    def test_check_age_class(self) :
+        self.assertTrue(check_age_class("19"), "Age class should be accepted")
+        self.assertTrue(check_age_class("all"), "Every age class should be accepted")
+        self.assertFalse(check_age_class("18"), "Age class should be refused")
+        self.assertEqual(["age_class"], [param.field for param in check_all(date(2022, 1, 1), date(2022, 1, 10), "FRA",
+                                                                            age_class = "18")],
+                         "Age class should be checked")
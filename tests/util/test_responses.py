@@ -0,0 +1,108 @@
+import unittest
+
+import json
+import numpy as np
+import pandas as pd
+
+from unittest.mock import patch
+
+from util.responses import FastJSONResponse, resolve_format, stream_rows, to_columns, to_rows
+
+
+class ResponsesTest(unittest.TestCase) :
+
+    def setUp(self) -> None :
+        self.true_data = pd.Series([10.0, 12.7, 11.2], index = pd.date_range("2022-01-10", periods = 3, freq = "D"))
+        self.predictions = pd.Series([13.9, -0.5], index = pd.date_range("2022-01-13", periods = 2, freq = "D"))
+
+    def test_to_rows_matches_row_by_row_building(self) :
+        expected = [
+            {
+                "date" : index.to_pydatetime().strftime("%Y-%m-%d"),
+                "cases" : int(value),
+                "predicted" : True
+            }
+            for index, value in self.predictions.items()
+        ]
+
+        self.assertEqual(expected, to_rows(self.predictions, predicted = True), "Rows should not change")
+        self.assertEqual({"date" : "2022-01-10", "cases" : 10}, to_rows(self.true_data)[0],
+                         "Flag should be omitted when not given")
+
+    def test_to_columns_concatenates_true_and_predicted_data(self) :
+        columns = to_columns(self.true_data, self.predictions)
+
+        self.assertEqual(["2022-01-10", "2022-01-11", "2022-01-12", "2022-01-13", "2022-01-14"], columns["dates"],
+                         "Dates should be concatenated")
+        self.assertEqual([10, 12, 11, 13, 0], columns["cases"], "Cases should be truncated like int()")
+        self.assertEqual([False, False, False, True, True], columns["predicted"], "Predicted flags should be set")
+
+    def test_intervals_are_added_to_rows_and_columns(self) :
+        intervals = pd.DataFrame({"lower" : [9.5, -1.7], "upper" : [18.2, 1.1]}, index = self.predictions.index)
+
+        self.assertEqual({"date" : "2022-01-13", "cases" : 13, "lower" : 9, "upper" : 18},
+                         to_rows(self.predictions, intervals = intervals)[0], "Bounds should be added to rows")
+        self.assertEqual([-1, 1], [to_columns(self.predictions, intervals = intervals)[bound][1]
+                                   for bound in ("lower", "upper")], "Bounds should be truncated like int()")
+
+    def test_to_columns_without_predictions(self) :
+        self.assertEqual({"dates", "cases"}, set(to_columns(self.true_data)), "Predicted column should be omitted")
+
+    def test_cases_are_python_integers(self) :
+        cases = to_columns(self.true_data)["cases"]
+
+        self.assertTrue(all(type(value) is int for value in cases), "Values should not be numpy scalars")
+
+    def test_missing_cases_are_null(self) :
+        gap = pd.Series([10.0, np.nan, 11.2], index = self.true_data.index)
+
+        self.assertEqual([10, None, 11], to_columns(gap)["cases"], "Missing values should not be cast")
+        self.assertIsNone(to_rows(gap)[1]["cases"], "Missing values should be null in rows")
+        lines = "".join(stream_rows([(gap, None)], "ndjson")).splitlines()
+        self.assertEqual([10, None, 11], [json.loads(line)["cases"] for line in lines],
+                         "Missing values should be null in NDJSON")
+        self.assertEqual("date,cases\n2022-01-10,10\n2022-01-11,\n2022-01-12,11\n",
+                         "".join(stream_rows([(gap, None)], "csv")), "Missing values should be empty in CSV")
+
+    def test_fast_json_response_renders_json(self) :
+        response = FastJSONResponse({"dates" : ["2022-01-10"], "cases" : [np.int64(3).item()]})
+
+        self.assertEqual({"dates" : ["2022-01-10"], "cases" : [3]}, json.loads(response.body), "Body should be JSON")
+
+    def test_resolve_format(self) :
+        self.assertEqual("columnar", resolve_format("columnar", "text/csv"), "Parameter should take precedence")
+        self.assertEqual("csv", resolve_format(None, "text/csv"), "Accept header should select CSV")
+        self.assertEqual("ndjson", resolve_format(None, "application/x-ndjson"), "Accept header should select NDJSON")
+        self.assertEqual("rows", resolve_format(None, "application/json"), "Rows should be the default")
+        self.assertEqual("rows", resolve_format(None, None), "Rows should be the default")
+
+    def test_stream_rows_ndjson(self) :
+        body = "".join(stream_rows([(self.true_data, False), (self.predictions, True)], "ndjson"))
+        rows = [json.loads(line) for line in body.splitlines()]
+
+        self.assertEqual(to_rows(self.true_data, predicted = False) + to_rows(self.predictions, predicted = True), rows,
+                         "NDJSON rows should match the row format")
+
+    def test_stream_rows_csv(self) :
+        body = "".join(stream_rows([(self.true_data, False), (self.predictions, True)], "csv"))
+
+        self.assertEqual("date,cases,predicted\n"
+                         "2022-01-10,10,false\n2022-01-11,12,false\n2022-01-12,11,false\n"
+                         "2022-01-13,13,true\n2022-01-14,0,true\n", body, "CSV should have a single header")
+
+    def test_stream_rows_chunks_and_consumes_lazily(self) :
+        consumed = []
+
+        def parts() :
+            consumed.append("true")
+            yield self.true_data, None
+            consumed.append("predictions")
+            yield self.predictions, None
+
+        with patch("util.responses.CHUNK_SIZE", 2) :
+            stream = stream_rows(parts(), "csv")
+            self.assertEqual("date,cases\n", next(stream), "Header should come first")
+            self.assertEqual("2022-01-10,10\n2022-01-11,12\n", next(stream), "Rows should be chunked")
+            self.assertEqual(["true"], consumed, "Predictions should not be computed yet")
+            self.assertEqual(["2022-01-12,11\n", "2022-01-13,13\n2022-01-14,0\n"], list(stream),
+                             "Remaining rows should follow")
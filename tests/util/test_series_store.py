@@ -0,0 +1,55 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from datetime import date
+from util.series_store import SeriesStore
+
+
+def make_frame(start : str, periods : int, offset : int = 0) -> pd.DataFrame :
+    index = pd.date_range(start, periods = periods, freq = "D")
+    return pd.DataFrame({"P" : np.arange(periods) + offset, "T" : np.arange(periods) * 10 + offset}, index = index)
+
+
+class SeriesStoreTest(unittest.TestCase) :
+
+    def setUp(self) -> None :
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = SeriesStore(f"{self.tmp_dir.name}/series.db")
+
+    def tearDown(self) -> None :
+        self.tmp_dir.cleanup()
+
+    def test_read_returns_the_range(self) :
+        self.store.append({"59" : make_frame("2022-01-01", 30), "62" : make_frame("2022-01-01", 30, 100)})
+
+        data = self.store.read("59", date(2022, 1, 10), date(2022, 1, 14))
+
+        self.assertEqual(pd.date_range("2022-01-10", "2022-01-14", freq = "D").tolist(), data.index.tolist(),
+                         "Only the range should be read")
+        self.assertEqual([9, 10, 11, 12, 13], data["P"].tolist(), "Cases should be read")
+        self.assertEqual("D", data.index.freqstr, "Data should have a daily frequency")
+
+    def test_append_only_adds_new_days(self) :
+        self.assertEqual(10, self.store.append({"59" : make_frame("2022-01-01", 10)}, "https://localhost", "v1"))
+        # Upstream revisions of stored days are ignored
+        appended = self.store.append({"59" : make_frame("2022-01-01", 12, 1000)}, "https://localhost", "v2")
+
+        self.assertEqual(2, appended, "Only the new days should be appended")
+        self.assertEqual(date(2022, 1, 12), self.store.last_date("59"), "Last day should be stored")
+        self.assertEqual([9, 1010, 1011], self.store.read("59", date(2022, 1, 10))["P"].tolist(),
+                         "Stored days should be kept")
+        self.assertEqual("v2", self.store.version("https://localhost"), "Version should be recorded")
+
+    def test_missing_days_and_regions(self) :
+        data = make_frame("2022-01-01", 5).astype("float64")
+        data.iloc[2] = np.nan
+        self.store.append({"59" : data})
+
+        self.assertEqual(5, len(self.store.read("59")), "Missing days should be filled")
+        self.assertTrue(np.isnan(self.store.read("59")["P"].iloc[2]), "Missing days should be empty")
+        self.assertTrue(self.store.read("75").empty, "Unknown region should be empty")
+        self.assertIsNone(self.store.last_date("75"), "Unknown region should have no last day")
+        self.assertIsNone(self.store.version("https://localhost"), "Nothing should be ingested")
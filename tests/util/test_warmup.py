@@ -0,0 +1,34 @@
+import unittest
+
+from util.warmup import WarmUp
+
+
+class WarmUpTest(unittest.TestCase) :
+
+    def test_warm_up_loads_regions(self) :
+        warmup = WarmUp()
+        loaded = []
+
+        warmup.start(["FRA", "59"], loaded.append)
+
+        self.assertTrue(warmup.wait(5), "Warm-up should finish")
+        self.assertTrue(warmup.is_ready, "Warm-up should be ready")
+        self.assertEqual(["FRA", "59"], loaded, "All regions should be loaded")
+        self.assertEqual(["FRA", "59"], warmup.loaded, "Loaded regions should be reported")
+
+    def test_warm_up_reports_failures(self) :
+        warmup = WarmUp()
+
+        def loader(region : str) :
+            if region == "59" :
+                raise FileNotFoundError("no model")
+
+        warmup.start(["FRA", "59"], loader)
+        warmup.wait(5)
+
+        self.assertTrue(warmup.is_ready, "Failures should not block readiness")
+        self.assertEqual(["FRA"], warmup.loaded, "Loaded regions should be reported")
+        self.assertEqual("FileNotFoundError: no model", warmup.failed["59"], "Failures should be reported")
+
+    def test_not_ready_before_start(self) :
+        self.assertFalse(WarmUp().is_ready, "Warm-up should not be ready before it starts")
@@ -1,3 +1,5 @@
-from .data_retrieval import fetch_data, get_region_data, get_nation_data
+from .data_cache import DataCache, CacheEntry
+from .data_retrieval import fetch_data, fetch_index, fetch_series, RegionIndex, get_region_data, get_nation_data, CsvSchema, NATION_SCHEMA, REGION_SCHEMA
 from .model_library import ModelLibrary
+from .series_store import SeriesStore
 from .request_checks import check_all, InvalidParameter
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+from concurrent.futures import Future
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional
+from urllib3.util.retry import Retry
+
+from .metrics import timed
+
+
+CHUNK_SIZE = 1 << 20
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def create_session(retries : int, pool_size : int = 4) -> requests.Session :
+    """
+    Creates a session reusing its connections, retrying failed GET requests with an exponential backoff
+    and asking for compressed payloads.
+
+    :param retries: the maximum number of retries per request
+    :param pool_size: the number of connections kept per host
+    :return: the session
+    """
+
+    retry = Retry(total = retries,
+                  backoff_factor = 0.5,
+                  status_forcelist = RETRY_STATUSES,
+                  allowed_methods = ["GET"],
+                  raise_on_status = False)
+    adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size, max_retries = retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+
+    return session
+
+
+@dataclass
+class CacheEntry :
+    """
+    Dataclass to represent a cached upstream payload
+    """
+
+    url : str
+    path : str
+    etag : Optional[str]
+    last_modified : Optional[str]
+    fetched_at : float
+
+    @property
+    def version(self) -> str :
+        """
+        An identifier that changes whenever the cached payload changes.
+        """
+        return self.etag or self.last_modified or f"{self.fetched_at:.6f}"
+
+
+class DataCache :
+    """
+    An on-disk cache for upstream CSV payloads.
+
+    The last payload of each url is kept on disk along with its ETag and Last-Modified headers.
+    Entries younger than the TTL are served without any network access, older entries are
+    revalidated with a conditional request.
+
+    Downloads go through a pooled session with a timeout and bounded retries. Concurrent fetches
+    of the same url are coalesced, only the first caller downloads and the others share its result.
+    """
+
+    directory : Path
+    ttl : float
+    hits : int
+    revalidated : int
+    misses : int
+    coalesced : int
+    timeout : float
+
+    def __init__(self, directory : str, ttl : float, timeout : float = 30.0, retries : int = 3) :
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.session = create_session(retries)
+        self._inflight : Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, url : str) -> CacheEntry :
+        """
+        Returns the cache entry for the given url, downloading the payload only if needed.
+
+        :param url: the url to fetch the data from
+        :return: the up-to-date cache entry
+        """
+
+        entry = self._read_entry(url)
+
+        if entry is not None and time.time() - entry.fetched_at < self.ttl :
+            self._count("hits")
+            return entry
+
+        with self._lock :
+            future = self._inflight.get(url)
+            is_fetcher = future is None
+            if is_fetcher :
+                future = Future()
+                self._inflight[url] = future
+            else :
+                self.coalesced += 1
+
+        if not is_fetcher :
+            return future.result()
+
+        try :
+            entry = self._download(url)
+            future.set_result(entry)
+        except Exception as e :
+            future.set_exception(e)
+            raise
+        finally :
+            with self._lock :
+                del self._inflight[url]
+
+        return entry
+
+    def _download(self, url : str) -> CacheEntry :
+        # Read again, a download that just finished may have refreshed the entry
+        entry = self._read_entry(url)
+
+        if entry is not None and time.time() - entry.fetched_at < self.ttl :
+            self._count("hits")
+            return entry
+
+        headers = {}
+        if entry is not None :
+            if entry.etag is not None :
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified is not None :
+                headers["If-Modified-Since"] = entry.last_modified
+
+        with timed("download") :
+            response = self.session.request("GET", url, headers = headers, stream = True, timeout = self.timeout)
+
+            # Streamed responses only release their connection to the pool once closed
+            try :
+                if entry is not None and response.status_code == 304 :
+                    entry.fetched_at = time.time()
+                    self._write_meta(entry)
+                    self._count("revalidated")
+                    return entry
+
+                response.raise_for_status()
+
+                entry = CacheEntry(url = url,
+                                   path = str(self._payload_path(url)),
+                                   etag = response.headers.get("ETag"),
+                                   last_modified = response.headers.get("Last-Modified"),
+                                   fetched_at = time.time())
+                self._write_payload(entry, response)
+                self._write_meta(entry)
+                self._count("misses")
+            finally :
+                response.close()
+
+        return entry
+
+    def stats(self) -> Dict[str, float] :
+        """
+        Returns the cache counters.
+
+        :return: hits, conditional revalidations, misses, coalesced fetches and the resulting hit rate
+        """
+
+        with self._lock :
+            served = self.hits + self.revalidated
+            total = served + self.misses
+            return {"hits" : self.hits,
+                    "revalidated" : self.revalidated,
+                    "misses" : self.misses,
+                    "coalesced" : self.coalesced,
+                    "hit_rate" : served / total if total > 0 else 0.0}
+
+    def _count(self, counter : str) -> None :
+        with self._lock :
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _key(self, url : str) -> str :
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _payload_path(self, url : str) -> Path :
+        return self.directory / f"{self._key(url)}.csv"
+
+    def _meta_path(self, url : str) -> Path :
+        return self.directory / f"{self._key(url)}.json"
+
+    def _read_entry(self, url : str) -> Optional[CacheEntry] :
+        meta_path = self._meta_path(url)
+        if not meta_path.exists() or not self._payload_path(url).exists() :
+            return None
+
+        with open(meta_path, "r") as f :
+            return CacheEntry(**json.load(f))
+
+    def _write_payload(self, entry : CacheEntry, response : requests.Response) -> None :
+        # Stream the body to disk so the payload is never held in memory as a whole
+        self.directory.mkdir(parents = True, exist_ok = True)
+        tmp_path = f"{entry.path}.tmp"
+        with open(tmp_path, "wb") as f :
+            for chunk in response.iter_content(chunk_size = CHUNK_SIZE) :
+                f.write(chunk)
+        os.replace(tmp_path, entry.path)
+
+    def _write_meta(self, entry : CacheEntry) -> None :
+        self.directory.mkdir(parents = True, exist_ok = True)
+        meta_path = self._meta_path(entry.url)
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, "w") as f :
+            json.dump(asdict(entry), f)
+        os.replace(tmp_path, meta_path)
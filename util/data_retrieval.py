@@ -1,53 +1,280 @@
-import io
+from __future__ import annotations
+
+import os
+import threading
 import pandas as pd
-import requests
 
-from typing import Dict, Iterable
+from dataclasses import dataclass
+from datetime import date
+from dotenv import load_dotenv
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .data_cache import DataCache
+from .file_lock import host_lock
+from .metrics import timed
+from .series_store import SeriesStore
+
+
+load_dotenv()
+
+DATA_CACHE = DataCache(os.getenv("DATA_CACHE_DIR", "cache"),
+                       float(os.getenv("DATA_CACHE_TTL", 3600)),
+                       float(os.getenv("DATA_FETCH_TIMEOUT", 30)),
+                       int(os.getenv("DATA_FETCH_RETRIES", 3)))
+
+SERIES_STORE = SeriesStore(os.getenv("DATA_STORE_PATH", os.path.join(os.getenv("DATA_CACHE_DIR", "cache"), "series.db")))
+
+
+@dataclass
+class CsvSchema :
+    """
+    Dataclass to represent the columns and types to read from an upstream CSV
+    """
+
+    usecols : Tuple[str, ...]
+    dtype : Dict[str, str]
+    parse_dates : Tuple[str, ...]
+
+
+NATION_SCHEMA = CsvSchema(usecols = ("jour", "P", "T", "cl_age90"),
+                          dtype = {"P" : "int64", "T" : "int64", "cl_age90" : "int8"},
+                          parse_dates = ("jour",))
 
+REGION_SCHEMA = CsvSchema(usecols = ("dep", "jour", "P", "T", "cl_age90"),
+                          dtype = {"dep" : "category", "P" : "int64", "T" : "int64", "cl_age90" : "int8"},
+                          parse_dates = ("jour",))
 
-def fetch_data(url : str) -> pd.DataFrame :
+
+class RegionIndex :
+    """
+    A dataset partitioned by region, holding one ready-made daily-frequency frame per region.
+    """
+
+    version : Optional[str]
+    regions : Dict[str, pd.DataFrame]
+
+    def __init__(self, regions : Dict[str, pd.DataFrame], version : Optional[str] = None) :
+        self.regions = regions
+        self.version = version
+
+    @classmethod
+    def from_regional(cls, data : pd.DataFrame, version : Optional[str] = None) -> RegionIndex :
+        """
+        Partitions a departmental dataset in a single pass.
+
+        :param data: the general dataset
+        :param version: the version of the dataset
+        :return: the region index
+        """
+
+        to_remove = ["jour", "cl_age90", "pop"]
+        data = data.loc[data["cl_age90"] == 0]
+        dates = pd.to_datetime(data["jour"])
+        data = data.drop(columns = to_remove, errors = "ignore").set_index(dates)
+
+        regions = {}
+        for region, tmp in data.groupby("dep", observed = True, sort = False) :
+            tmp = tmp.drop(columns = ["dep"])
+            tmp = tmp.sort_index()
+            tmp = tmp.asfreq("D")
+
+            regions[str(region)] = tmp
+
+        return cls(regions, version)
+
+    @classmethod
+    def from_national(cls, data : pd.DataFrame, version : Optional[str] = None) -> RegionIndex :
+        """
+        Wraps the national dataset as a single region named FRA.
+
+        :param data: the general dataset
+        :param version: the version of the dataset
+        :return: the region index
+        """
+        return cls({"FRA" : get_nation_data(data)}, version)
+
+    def __getitem__(self, region : str) -> pd.DataFrame :
+        if region not in self.regions :
+            return pd.DataFrame(columns = ["P", "T"], index = pd.DatetimeIndex([], freq = "D"))
+
+        return self.regions[region]
+
+    def __contains__(self, region : str) -> bool :
+        return region in self.regions
+
+    def list_regions(self) -> List[str] :
+        return [region for region in self.regions]
+
+
+_INDEXES : Dict[str, RegionIndex] = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def fetch_data(url : str, schema : Optional[CsvSchema] = None) -> pd.DataFrame :
     """
     Fetches the data from a given url and returns it in the form of a Pandas DataFrame.
     Data must be semicolon-separated CSV.
+    The payload goes through the on-disk data cache, so the network is only used when the
+    cached copy is stale and has changed upstream.
 
     :param url: the url to fetch the data from
+    :param schema: the columns and types to read, optional, all columns are read with inferred types if omitted
     :return: the generated dataframe
     """
 
     # Fetch data
-    response = requests.request("GET", url)
+    entry = DATA_CACHE.fetch(url)
 
     # Convert to dataframe
-    raw_csv = response.content.decode("utf-8")
-    data = pd.read_csv(io.StringIO(raw_csv), sep = ";", low_memory = False)
+    return _read_csv(entry.path, schema)
+
+
+def fetch_index(url : str, schema : CsvSchema, national : bool = False) -> RegionIndex :
+    """
+    Fetches the data from a given url and returns it partitioned by region.
+    The index is only rebuilt when the cached payload changes, other calls reuse the
+    index built for the current dataset version.
+
+    :param url: the url to fetch the data from
+    :param schema: the columns and types to read
+    :param national: whether the url points to the national dataset
+    :return: the region index for the current dataset version
+    """
+
+    entry = DATA_CACHE.fetch(url)
+
+    with _INDEX_LOCK :
+        index = _INDEXES.get(url)
+        if index is not None and index.version == entry.version :
+            return index
+
+    data = _read_csv(entry.path, schema)
+    with timed("reshape") :
+        if national :
+            index = RegionIndex.from_national(data, entry.version)
+        else :
+            index = RegionIndex.from_regional(data, entry.version)
+
+    with _INDEX_LOCK :
+        _INDEXES[url] = index
+
+    return index
+
+
+def fetch_age_classes(url : str, schema : CsvSchema, national : bool = False) -> Dict[str, pd.DataFrame] :
+    """
+    Fetches the data from a given url and returns the cases of every age class, partitioned by region.
+    Age classes are only needed by refits, so they are partitioned from a fresh parse of the cached
+    payload instead of being kept alongside the cached region indexes.
+
+    :param url: the url to fetch the data from
+    :param schema: the columns and types to read
+    :param national: whether the url points to the national dataset, its region being FRA
+    :return: a dictionary containing, for each region, the cases with one column per cl_age90 value
+    """
+
+    entry = DATA_CACHE.fetch(url)
+    data = _read_csv(entry.path, schema)
+
+    if national :
+        data = data.assign(dep = "FRA")
+
+    return get_age_class_data(data[["dep", "jour", "cl_age90", "P"]])
+
+
+def fetch_series(url : str,
+                 schema : CsvSchema,
+                 region : str,
+                 start : Optional[date] = None,
+                 end : Optional[date] = None,
+                 national : bool = False) -> pd.DataFrame :
+    """
+    Returns the cases of a region between two dates, read from the local series store.
+    When the cached payload changed since the last ingestion, its new days are appended to the store
+    first, by a single process of the host. Otherwise the upstream dataset is neither parsed nor
+    partitioned, and only the requested range is read.
+
+    :param url: the url to fetch the data from
+    :param schema: the columns and types to read
+    :param region: the region
+    :param start: the start date, optional
+    :param end: the end date, optional
+    :param national: whether the url points to the national dataset
+    :return: the daily-frequency cases of the region in the date range
+    """
+
+    entry = DATA_CACHE.fetch(url)
+
+    if SERIES_STORE.version(url) != entry.version :
+        with host_lock(SERIES_STORE.path.with_suffix(".lock")) :
+            # Another process may have ingested the payload while waiting for the lock
+            if SERIES_STORE.version(url) != entry.version :
+                index = fetch_index(url, schema, national)
+                SERIES_STORE.append(index.regions, url, index.version)
+
+    return SERIES_STORE.read(region, start, end)
+
+
+def _read_csv(path : str, schema : Optional[CsvSchema]) -> pd.DataFrame :
+    with timed("parse") :
+        return _parse_csv(path, schema)
+
+
+def _parse_csv(path : str, schema : Optional[CsvSchema]) -> pd.DataFrame :
+    if schema is None :
+        return pd.read_csv(path, sep = ";", low_memory = False)
+
+    # Dates are read as categories and only the distinct values are parsed
+    dtype = dict(schema.dtype, **{column : "category" for column in schema.parse_dates})
+    data = pd.read_csv(path,
+                       sep = ";",
+                       usecols = list(schema.usecols),
+                       dtype = dtype)
+
+    for column in schema.parse_dates :
+        dates = pd.to_datetime(data[column].cat.categories, format = "%Y-%m-%d")
+        data[column] = data[column].cat.rename_categories(dates).astype("datetime64[ns]")
 
     return data
 
 
-def get_region_data(data : pd.DataFrame,
+def get_region_data(data : Union[pd.DataFrame, RegionIndex],
                     regions : Iterable[str]) -> Dict[str, pd.DataFrame] :
     """
     Returns the regional data from a general dataset.
 
-    :param data: the general dataset
+    :param data: the general dataset, or a region index already built from it
     :param regions: the regions to select
     :return: a dictionary containing all the separate dataframes
     """
 
-    to_remove = ["dep", "jour", "cl_age90", "pop"]
-    data = data.loc[data["cl_age90"] == 0]
-    reg_data = {}
+    index = data if isinstance(data, RegionIndex) else RegionIndex.from_regional(data)
+
+    return {region : index[region] for region in regions}
+
+
+def get_age_class_data(data : pd.DataFrame) -> Dict[str, pd.DataFrame] :
+    """
+    Returns the cases of every age class of every region from a general dataset, in a single pass.
+
+    :param data: the general dataset, with dep, jour, cl_age90 and P columns
+    :return: a dictionary containing, for each region, the cases with one column per cl_age90 value
+    """
 
-    for region in regions :
-        tmp : pd.DataFrame = data.loc[data.dep == region]
-        tmp.set_index(pd.to_datetime(tmp.jour), inplace = True)
-        tmp = tmp.drop(columns = to_remove)
-        tmp = tmp.sort_index()
-        tmp = tmp.asfreq("D")
+    with timed("reshape") :
+        wide = data.set_index(["jour", "dep", "cl_age90"])["P"].unstack(["dep", "cl_age90"])
+        wide.index = pd.to_datetime(wide.index)
+        wide = wide.sort_index()
 
-        reg_data[region] = tmp
+        regions = {}
+        for region in wide.columns.get_level_values(0).unique() :
+            tmp = wide[region].dropna(axis = 1, how = "all")
+            # The wide frame spans the dates of every region
+            tmp = tmp.loc[tmp.first_valid_index():tmp.last_valid_index()]
+            tmp.columns = [str(age_class) for age_class in tmp.columns]
+            regions[str(region)] = tmp[sorted(tmp.columns, key = int)].asfreq("D")
 
-    return reg_data
+    return regions
 
 
 def get_nation_data(data : pd.DataFrame) -> pd.DataFrame :
@@ -62,7 +289,7 @@ def get_nation_data(data : pd.DataFrame) -> pd.DataFrame :
 
     data = data.loc[data["cl_age90"] == 0]
     data.set_index(pd.to_datetime(data["jour"]), inplace = True)
-    data = data.drop(columns = to_remove)
+    data = data.drop(columns = to_remove, errors = "ignore")
     data = data.sort_index()
     data = data.asfreq("D")
 
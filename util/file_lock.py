@@ -0,0 +1,33 @@
+import os
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Union
+
+try :
+    import fcntl
+except ImportError :
+    fcntl = None
+
+
+@contextmanager
+def host_lock(path : Union[str, Path]) :
+    """
+    Holds an exclusive lock on a file, so that a single process of the host runs the guarded code at a time.
+    The lock is released when the process exits, even if it crashes. Without fcntl, no lock is taken.
+
+    :param path: the lock file, created if needed
+    """
+
+    if fcntl is None :
+        yield
+        return
+
+    Path(path).parent.mkdir(parents = True, exist_ok = True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try :
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally :
+        # Closing the descriptor releases the lock
+        os.close(fd)
@@ -0,0 +1,107 @@
+import threading
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+
+class JobStatus(str, Enum) :
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class Job :
+    """
+    Dataclass to represent a background job
+    """
+
+    id : str
+    kind : str
+    status : JobStatus = JobStatus.PENDING
+    submitted_at : datetime = field(default_factory = datetime.now)
+    started_at : Optional[datetime] = None
+    finished_at : Optional[datetime] = None
+    result : Any = None
+    error : Optional[str] = None
+
+
+class JobQueue :
+    """
+    A queue running long tasks, such as model refits, away from the request handlers.
+    At most max_workers jobs run at the same time, the others wait in the queue.
+    """
+
+    max_workers : int
+    max_history : int
+    jobs : Dict[str, Job]
+
+    def __init__(self, max_workers : int, max_history : int = 100) :
+        self.max_workers = max_workers
+        self.max_history = max_history
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "job")
+
+    def submit(self, kind : str, func : Callable[..., Any], *args, **kwargs) -> Job :
+        """
+        Queues a job and returns immediately.
+
+        :param kind: a short description of the job
+        :param func: the function to run
+        :return: the queued job
+        """
+
+        job = Job(id = uuid.uuid4().hex, kind = kind)
+
+        with self._lock :
+            self.jobs[job.id] = job
+            self._prune()
+
+        self._executor.submit(self._run, job, func, *args, **kwargs)
+
+        return job
+
+    def get_job(self, job_id : str) -> Optional[Job] :
+        """
+        Returns the job if it exists.
+
+        :param job_id: the id of the job
+        :return: the job or None if the job does not exist
+        """
+
+        with self._lock :
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Job] :
+        with self._lock :
+            return [job for job in self.jobs.values()]
+
+    def shutdown(self, wait : bool = True) -> None :
+        self._executor.shutdown(wait = wait)
+
+    def _run(self, job : Job, func : Callable[..., Any], *args, **kwargs) -> None :
+        job.status = JobStatus.RUNNING
+        job.started_at = datetime.now()
+
+        try :
+            job.result = func(*args, **kwargs)
+            job.status = JobStatus.DONE
+        except Exception as e :
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = JobStatus.FAILED
+        finally :
+            job.finished_at = datetime.now()
+
+    def _prune(self) -> None :
+        # Forget the oldest finished jobs once the history is full
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job.status in (JobStatus.DONE, JobStatus.FAILED)]
+
+        for job_id in finished[:max(0, len(self.jobs) - self.max_history)] :
+            del self.jobs[job_id]
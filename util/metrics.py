@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names : Sequence[str], values : Tuple[str, ...], extra : str = "") -> str :
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra :
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter :
+    """
+    A monotonic counter, in the Prometheus sense.
+    Counters kept by another object are read from a callback when the metrics are rendered.
+    """
+
+    def __init__(self,
+                 name : str,
+                 documentation : str,
+                 labels : Sequence[str] = (),
+                 callback : Optional[Callable[[], float]] = None) :
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.callback = callback
+        self.values : Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount : float = 1, **labels : str) -> None :
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock :
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str] :
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        if self.callback is not None :
+            return lines + [f"{self.name} {float(self.callback())}"]
+
+        with self._lock :
+            for key, value in self.values.items() :
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram :
+    """
+    A histogram with cumulative buckets, in the Prometheus sense.
+    """
+
+    def __init__(self,
+                 name : str,
+                 documentation : str,
+                 labels : Sequence[str] = (),
+                 buckets : Sequence[float] = DEFAULT_BUCKETS) :
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values : Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value : float, **labels : str) -> None :
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock :
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self) -> List[str] :
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock :
+            for key, (counts, total) in self.values.items() :
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts) :
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labels, key, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge :
+    """
+    A gauge read from a callback when the metrics are rendered.
+    """
+
+    def __init__(self, name : str, documentation : str, callback : Callable[[], float]) :
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self) -> List[str] :
+        return [f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} gauge",
+                f"{self.name} {float(self.callback())}"]
+
+
+class MetricsRegistry :
+    """
+    A container class for metrics, rendered in the Prometheus text format.
+    """
+
+    def __init__(self) :
+        self.metrics : Dict[str, object] = {}
+
+    def counter(self,
+                name : str,
+                documentation : str,
+                labels : Sequence[str] = (),
+                callback : Optional[Callable[[], float]] = None) -> Counter :
+        return self._register(Counter(name, documentation, labels, callback))
+
+    def histogram(self, name : str, documentation : str, labels : Sequence[str] = ()) -> Histogram :
+        return self._register(Histogram(name, documentation, labels))
+
+    def gauge(self, name : str, documentation : str, callback : Callable[[], float]) -> Gauge :
+        return self._register(Gauge(name, documentation, callback))
+
+    def render(self) -> str :
+        lines = []
+        for metric in self.metrics.values() :
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric) :
+        # Registering the same name twice returns the existing metric
+        return self.metrics.setdefault(metric.name, metric)
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("covid_stage_duration_seconds",
+                                   "Time spent in each stage of a request",
+                                   ["stage"])
+
+_REQUEST_TIMINGS : ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default = None)
+
+
+def start_request_timings() -> List[Tuple[str, float]] :
+    """
+    Starts collecting the stage timings of the current request.
+
+    :return: the list the timings are appended to
+    """
+
+    timings = []
+    _REQUEST_TIMINGS.set(timings)
+    return timings
+
+
+@contextmanager
+def timed(stage : str) :
+    """
+    Times a stage, recording it in the stage histogram and in the timings of the current request.
+
+    :param stage: the name of the stage
+    """
+
+    start = time.perf_counter()
+    try :
+        yield
+    finally :
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage = stage)
+
+        timings = _REQUEST_TIMINGS.get()
+        if timings is not None :
+            timings.append((stage, elapsed))
+
+
+def server_timing_header(timings : List[Tuple[str, float]]) -> str :
+    """
+    Formats stage timings as a Server-Timing header, durations being in milliseconds.
+
+    :param timings: the stage timings
+    :return: the header value
+    """
+    return ", ".join(f"{stage};dur={elapsed * 1000:.3f}" for stage, elapsed in timings)
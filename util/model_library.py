@@ -1,58 +1,152 @@
-from datetime import datetime
-from typing import Dict, Tuple, Optional, List
+from __future__ import annotations
+
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, List, Set, TYPE_CHECKING
 
 from .exceptions import ModelNotFoundError
-from ml.models import Model
+
+if TYPE_CHECKING :
+    from ml.models import Model
 
 
 class ModelLibrary :
     """
     A container class to store ML models in memory.
-    """
-    max_models: int
-    cur_models: int
-    model_library: Dict[str, Tuple[datetime, Model]]
 
-    def __init__(self, max_models : int) :
+    Models are kept in least recently used order, so lookups, insertions and evictions are O(1).
+    The library is bounded by a number of models and optionally by a byte budget, measured
+    from each model's footprint. Footprints are only measured when a byte budget is set, bytes
+    are not tracked otherwise. All operations are thread-safe.
+
+    Models loaded through get_or_load are hot-swapped: when a lookup finds that the model's artifact
+    changed on disk, the new version is loaded in the background and replaces the old one, which keeps
+    serving until then and stays valid for the requests already holding it.
+    """
+    max_models : int
+    max_bytes : Optional[int]
+    cur_models : int
+    cur_bytes : int
+    model_library : OrderedDict[str, Model]
+    hits : int
+    misses : int
+    evictions : int
+    coalesced : int
+    reloads : int
+    reload_interval : float
+
+    def __init__(self, max_models : int, max_bytes : Optional[int] = None, reload_interval : float = 0.0) :
         self.max_models = max_models
+        self.max_bytes = max_bytes
         self.cur_models = 0
-        self.model_library = {}
+        self.cur_bytes = 0
+        self.model_library = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.reloads = 0
+        self.reload_interval = reload_interval
+        self._loading : Dict[str, Future] = {}
+        self._sizes : Dict[str, int] = {}
+        self._loaders : Dict[str, Callable[[], Model]] = {}
+        self._checked : Dict[str, float] = {}
+        self._reloading : Set[str] = set()
+        self._lock = threading.RLock()
 
     def add_model(self, model : Model) -> None :
         """
-        Adds a model to the library. If the maximum number of models has
-        been reached, removes the oldest model in the library.
+        Adds a model to the library. If the maximum number of models or the byte budget
+        has been reached, removes the least recently used models in the library.
 
         :param model: the model to add
         """
-        # Check current number of models
-        if self.cur_models == self.max_models :
-            # Remove oldest model
-            sorted_models = [name for (name, (date, _)) in sorted(self.model_library.items(),
-                                                                  key = lambda item : item[1][0])]
 
-            oldest_model = sorted_models[0]
-            del self.model_library[oldest_model]
+        # Measure outside the lock, the footprint can take a while to compute, and only for a byte budget
+        size = model.footprint() if self.max_bytes is not None else 0
+
+        with self._lock :
+            if model.file_root in self.model_library :
+                self._remove(model.file_root)
 
-            self.cur_models -= 1
+            self.model_library[model.file_root] = model
+            self._sizes[model.file_root] = size
+            self.cur_models += 1
+            self.cur_bytes += size
 
-        self.model_library[model.file_root] = (datetime.now(), model)
-        self.cur_models += 1
+            # Remove least recently used models, always keeping the newest one
+            while self.cur_models > 1 and (self.cur_models > self.max_models or self._over_budget()) :
+                oldest_model = next(iter(self.model_library))
+                self._remove(oldest_model)
+                self.evictions += 1
 
     def get_model(self, model_name : str) -> Optional[Model] :
         """
         Returns the model if it exists in the library.
-        Updates last use time in library.
+        Marks the model as the most recently used, and starts reloading it in the background
+        if its artifact changed.
 
         :param model_name: the name of the model to return
         :return: the model from the library or None if the model does not exist
         """
 
-        if model_name not in self.model_library :
-            return None
+        with self._lock :
+            if model_name not in self.model_library :
+                self.misses += 1
+                return None
 
-        _, model = self.model_library[model_name]
-        self.model_library[model_name] = (datetime.now(), model)
+            self.model_library.move_to_end(model_name)
+            self.hits += 1
+            model = self.model_library[model_name]
+
+        self._check_version(model_name, model)
+
+        return model
+
+    def get_or_load(self, model_name : str, loader : Callable[[], Model]) -> Model :
+        """
+        Returns the model from the library, loading it if needed.
+        Concurrent loads of the same model are coalesced, only the first caller runs the loader
+        and the others wait for its result.
+
+        :param model_name: the name of the model to return
+        :param loader: a function loading the model
+        :return: the model
+        """
+
+        if (model := self.get_model(model_name)) is not None :
+            return model
+
+        with self._lock :
+            if model_name in self.model_library :
+                return self.model_library[model_name]
+
+            self._loaders[model_name] = loader
+
+            future = self._loading.get(model_name)
+            is_loader = future is None
+            if is_loader :
+                future = Future()
+                self._loading[model_name] = future
+            else :
+                self.coalesced += 1
+
+        if not is_loader :
+            return future.result()
+
+        try :
+            model = loader()
+            self.add_model(model)
+            future.set_result(model)
+        except Exception as e :
+            future.set_exception(e)
+            raise
+        finally :
+            with self._lock :
+                del self._loading[model_name]
 
         return model
 
@@ -64,11 +158,77 @@ class ModelLibrary :
         :raises ModelNotFoundError: if the model does not exist in the library
         """
 
-        if model_name not in self.model_library :
-            raise ModelNotFoundError("Model is not in library")
+        with self._lock :
+            if model_name not in self.model_library :
+                raise ModelNotFoundError("Model is not in library")
 
-        del self.model_library[model_name]
-        self.cur_models -= 1
+            self._remove(model_name)
 
     def list_model_names(self) -> List[str] :
-        return [name for name in self.model_library]
+        with self._lock :
+            return [name for name in self.model_library]
+
+    def stats(self) -> Dict[str, Optional[float]] :
+        """
+        Returns the library counters.
+
+        :return: the library occupancy, hits, misses, evictions and the resulting hit rate
+        """
+
+        with self._lock :
+            lookups = self.hits + self.misses
+            return {"models" : self.cur_models,
+                    "max_models" : self.max_models,
+                    "bytes" : self.cur_bytes,
+                    "max_bytes" : self.max_bytes,
+                    "hits" : self.hits,
+                    "misses" : self.misses,
+                    "evictions" : self.evictions,
+                    "coalesced" : self.coalesced,
+                    "reloads" : self.reloads,
+                    "hit_rate" : self.hits / lookups if lookups > 0 else 0.0}
+
+    def _check_version(self, model_name : str, model : Model) -> None :
+        # Only models with a known loader can be reloaded, checks are throttled by the reload interval
+        with self._lock :
+            loader = self._loaders.get(model_name)
+            now = time.monotonic()
+            if loader is None or now - self._checked.get(model_name, float("-inf")) < self.reload_interval :
+                return
+            self._checked[model_name] = now
+
+        if model.artifact_version() == model.version :
+            return
+
+        with self._lock :
+            if model_name in self._reloading or model_name in self._loading :
+                return
+            self._reloading.add(model_name)
+
+        threading.Thread(target = self._reload, args = (model_name, loader), daemon = True).start()
+
+    def _reload(self, model_name : str, loader : Callable[[], Model]) -> None :
+        try :
+            model = loader()
+        except Exception :
+            # Keep serving the current version, the next check will retry
+            return
+        finally :
+            with self._lock :
+                self._reloading.discard(model_name)
+
+        with self._lock :
+            # Evicted or removed models are not brought back
+            if model_name not in self.model_library :
+                return
+            self.reloads += 1
+
+        self.add_model(model)
+
+    def _over_budget(self) -> bool :
+        return self.max_bytes is not None and self.cur_bytes > self.max_bytes
+
+    def _remove(self, model_name : str) -> None :
+        del self.model_library[model_name]
+        self.cur_bytes -= self._sizes.pop(model_name)
+        self.cur_models -= 1
@@ -0,0 +1,17 @@
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+def process_pool(max_workers : int) -> ProcessPoolExecutor :
+    """
+    Creates a process pool whose workers are spawned instead of forked.
+
+    Pools are created from the threads of the API process: a forked worker would inherit the locks
+    held by the other threads at that time, and deadlock the first time it takes one of them.
+    Spawned workers start from a fresh interpreter, with the current environment and working directory.
+
+    :param max_workers: the number of worker processes
+    :return: the pool
+    """
+    return ProcessPoolExecutor(max_workers = max_workers, mp_context = multiprocessing.get_context("spawn"))
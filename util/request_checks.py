@@ -4,11 +4,13 @@ import os
 from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional, Union
 
 load_dotenv()
 
 AVAILABLE_REGIONS = ["FRA", "59", "62"]
+RESPONSE_FORMATS = ["rows", "columnar", "ndjson", "csv"]
+AGE_CLASSES = ["0", "9", "19", "29", "39", "49", "59", "69", "79", "89", "90"]
 
 
 def check_dates_order(start_date : date, end_date : date) -> bool :
@@ -66,24 +68,68 @@ def check_region(region : str) -> bool :
     return region in AVAILABLE_REGIONS
 
 
+def check_regions(regions : List[str]) -> List[InvalidParameter] :
+    """
+    Checks that every region is part of the available regions list.
+
+    :param regions: the regions
+    :return: the list of invalid regions, empty if OK
+    """
+    return [InvalidParameter("region", f"Selected region {region} is not available")
+            for region in regions if not check_region(region)]
+
+
+def check_format(response_format : str) -> bool :
+    """
+    Checks that the response format is supported.
+
+    :param response_format: the response format
+    :return: if the format is OK or not
+    """
+    return response_format in RESPONSE_FORMATS
+
+
+def check_level(level : float) -> bool :
+    """
+    Checks that the level of a prediction interval is a probability.
+
+    :param level: the level
+    :return: if the level is OK or not
+    """
+    return 0 < level < 1
+
+
+def check_age_class(age_class : Optional[str]) -> bool :
+    """
+    Checks that the age class is a cl_age90 value, or all for every class.
+
+    :param age_class: the age class, optional
+    :return: if the age class is OK or not
+    """
+    return age_class is None or age_class == "all" or age_class in AGE_CLASSES
+
+
 def check_all(start_date : date,
               end_date : date,
-              region : str,
-              prediction : bool = False) -> List[InvalidParameter] :
+              region : Union[str, List[str]],
+              prediction : bool = False,
+              response_format : str = "rows",
+              level : float = 0.95,
+              age_class : Optional[str] = None) -> List[InvalidParameter] :
     """
     Checks all the parameters.
 
     :param start_date: the start date
     :param end_date: the end date
-    :param region: the region
+    :param region: the region, or a list of regions
     :param prediction: whether the call is for a prediction or not
+    :param response_format: the response format
+    :param level: the level of the prediction intervals
+    :param age_class: the age class, optional
     :return: the list of all invalid parameters, empty if OK
     """
 
-    invalids : List[InvalidParameter] = []
-
-    if not check_region(region) :
-        invalids.append(InvalidParameter("region", f"Selected region {region} is not available"))
+    invalids : List[InvalidParameter] = check_regions([region] if isinstance(region, str) else region)
 
     if not check_start_date(start_date) :
         invalids.append(InvalidParameter("start_date", f"Start date is before 01/06/2020"))
@@ -101,6 +147,15 @@ def check_all(start_date : date,
                                          f"Start date cannot be before "
                                          f"{date.today() - timedelta(days = max_days_behind)}"))
 
+    if not check_format(response_format) :
+        invalids.append(InvalidParameter("format", f"Format {response_format} is not one of {RESPONSE_FORMATS}"))
+
+    if not check_level(level) :
+        invalids.append(InvalidParameter("level", f"Level {level} is not between 0 and 1"))
+
+    if not check_age_class(age_class) :
+        invalids.append(InvalidParameter("age_class", f"Age class {age_class} is not one of {AGE_CLASSES} or all"))
+
     return invalids
 
 
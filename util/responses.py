@@ -0,0 +1,174 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from fastapi.responses import JSONResponse
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try :
+    import orjson
+except ImportError :
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse) :
+    """
+    A JSON response serialised with orjson when it is installed, compact standard JSON otherwise.
+    Returning it from an endpoint also skips FastAPI's recursive encoding of the content.
+    """
+
+    def render(self, content : Any) -> bytes :
+        if orjson is not None :
+            return orjson.dumps(content)
+
+        return json.dumps(content, ensure_ascii = False, separators = (",", ":")).encode("utf-8")
+
+
+STREAMING_MEDIA_TYPES = {
+    "ndjson" : "application/x-ndjson",
+    "csv" : "text/csv"
+}
+
+CHUNK_SIZE = 512
+
+
+def resolve_format(response_format : Optional[str], accept : Optional[str]) -> str :
+    """
+    Resolves the response format from the format parameter, or from the Accept header if the parameter is omitted.
+
+    :param response_format: the format parameter, optional
+    :param accept: the Accept header, optional
+    :return: the response format, rows by default
+    """
+
+    if response_format is not None :
+        return response_format
+
+    for streaming_format, media_type in STREAMING_MEDIA_TYPES.items() :
+        if accept is not None and media_type in accept :
+            return streaming_format
+
+    return "rows"
+
+
+def stream_rows(parts : Iterable[Tuple[pd.Series, Optional[bool]]], response_format : str) -> Iterator[str] :
+    """
+    Streams series as NDJSON or CSV, a chunk of rows at a time.
+    Parts are only consumed when the previous ones have been streamed, so predictions can be computed lazily.
+
+    :param parts: the series to stream with the value of their predicted flag, the flag is omitted if None
+    :param response_format: ndjson or csv
+    :return: the chunks of the body
+    """
+
+    header_sent = False
+
+    for series, predicted in parts :
+        if response_format == "csv" and not header_sent :
+            yield "date,cases\n" if predicted is None else "date,cases,predicted\n"
+            header_sent = True
+
+        for start in range(0, len(series), CHUNK_SIZE) :
+            chunk = series.iloc[start:start + CHUNK_SIZE]
+            dates = format_dates(chunk)
+            # Missing values are written as null in NDJSON and as an empty field in CSV
+            missing = "" if response_format == "csv" else "null"
+            cases = [missing if value is None else value for value in format_cases(chunk)]
+
+            if response_format == "csv" :
+                flag = "" if predicted is None else ("," + str(predicted).lower())
+                yield "".join(f"{day},{value}{flag}\n" for day, value in zip(dates, cases))
+            elif predicted is None :
+                yield "".join(f'{{"date":"{day}","cases":{value}}}\n' for day, value in zip(dates, cases))
+            else :
+                flag = str(predicted).lower()
+                yield "".join(f'{{"date":"{day}","cases":{value},"predicted":{flag}}}\n'
+                              for day, value in zip(dates, cases))
+
+
+def format_dates(series : pd.Series) -> List[str] :
+    """
+    Formats the dates of a date-indexed series in a single vectorised pass.
+
+    :param series: the series
+    :return: the dates as YYYY-MM-DD strings
+    """
+    return series.index.strftime("%Y-%m-%d").tolist()
+
+
+def format_cases(series : pd.Series) -> List[Optional[int]] :
+    """
+    Converts the values of a series to integers in a single vectorised pass, truncating them like int().
+
+    :param series: the series
+    :return: the values as Python integers, None for the missing values
+    """
+
+    values = series.to_numpy(dtype = "float64")
+    missing = np.isnan(values)
+    # Missing values would be cast to the smallest int64, they are masked before the cast
+    cases = np.where(missing, 0, values).astype("int64").tolist()
+    for position in np.flatnonzero(missing).tolist() :
+        cases[position] = None
+
+    return cases
+
+
+def format_intervals(intervals : pd.DataFrame) -> Dict[str, List[Optional[int]]] :
+    """
+    Converts the bounds of prediction intervals to integers, like the values they surround.
+
+    :param intervals: the lower and upper bounds
+    :return: the bounds as lists of Python integers
+    """
+    return {"lower" : format_cases(intervals["lower"]), "upper" : format_cases(intervals["upper"])}
+
+
+def to_rows(series : pd.Series,
+            predicted : Optional[bool] = None,
+            intervals : Optional[pd.DataFrame] = None) -> List[Dict[str, Any]] :
+    """
+    Builds the row format, one object per day.
+
+    :param series: the series
+    :param predicted: the value of the predicted flag, optional, the flag is omitted if None
+    :param intervals: the bounds of the prediction intervals of the series, optional
+    :return: the rows
+    """
+
+    dates = format_dates(series)
+    cases = format_cases(series)
+
+    if intervals is not None :
+        bounds = format_intervals(intervals)
+        return [{"date" : day, "cases" : value, "lower" : lower, "upper" : upper}
+                for day, value, lower, upper in zip(dates, cases, bounds["lower"], bounds["upper"])]
+
+    if predicted is None :
+        return [{"date" : day, "cases" : value} for day, value in zip(dates, cases)]
+
+    return [{"date" : day, "cases" : value, "predicted" : predicted} for day, value in zip(dates, cases)]
+
+
+def to_columns(true_data : pd.Series,
+               predictions : Optional[pd.Series] = None,
+               intervals : Optional[pd.DataFrame] = None) -> Dict[str, List[Any]] :
+    """
+    Builds the columnar format, one array per field.
+
+    :param true_data: the true values
+    :param predictions: the predicted values following the true values, optional
+    :param intervals: the bounds of the prediction intervals of the values, optional, without predictions only
+    :return: the columns, the predicted column is only included when predictions are given
+    """
+
+    if predictions is None :
+        columns = {"dates" : format_dates(true_data), "cases" : format_cases(true_data)}
+        if intervals is not None :
+            columns.update(format_intervals(intervals))
+        return columns
+
+    return {"dates" : format_dates(true_data) + format_dates(predictions),
+            "cases" : format_cases(true_data) + format_cases(predictions),
+            "predicted" : [False] * len(true_data) + [True] * len(predictions)}
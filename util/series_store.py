@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+
+import pandas as pd
+
+from datetime import date
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from .metrics import timed
+
+
+COLUMNS = ("P", "T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    region TEXT NOT NULL,
+    day TEXT NOT NULL,
+    P INTEGER,
+    T INTEGER,
+    PRIMARY KEY (region, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (
+    url TEXT PRIMARY KEY,
+    version TEXT NOT NULL
+);
+"""
+
+
+class SeriesStore :
+    """
+    A local SQLite store of the daily cases of every region.
+
+    Rows are clustered on their region and day, so a date range of a region is read through the
+    primary key, at a cost depending on the size of the range and not on the size of the upstream
+    dataset. Ingestion only appends the days following the last stored day of each region, and
+    records the version of the upstream payload it came from.
+    """
+
+    path : Path
+
+    def __init__(self, path : Union[str, Path]) :
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def version(self, url : str) -> Optional[str] :
+        """
+        Returns the version of the last payload ingested from a url.
+
+        :param url: the url of the upstream dataset
+        :return: the version, None if nothing was ingested from the url
+        """
+
+        row = self._connection().execute("SELECT version FROM sources WHERE url = ?", (url,)).fetchone()
+        return None if row is None else row[0]
+
+    def last_date(self, region : str) -> Optional[date] :
+        """
+        Returns the last stored day of a region.
+
+        :param region: the region
+        :return: the last day, None if the region is not stored
+        """
+
+        row = self._connection().execute("SELECT MAX(day) FROM cases WHERE region = ?", (region,)).fetchone()
+        return None if row[0] is None else date.fromisoformat(row[0])
+
+    def append(self,
+               regions : Dict[str, pd.DataFrame],
+               url : Optional[str] = None,
+               version : Optional[str] = None) -> int :
+        """
+        Appends the days following the last stored day of each region, in a single transaction.
+
+        :param regions: the daily-frequency frames of each region, with P and T columns
+        :param url: the url the frames were read from, optional
+        :param version: the version of the payload, recorded for the url
+        :return: the number of appended rows
+        """
+
+        connection = self._connection()
+        appended = 0
+
+        with timed("store_append"), connection :
+            last_days = dict(connection.execute("SELECT region, MAX(day) FROM cases GROUP BY region").fetchall())
+
+            if len(regions) > 0 :
+                # All regions are filtered and inserted at once
+                data = pd.concat(regions, names = ["region", "day"]).reindex(columns = list(COLUMNS))
+                data = data.loc[data["P"].notna()]
+                region_names = data.index.get_level_values("region")
+                last_stored = pd.to_datetime(pd.Series(region_names, dtype = "object").map(last_days)).to_numpy()
+                # Days of regions without any stored day are compared to NaT, and kept
+                data = data.loc[~(data.index.get_level_values("day") <= last_stored)]
+
+                # Missing values are stored as NULL, whole floats are stored as integers by the column affinity
+                values = data.astype("object").where(data.notna(), None)
+                rows = zip(data.index.get_level_values("region").astype(str),
+                           data.index.get_level_values("day").strftime("%Y-%m-%d"),
+                           *(values[column].tolist() for column in COLUMNS))
+                connection.executemany("INSERT INTO cases (region, day, P, T) VALUES (?, ?, ?, ?)", rows)
+                appended = len(data)
+
+            if url is not None and version is not None :
+                connection.execute("INSERT OR REPLACE INTO sources (url, version) VALUES (?, ?)", (url, version))
+
+        return appended
+
+    def read(self, region : str, start : Optional[date] = None, end : Optional[date] = None) -> pd.DataFrame :
+        """
+        Reads the cases of a region between two dates, both included.
+
+        :param region: the region
+        :param start: the start date, optional, defaults to the first stored day
+        :param end: the end date, optional, defaults to the last stored day
+        :return: the daily-frequency cases, empty if nothing is stored in the range
+        """
+
+        start = "0000-01-01" if start is None else start.strftime("%Y-%m-%d")
+        end = "9999-12-31" if end is None else end.strftime("%Y-%m-%d")
+
+        with timed("store_read") :
+            rows = self._connection().execute(
+                "SELECT day, P, T FROM cases WHERE region = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (region, start, end)
+            ).fetchall()
+
+            if len(rows) == 0 :
+                return pd.DataFrame(columns = list(COLUMNS), index = pd.DatetimeIndex([], freq = "D"))
+
+            data = pd.DataFrame.from_records(rows, columns = ["day", *COLUMNS])
+            data = data.set_index(pd.DatetimeIndex(data["day"])).drop(columns = ["day"])
+
+            return data.asfreq("D")
+
+    def _connection(self) -> sqlite3.Connection :
+        # SQLite connections cannot be shared between threads, each thread opens its own
+        connection = getattr(self._local, "connection", None)
+        if connection is None :
+            self.path.parent.mkdir(parents = True, exist_ok = True)
+            connection = sqlite3.connect(self.path, timeout = 30)
+            # Readers of other processes are not blocked by an ingestion
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+
+        return connection
@@ -0,0 +1,51 @@
+import threading
+
+from typing import Callable, Dict, Iterable, List
+
+
+class WarmUp :
+    """
+    Preloads models in a background thread and reports when it is done.
+    """
+
+    loaded : List[str]
+    failed : Dict[str, str]
+
+    def __init__(self) :
+        self.loaded = []
+        self.failed = {}
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self, regions : Iterable[str], loader : Callable[[str], object]) -> None :
+        """
+        Starts loading the models of the given regions in the background.
+        A region that cannot be loaded is reported as failed and does not block readiness.
+
+        :param regions: the regions to load
+        :param loader: a function loading the model of a region
+        """
+
+        self._thread = threading.Thread(target = self._run,
+                                        args = (list(regions), loader),
+                                        name = "warmup",
+                                        daemon = True)
+        self._thread.start()
+
+    def wait(self, timeout : float = None) -> bool :
+        return self._done.wait(timeout)
+
+    @property
+    def is_ready(self) -> bool :
+        return self._done.is_set()
+
+    def _run(self, regions : List[str], loader : Callable[[str], object]) -> None :
+        try :
+            for region in regions :
+                try :
+                    loader(region)
+                    self.loaded.append(region)
+                except Exception as e :
+                    self.failed[region] = f"{type(e).__name__}: {e}"
+        finally :
+            self._done.set()